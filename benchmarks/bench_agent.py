@@ -0,0 +1,175 @@
+"""代理端到端基准测试
+
+在临时目录中生成一个合成代码仓库，使用按脚本回放工具调用的假模型
+（models.chat_model.type: fake）驱动真实的代理和工具执行多轮会话，
+不需要访问模型服务。统计：
+- 每个图步骤的耗时，按模型步骤、工具步骤和中间件步骤分别统计；
+- 界面耗时（--ui 时在无界面模式下把每条消息添加到 ChatView 并等待渲染）；
+- 每轮对话的总耗时以及Python内存分配峰值（tracemalloc）和进程最大RSS。
+
+用法：
+    python -m benchmarks.bench_agent --files 2000 --turns 10 --ui
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from langchain.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agents.code_agent import create_code_agent
+from src.config.config import load_config
+from src.tools.shell_session import get_session_pool
+
+
+def make_repo(root: str, files: int, lines: int):
+    """生成包含 files 个Python文件的合成仓库，每个目录10个文件"""
+    for i in range(files):
+        directory = os.path.join(root, f"pkg{i // 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"mod{i % 10}.py"), "w", encoding="utf-8") as f:
+            f.write(f"VALUE_{i} = {i}\n\n")
+            for j in range(lines // 3):
+                f.write(f"def func_{i}_{j}(x):\n    return x + VALUE_{i} * {j}\n\n")
+
+
+def make_script(turns: int) -> list:
+    """每轮对话依次调用各个工具，最后给出不含工具调用的回答"""
+    steps = []
+    for turn in range(turns):
+        target = "{cwd}/pkg0/mod1.py"
+        steps += [
+            {"content": "Exploring the project.", "tool_calls": [
+                {"name": "ls", "args": {"path": "{cwd}"}},
+                {"name": "tree", "args": {"root": "{cwd}", "max_depth": 2}},
+            ]},
+            {"content": "Searching.", "tool_calls": [
+                {"name": "grep", "args": {"pattern": f"def func_1_{turn}", "paths": ["{cwd}"], "recursive": True}},
+            ]},
+            {"content": "Reading the file.", "tool_calls": [
+                {"name": "text_editor", "args": {"command": "view", "path": target}},
+            ]},
+            {"content": "Checking size.", "tool_calls": [
+                {"name": "bash", "args": {"command": "wc -l pkg0/mod1.py", "cwd": "{cwd}"}},
+            ]},
+            {"content": "Editing.", "tool_calls": [
+                {"name": "text_editor", "args": {
+                    "command": "insert", "path": target, "insert_line": 0, "new_str": f"# turn {turn}",
+                }},
+            ]},
+            {"content": f"Turn {turn} done."},
+        ]
+    return steps
+
+
+def _category(node: str) -> str:
+    if node == "model":
+        return "model"
+    if node == "tools":
+        return "tools"
+    return "middleware"
+
+
+async def run_session(agent, turns: int, add_to_ui=None) -> dict:
+    timings = {"model": [], "tools": [], "middleware": [], "ui": [], "turn": []}
+    config = {"recursion_limit": 100, "configurable": {"thread_id": "bench"}}
+    for turn in range(turns):
+        turn_start = last = time.perf_counter()
+        ui_time = 0.0
+        async for chunk in agent.astream(
+                {"messages": [HumanMessage(content=f"turn {turn}")]}, stream_mode="updates", config=config
+        ):
+            now = time.perf_counter()
+            for node, update in chunk.items():
+                timings[_category(node)].append(now - last)
+                if add_to_ui and update and "messages" in update:
+                    ui_start = time.perf_counter()
+                    for message in update["messages"]:
+                        await add_to_ui(message)
+                    ui_time += time.perf_counter() - ui_start
+            # 界面耗时不计入下一个图步骤
+            last = time.perf_counter()
+        timings["ui"].append(ui_time)
+        timings["turn"].append(time.perf_counter() - turn_start)
+    await get_session_pool().close_all()
+    return timings
+
+
+async def run_with_ui(agent, turns: int) -> dict:
+    from textual.app import App, ComposeResult
+
+    from src.cli.console_app import ChatView
+
+    class BenchApp(App):
+        def compose(self) -> ComposeResult:
+            yield ChatView(id="chat-view")
+
+    app = BenchApp()
+    async with app.run_test(size=(120, 40)) as pilot:
+        view = app.query_one(ChatView)
+
+        async def add_to_ui(message):
+            view.add_message(message)
+            await pilot.pause()
+
+        return await run_session(agent, turns, add_to_ui)
+
+
+def report(label: str, values: list):
+    if not values:
+        return
+    ordered = sorted(values)
+    print(
+        f"{label:<12} n={len(values):>5}  mean {statistics.mean(values) * 1000:>8.2f} ms  "
+        f"p95 {ordered[int(len(ordered) * 0.95)] * 1000:>8.2f} ms  total {sum(values):>7.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end agent benchmark with a scripted model")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=60)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="模拟的模型响应延迟（秒）")
+    parser.add_argument("--ui", action="store_true", help="同时测量 ChatView 的渲染耗时")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        make_repo(root, args.files, args.lines)
+        script_path = os.path.join(root, "script.json")
+        with open(script_path, "w", encoding="utf-8") as f:
+            json.dump(make_script(args.turns), f)
+
+        # 使用回放脚本的假模型替换配置中的模型
+        config = load_config()
+        config["models"]["chat_model"] = {"type": "fake", "script": script_path, "latency": args.model_latency}
+        # 假模型按已有的AI消息数确定回放位置，上下文预算只计数、不裁剪历史
+        config.setdefault("agent", {})["context_budget"] = {"max_tokens": 10 ** 9}
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            tracemalloc.start()
+            agent = create_code_agent(checkpointer=InMemorySaver())
+            start = time.perf_counter()
+            timings = asyncio.run(run_with_ui(agent, args.turns) if args.ui else run_session(agent, args.turns))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+
+    print(f"files: {args.files}, turns: {args.turns}, model latency: {args.model_latency * 1000:.0f} ms")
+    for label in ("model", "tools", "middleware", "ui", "turn"):
+        report(label, timings[label])
+    print(f"total {elapsed:.2f} s, traced peak {peak / 1024 / 1024:.1f} MiB, "
+          f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""bash 持久化会话基准测试
+
+对比每次调用启动新的 bash -c 进程（复制整个环境变量）与复用一个
+持久化 shell 会话执行同一条短命令的单次延迟。
+
+用法：
+    python -m benchmarks.bench_bash_session --commands 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from src.tools.shell_session import ShellSession
+
+
+async def spawn_per_call(command: str) -> str:
+    """与bash_tool原有方式相同：每次调用启动新进程"""
+    process = await asyncio.create_subprocess_exec(
+        "bash", "-c", command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=os.environ.copy(),
+    )
+    stdout, _ = await process.communicate()
+    return stdout.decode()
+
+
+async def run(commands: int, command: str):
+    spawn_latencies = []
+    for _ in range(commands):
+        start = time.perf_counter()
+        await spawn_per_call(command)
+        spawn_latencies.append(time.perf_counter() - start)
+
+    session = ShellSession()
+    output = []
+    start = time.perf_counter()
+    await session.start()
+    startup = time.perf_counter() - start
+    session_latencies = []
+    for _ in range(commands):
+        start = time.perf_counter()
+        await session.run(command, lambda _, text: output.append(text))
+        session_latencies.append(time.perf_counter() - start)
+    await session.close()
+
+    print(f"command: {command!r}, runs: {commands}, session startup {startup * 1000:.2f} ms")
+    for label, latencies in (("spawn per call", spawn_latencies), ("persistent session", session_latencies)):
+        latencies.sort()
+        print(
+            f"{label:<20} mean {statistics.mean(latencies) * 1000:>7.2f} ms  "
+            f"p50 {latencies[len(latencies) // 2] * 1000:>7.2f} ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:>7.2f} ms"
+        )
+    print(f"speedup {statistics.mean(spawn_latencies) / statistics.mean(session_latencies):.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bash persistent session benchmark")
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--command", default="echo hello")
+    args = parser.parse_args()
+    asyncio.run(run(args.commands, args.command))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""聊天视图渲染基准测试
+
+在无界面模式（App.run_test）下向 ChatView 依次添加大量消息，每添加一条
+消息后等待界面处理完毕，统计单帧耗时；并与旧的“每次重建完整文本”的
+实现对比（旧实现为 O(历史长度)，默认只测较少的消息数）。
+同时按每 --block 条消息分段输出平均耗时，分段耗时应保持平稳，不随历史长度增长。
+
+用法：
+    python -m benchmarks.bench_chat_view --messages 10000 --legacy-messages 2000 --block 1000
+"""
+import argparse
+import statistics
+import time
+
+from langchain.messages import AIMessage, HumanMessage, ToolMessage
+from textual.app import App, ComposeResult
+from textual.containers import VerticalScroll
+from textual.widgets import Static
+
+from src.cli.console_app import ChatView
+
+
+class LegacyChatView(VerticalScroll):
+    """旧实现：所有消息拼接为一个字符串，每次添加消息都整体更新"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def compose(self) -> ComposeResult:
+        yield Static(id="chat-content", markup=False)
+
+    def add_message(self, message):
+        self.messages.append(message)
+        full_content = "".join(f"\n\n{ChatView.format_message(m)}" for m in self.messages)
+        self.query_one("#chat-content", Static).update(full_content.strip())
+        self.scroll_end(animate=False)
+
+
+def make_message(i: int):
+    text = f"message {i}: " + "lorem ipsum dolor sit amet " * (1 + i % 5)
+    if i % 3 == 0:
+        return HumanMessage(content=text)
+    if i % 3 == 1:
+        return AIMessage(content=text)
+    return ToolMessage(content=text, tool_call_id=str(i))
+
+
+class BenchApp(App):
+    def __init__(self, legacy: bool):
+        super().__init__()
+        self.legacy = legacy
+
+    def compose(self) -> ComposeResult:
+        yield LegacyChatView() if self.legacy else ChatView(id="chat-view")
+
+
+async def measure(legacy: bool, count: int) -> list:
+    app = BenchApp(legacy)
+    frame_times = []
+    async with app.run_test(size=(120, 40)) as pilot:
+        view = app.query_one(LegacyChatView if legacy else ChatView)
+        for i in range(count):
+            start = time.perf_counter()
+            view.add_message(make_message(i))
+            await pilot.pause()
+            frame_times.append(time.perf_counter() - start)
+    return frame_times
+
+
+def report(label: str, frame_times: list, block: int):
+    ordered = sorted(frame_times)
+    tail = frame_times[-min(100, len(frame_times)):]
+    print(
+        f"{label:<10} n={len(frame_times):>6}  mean {statistics.mean(frame_times) * 1000:>7.2f} ms  "
+        f"p95 {ordered[int(len(ordered) * 0.95)] * 1000:>7.2f} ms  "
+        f"last-100 mean {statistics.mean(tail) * 1000:>7.2f} ms  total {sum(frame_times):>7.2f} s"
+    )
+    blocks = [frame_times[i:i + block] for i in range(0, len(frame_times), block)]
+    print(f"{'':<10} per-{block} mean: " + " ".join(f"{statistics.mean(b) * 1000:.1f}" for b in blocks) + " ms")
+
+
+def main():
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="chat view frame time benchmark")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--legacy-messages", type=int, default=2000, help="0 表示跳过旧实现")
+    parser.add_argument("--block", type=int, default=1000, help="分段统计的消息数")
+    args = parser.parse_args()
+
+    report("ChatView", asyncio.run(measure(False, args.messages)), args.block)
+    if args.legacy_messages:
+        report("legacy", asyncio.run(measure(True, args.legacy_messages)), args.block)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""检查点写入延迟基准测试
+
+用一个只追加一条AI消息的最小图模拟代理的每一步，分别在不使用检查点、
+内存检查点和SQLite检查点下连续执行多步，统计每步耗时。对话历史越长，
+每步需要序列化的状态越大，可以观察写入延迟随历史长度的变化。
+
+用法：
+    python -m benchmarks.bench_checkpoint --steps 200 --message-chars 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from langchain.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, MessagesState, StateGraph
+
+from src.agents.checkpoint import compact_thread
+
+
+def build_graph(message_chars: int, checkpointer=None):
+    def respond(state: MessagesState):
+        return {"messages": [AIMessage(content="x" * message_chars)]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("respond", respond)
+    builder.add_edge(START, "respond")
+    return builder.compile(checkpointer=checkpointer)
+
+
+async def run_steps(graph, steps: int, thread_id: str, saver=None, keep_last: int = 0) -> list:
+    config = {"configurable": {"thread_id": thread_id}}
+    latencies = []
+    for i in range(steps):
+        start = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(content=f"step {i}")]}, config)
+        if saver is not None and keep_last:
+            await compact_thread(saver, thread_id, keep_last)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label: str, latencies: list, baseline: float = None):
+    ordered = sorted(latencies)
+    mean = statistics.mean(latencies)
+    overhead = f"  overhead {(mean - baseline) * 1000:>6.2f} ms" if baseline is not None else ""
+    print(
+        f"{label:<22} mean {mean * 1000:>7.2f} ms  p95 {ordered[int(len(ordered) * 0.95)] * 1000:>7.2f} ms  "
+        f"last-10 mean {statistics.mean(latencies[-10:]) * 1000:>7.2f} ms{overhead}"
+    )
+
+
+async def main_async(args):
+    baseline = await run_steps(build_graph(args.message_chars), args.steps, "bench")
+    report("no checkpointer", baseline)
+    base_mean = statistics.mean(baseline)
+
+    memory = InMemorySaver()
+    report("memory", await run_steps(build_graph(args.message_chars, memory), args.steps, "bench"), base_mean)
+
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        print("sqlite                 skipped (langgraph-checkpoint-sqlite / aiosqlite not installed)")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for keep_last, label in ((0, "sqlite"), (args.keep_last, f"sqlite keep_last={args.keep_last}")):
+            async with aiosqlite.connect(os.path.join(tmp, f"bench_{keep_last}.db")) as conn:
+                await conn.execute("PRAGMA journal_mode=WAL")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                saver = AsyncSqliteSaver(conn)
+                await saver.setup()
+                latencies = await run_steps(
+                    build_graph(args.message_chars, saver), args.steps, "bench", saver, keep_last
+                )
+                report(label, latencies, base_mean)
+            size = os.path.getsize(os.path.join(tmp, f"bench_{keep_last}.db"))
+            print(f"{'':<22} database size {size / 1024 / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="checkpoint write latency benchmark")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--message-chars", type=int, default=2000)
+    parser.add_argument("--keep-last", type=int, default=20)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
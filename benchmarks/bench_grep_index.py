@@ -0,0 +1,60 @@
+"""trigram 索引基准测试
+
+在合成代码树上对比：全量扫描搜索、首次建立索引、以及索引建立后
+第二次搜索（增量检查 + 候选文件过滤 + 验证匹配）的耗时。
+
+用法：
+    python -m benchmarks.bench_grep_index --dirs 200 --files 50
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_grep import build_tree
+from src.tools.ignore import DEFAULT_IGNORE_PATTERNS
+from src.tools.search import compile_pattern, iter_matches
+from src.tools.trigram_index import TrigramIndex, required_literals
+from src.tools.walk import walk_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="trigram index benchmark")
+    parser.add_argument("--dirs", type=int, default=200)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=200)
+    args = parser.parse_args()
+
+    pattern = "NEEDLE_42"
+    matcher = compile_pattern(pattern)
+
+    with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as db_dir:
+        root = Path(tmp)
+        n_files = build_tree(root, args.dirs, args.files, args.lines, vendored=0)
+        print(f"synthetic tree: {n_files} files, {args.lines} lines each")
+
+        start = time.perf_counter()
+        matches = sum(1 for _ in iter_matches(walk_files(tmp, DEFAULT_IGNORE_PATTERNS), matcher))
+        print(f"full scan            {(time.perf_counter() - start) * 1000:>9.1f} ms  matches={matches}")
+
+        index = TrigramIndex(tmp, db_path=str(Path(db_dir) / "index.db"))
+        start = time.perf_counter()
+        index.update()
+        print(f"initial index build  {(time.perf_counter() - start) * 1000:>9.1f} ms")
+
+        for max_staleness, label in ((0.0, "indexed search"), (60.0, "indexed (no recheck)")):
+            start = time.perf_counter()
+            index.update(max_staleness=max_staleness)
+            refreshed = time.perf_counter()
+            candidates = index.candidates(required_literals(pattern, regex=False))
+            matches = sum(1 for _ in iter_matches(sorted(candidates), matcher))
+            end = time.perf_counter()
+            print(
+                f"{label:<20} {(end - start) * 1000:>9.1f} ms  "
+                f"(recheck {(refreshed - start) * 1000:.1f} ms, candidates={len(candidates)})  matches={matches}"
+            )
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""grep 大文件内存基准测试
+
+生成不同大小的日志文件，在独立子进程中扫描每个文件，输出扫描耗时
+和子进程的峰值常驻内存（仅支持Unix），用于确认峰值内存不随文件大小增长。
+
+用法：
+    python -m benchmarks.bench_grep_memory --sizes 16 64 256
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+_CHILD = """
+import resource, sys, time
+from src.tools.search import compile_pattern, iter_matches
+start = time.perf_counter()
+found = sum(1 for _ in iter_matches([sys.argv[1]], compile_pattern("NEEDLE")))
+elapsed = time.perf_counter() - start
+print(found, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def write_log(path: str, size_mb: int):
+    line = b"2024-01-01 12:00:00 INFO request handled in 12ms path=/api/v1/items status=200\n"
+    with open(path, "wb") as f:
+        for _ in range(size_mb * 1024 * 1024 // len(line)):
+            f.write(line)
+        f.write(b"2024-01-01 12:00:01 ERROR NEEDLE failure\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="grep peak memory benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256], help="文件大小（MB）")
+    args = parser.parse_args()
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes:
+            path = os.path.join(tmp, f"app_{size_mb}.log")
+            write_log(path, size_mb)
+            out = subprocess.run(
+                [sys.executable, "-c", _CHILD, path],
+                cwd=project_root, capture_output=True, text=True, check=True,
+            ).stdout.split()
+            found, elapsed, maxrss_kb = int(out[0]), float(out[1]), int(out[2])
+            print(f"{size_mb:>6} MB file  {elapsed * 1000:>9.1f} ms  peak RSS {maxrss_kb / 1024:>7.1f} MB  matches={found}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
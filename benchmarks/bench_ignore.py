@@ -0,0 +1,64 @@
+"""忽略规则匹配基准测试
+
+对比逐条 fnmatch.fnmatch 循环与编译后的 IgnoreMatcher 在大量文件名上的
+匹配吞吐量，并校验两者的匹配结果一致。
+
+用法：
+    python -m benchmarks.bench_ignore --names 200000
+"""
+import argparse
+import fnmatch
+import random
+import time
+
+from src.tools.ignore import DEFAULT_IGNORE_PATTERNS, get_matcher
+
+NAME_SAMPLES = [
+    "main.py", "utils.py", "README.md", "index.ts", "app.log", "app.log.1", "module.pyc",
+    "Cargo.lock", ".DS_Store", "notes.tmp", "backup.bak", "node_modules", "build", "src",
+    "docs", "package.json", "style.css", "Main.class", "foo.egg-info", "view.swp", "file~",
+]
+
+
+def fnmatch_loop(name: str, is_dir: bool) -> bool:
+    """逐条匹配（与编译匹配器相同的目录模式语义）。"""
+    for pattern in DEFAULT_IGNORE_PATTERNS:
+        if pattern.endswith("/**"):
+            if is_dir and fnmatch.fnmatch(name, pattern[:-3]):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ignore matcher benchmark")
+    parser.add_argument("--names", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = []
+    for i in range(args.names):
+        base = rng.choice(NAME_SAMPLES)
+        # 一半名称加上随机前缀，避免全部命中精确匹配
+        name = f"x{i}_{base}" if rng.random() < 0.5 else base
+        names.append((name, "." not in base))
+
+    start = time.perf_counter()
+    expected = [fnmatch_loop(name, is_dir) for name, is_dir in names]
+    loop_seconds = time.perf_counter() - start
+
+    matcher = get_matcher(DEFAULT_IGNORE_PATTERNS)
+    start = time.perf_counter()
+    actual = [matcher.match(name, is_dir) for name, is_dir in names]
+    compiled_seconds = time.perf_counter() - start
+
+    assert expected == actual, "compiled matcher disagrees with fnmatch loop"
+    print(f"patterns: {len(DEFAULT_IGNORE_PATTERNS)}, names: {len(names)}, ignored: {sum(actual)}")
+    print(f"fnmatch loop      {loop_seconds * 1000:>9.1f} ms  {len(names) / loop_seconds:>12.0f} names/s")
+    print(f"IgnoreMatcher     {compiled_seconds * 1000:>9.1f} ms  {len(names) / compiled_seconds:>12.0f} names/s")
+    print(f"speedup           {loop_seconds / compiled_seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
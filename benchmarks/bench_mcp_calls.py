@@ -0,0 +1,79 @@
+"""MCP工具调用延迟基准测试
+
+使用本地stdio替身服务器（benchmarks/mcp_standin_server.py），对比：
+- 每次调用新建会话（langchain-mcp-adapters 不传session时的行为，每次都要启动进程并握手）；
+- 通过 MCPSessionPool 复用长期会话；
+并用一个在第N次调用时崩溃的替身服务器验证会话池的断线重连。
+
+用法：
+    python -m benchmarks.bench_mcp_calls --calls 50 --crash-after 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+
+from benchmarks.bench_mcp_load import standin
+from src.mcp.load_mcp import MCPToolLoader
+
+
+def report(label: str, latencies: list):
+    ordered = sorted(latencies)
+    print(
+        f"{label:<22} mean {statistics.mean(latencies) * 1000:>8.2f} ms  "
+        f"p50 {ordered[len(ordered) // 2] * 1000:>8.2f} ms  p95 {ordered[int(len(ordered) * 0.95)] * 1000:>8.2f} ms"
+    )
+
+
+async def timed_calls(tool, calls: int) -> list:
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await tool.ainvoke({"text": f"call {i}"})
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(calls: int, crash_after: int):
+    servers = {"echo": standin("echo", "--tools", "1")}
+
+    # 每次调用新建会话：工具不绑定会话，而是绑定连接配置
+    loader = MCPToolLoader(servers, retries=0)
+    await loader.load_all()
+    session = await loader.pool.session("echo")
+    listed = (await session.list_tools()).tools
+    fresh_tool = convert_mcp_tool_to_langchain_tool(None, listed[0], connection=loader.connections["echo"])
+    report("session per call", await timed_calls(fresh_tool, calls))
+
+    # 复用会话池中的会话
+    pooled_tool = loader.all_tools()[0]
+    report("pooled session", await timed_calls(pooled_tool, calls))
+    print(f"pool metrics: {loader.pool.summary()}")
+    await loader.stop()
+
+    # 服务器崩溃后重新连接
+    crashing = MCPToolLoader({"crashing": standin("crashing", "--tools", "1", "--exit-after", str(crash_after))}, retries=0)
+    await crashing.load_all()
+    tool = crashing.all_tools()[0]
+    failures = 0
+    for i in range(crash_after * 2):
+        try:
+            await tool.ainvoke({"text": f"call {i}"})
+        except Exception:
+            failures += 1
+    print(f"crash after {crash_after} calls: {failures} failed calls, metrics {crashing.pool.summary()}")
+    await crashing.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP tool call latency benchmark")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--crash-after", type=int, default=10, help="崩溃测试中替身服务器在第几次调用时退出")
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.crash_after))
+
+
+if __name__ == "__main__":
+    main()
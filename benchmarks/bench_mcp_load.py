@@ -0,0 +1,76 @@
+"""MCP工具加载基准测试
+
+使用本地stdio替身服务器（benchmarks/mcp_standin_server.py）模拟一个正常、
+一个启动缓慢和一个不可用的MCP服务器，对比：
+- 旧方式：MultiServerMCPClient(全部服务器).get_tools() 一次性加载；
+- MCPToolLoader.load_all()：各服务器并发连接、单独超时、部分成功；
+- MCPToolLoader.start()：有磁盘缓存时立即返回的工具数和耗时。
+
+用法：
+    python -m benchmarks.bench_mcp_load --slow-delay 5 --timeout 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from src.mcp import load_mcp as mcp_loader
+from src.mcp.load_mcp import MCPToolLoader
+
+
+def standin(name: str, *extra: str) -> dict:
+    return {
+        "transport": "stdio",
+        "command": sys.executable,
+        "args": ["-m", "benchmarks.mcp_standin_server", "--name", name, *extra],
+        "cwd": os.getcwd(),
+    }
+
+
+async def run(slow_delay: float, timeout: float, tools: int):
+    servers = {
+        "fast": {**standin("fast", "--tools", str(tools)), "connect_timeout": timeout},
+        "slow": {**standin("slow", "--tools", str(tools), "--startup-delay", str(slow_delay)), "connect_timeout": timeout},
+        "broken": {**standin("broken", "--fail"), "connect_timeout": timeout},
+    }
+
+    start = time.perf_counter()
+    try:
+        loaded = await MultiServerMCPClient(mcp_loader._connections(servers)).get_tools()
+        outcome = f"{len(loaded)} tools"
+    except Exception as e:
+        outcome = f"failed ({type(e).__name__})"
+    print(f"{'get_tools (all at once)':<28} {(time.perf_counter() - start) * 1000:>8.0f} ms  {outcome}")
+
+    loader = MCPToolLoader(servers, retries=0)
+    start = time.perf_counter()
+    loaded = await loader.load_all()
+    print(f"{'MCPToolLoader.load_all':<28} {(time.perf_counter() - start) * 1000:>8.0f} ms  {len(loaded)} tools")
+    for name, status in loader.status.items():
+        print(f"  {name:<8} {status}")
+
+    loader = MCPToolLoader(servers, retries=0)
+    start = time.perf_counter()
+    cached = loader.start()
+    print(f"{'MCPToolLoader.start (cached)':<28} {(time.perf_counter() - start) * 1000:>8.0f} ms  {len(cached)} tools")
+    await loader.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP tool loading benchmark")
+    parser.add_argument("--slow-delay", type=float, default=5.0, help="慢服务器的启动延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=2.0, help="每个服务器的连接超时（秒）")
+    parser.add_argument("--tools", type=int, default=20, help="每个服务器的工具数")
+    args = parser.parse_args()
+
+    # 工具定义缓存写入临时目录，不影响项目中的缓存
+    mcp_loader.MCP_CACHE_PATH = os.path.join(tempfile.mkdtemp(), "mcp_tools.json")
+    asyncio.run(run(args.slow_delay, args.timeout, args.tools))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""界面启动时间基准测试
+
+1. 在新进程中用 python -X importtime 导入界面模块，统计导入总耗时，
+   并按顶层包汇总各模块自身的导入耗时；
+2. 在新进程中以无界面模式（App.run_test）启动 CodeAgentConsole，
+   测量从进程开始执行到界面完成首次绘制的时间（time-to-first-frame），
+   以及后台加载代理模块直到代理可用的时间，并与目标首帧时间比较。
+
+用法：
+    python -m benchmarks.bench_startup --runs 5 --target-ms 500
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# 子进程中运行：测量首帧时间和代理就绪时间，以JSON输出
+_FIRST_FRAME_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+from src.cli.console_app import CodeAgentConsole
+imported = time.perf_counter()
+marks = {{}}
+
+class ProbeConsole(CodeAgentConsole):
+    def on_mount(self):
+        super().on_mount()
+        # 首次刷新完成后记录首帧时间
+        self.call_after_refresh(lambda: marks.setdefault("first_frame", time.perf_counter()))
+
+async def main():
+    app = ProbeConsole()
+    try:
+        async with app.run_test(size=(120, 40)) as pilot:
+            await pilot.pause()
+            await asyncio.wait_for(app._agent_ready.wait(), timeout={ready_timeout})
+            marks["ready"] = time.perf_counter()
+    except Exception:
+        # 代理初始化失败（如缺少依赖或模型配置）不影响首帧时间的测量
+        pass
+    print(json.dumps({{
+        "import_ms": (imported - start) * 1000,
+        "first_frame_ms": (marks["first_frame"] - start) * 1000,
+        "agent_ready_ms": (marks["ready"] - start) * 1000 if "ready" in marks else None,
+    }}))
+
+asyncio.run(main())
+"""
+
+
+def import_profile(module: str, top: int):
+    """返回 -X importtime 统计的模块导入耗时（毫秒），以及按顶层包汇总自身耗时最长的包"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    total = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        name = name.strip()
+        if name == module:
+            total = int(cumulative)
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return total / 1000, ranked[:top]
+
+
+def first_frame(ready_timeout: float) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _FIRST_FRAME_SCRIPT.format(ready_timeout=ready_timeout)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="console startup benchmark")
+    parser.add_argument("--module", default="src.cli.console_app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--target-ms", type=float, default=500, help="目标首帧时间（毫秒）")
+    parser.add_argument("--ready-timeout", type=float, default=30, help="等待代理就绪的最长时间（秒）")
+    args = parser.parse_args()
+
+    total_ms, ranked = import_profile(args.module, args.top)
+    print(f"import {args.module}: {total_ms:.1f} ms (-X importtime, cumulative); slowest packages (self time):")
+    for package, micros in ranked:
+        print(f"  {package:<28} {micros / 1000:>8.1f} ms")
+
+    runs = [first_frame(args.ready_timeout) for _ in range(args.runs)]
+    for key in ("import_ms", "first_frame_ms", "agent_ready_ms"):
+        values = [run[key] for run in runs if run[key] is not None]
+        if values:
+            print(f"{key:<16} median {statistics.median(values):>8.1f} ms  min {min(values):>8.1f} ms")
+        else:
+            print(f"{key:<16} not reached within {args.ready_timeout} s")
+    median_first_frame = statistics.median(run["first_frame_ms"] for run in runs)
+    status = "OK" if median_first_frame <= args.target_ms else "SLOW"
+    print(f"time to first frame {median_first_frame:.1f} ms, target {args.target_ms:.0f} ms: {status}")
+
+
+if __name__ == "__main__":
+    main()
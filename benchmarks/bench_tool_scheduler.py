@@ -0,0 +1,101 @@
+"""多工具调用步骤的并行执行基准测试
+
+使用按脚本回放工具调用的假模型，每个模型步骤在一条AI消息中返回多个工具调用
+（多个 text_editor view、grep 和 tree，以及夹在读取之间的写入），
+比较工具调度器在不同并发上限下每个工具步骤的耗时。max_concurrency 为1时等价于串行执行。
+
+用法：
+    python -m benchmarks.bench_tool_scheduler --files 2000 --calls 6 --steps 10 --limits 1 2 4 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from langchain.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from benchmarks.bench_agent import make_repo
+from src.agents.code_agent import create_code_agent
+from src.config.config import load_config
+from src.tools.shell_session import get_session_pool
+
+
+def make_script(steps: int, calls: int) -> list:
+    """每个步骤读取 calls 个文件并搜索、列出目录；每隔一步在读取之间插入一次写入"""
+    script = []
+    for step in range(steps):
+        tool_calls = [
+            {"name": "text_editor", "args": {"command": "view", "path": f"{{cwd}}/pkg{step}/mod{i % 10}.py"}}
+            for i in range(calls)
+        ]
+        tool_calls.append({"name": "grep", "args": {"pattern": f"VALUE_{step}", "paths": ["{cwd}"], "recursive": True}})
+        tool_calls.append({"name": "tree", "args": {"root": "{cwd}", "max_depth": 2}})
+        if step % 2:
+            tool_calls.insert(1, {"name": "text_editor", "args": {
+                "command": "insert", "path": f"{{cwd}}/pkg{step}/mod0.py", "insert_line": 0, "new_str": f"# step {step}",
+            }})
+        script.append({"content": f"Step {step}.", "tool_calls": tool_calls})
+    script.append({"content": "Done."})
+    return script
+
+
+async def run_session(agent) -> list:
+    tool_steps = []
+    config = {"recursion_limit": 200, "configurable": {"thread_id": "bench"}}
+    last = time.perf_counter()
+    async for chunk in agent.astream({"messages": [HumanMessage(content="go")]}, stream_mode="updates", config=config):
+        now = time.perf_counter()
+        if "tools" in chunk:
+            tool_steps.append(now - last)
+        last = now
+    await get_session_pool().close_all()
+    return tool_steps
+
+
+def run_once(script_path: str, limit: int) -> list:
+    config = load_config()
+    config["models"]["chat_model"] = {"type": "fake", "script": script_path}
+    config.setdefault("agent", {})["context_budget"] = {"max_tokens": 10 ** 9}
+    config["agent"]["tool_scheduler"] = {"enabled": True, "max_concurrency": limit}
+    agent = create_code_agent(checkpointer=InMemorySaver())
+    return asyncio.run(run_session(agent))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parallel tool call benchmark")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=300)
+    parser.add_argument("--calls", type=int, default=6, help="每个步骤中 text_editor view 调用的个数")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 2, 4, 8], help="要比较的并发上限")
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    for limit in args.limits:
+        # 每次使用新的仓库，保证写入和搜索的内容一致
+        with tempfile.TemporaryDirectory() as root:
+            make_repo(root, args.files, args.lines)
+            script_path = os.path.join(root, "script.json")
+            with open(script_path, "w", encoding="utf-8") as f:
+                json.dump(make_script(args.steps, args.calls), f)
+            os.chdir(root)
+            try:
+                results[limit] = run_once(script_path, limit)
+            finally:
+                os.chdir(cwd)
+
+    print(f"files: {args.files}, steps: {args.steps}, calls per step: {args.calls + 2} (+1 write every other step)")
+    baseline = statistics.mean(results[args.limits[0]])
+    for limit, tool_steps in results.items():
+        mean = statistics.mean(tool_steps)
+        print(f"max_concurrency {limit:>3}: tool step mean {mean * 1000:>8.2f} ms  "
+              f"max {max(tool_steps) * 1000:>8.2f} ms  speedup x{baseline / mean:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""本地stdio MCP替身服务器，供MCP相关的基准测试使用
+
+用法（由基准测试作为子进程启动）：
+    python -m benchmarks.mcp_standin_server --tools 5 --startup-delay 0.5
+    python -m benchmarks.mcp_standin_server --fail   # 启动后立即退出，模拟不可用的服务器
+    python -m benchmarks.mcp_standin_server --exit-after 10   # 第10次工具调用时崩溃
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+
+_call_counter = itertools.count(1)
+
+
+def _make_tool(index: int, delay: float, exit_after: int):
+    def echo(text: str) -> str:
+        # 模拟服务器崩溃：处理到第 exit_after 次调用时直接退出进程
+        if exit_after and next(_call_counter) >= exit_after:
+            os._exit(1)
+        if delay:
+            time.sleep(delay)
+        return f"[{index}] {text}"
+
+    return echo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stdio MCP stand-in server")
+    parser.add_argument("--tools", type=int, default=5, help="提供的工具数")
+    parser.add_argument("--startup-delay", type=float, default=0.0, help="启动前等待的时间（秒），模拟慢服务器")
+    parser.add_argument("--call-delay", type=float, default=0.0, help="每次工具调用的处理时间（秒）")
+    parser.add_argument("--fail", action="store_true", help="立即退出，模拟不可用的服务器")
+    parser.add_argument("--exit-after", type=int, default=0, help="在第N次工具调用时退出，模拟服务器崩溃")
+    parser.add_argument("--name", default="standin")
+    args = parser.parse_args()
+
+    if args.fail:
+        sys.exit(1)
+    if args.startup_delay:
+        time.sleep(args.startup_delay)
+
+    server = FastMCP(args.name)
+    for i in range(args.tools):
+        server.add_tool(
+            _make_tool(i, args.call_delay, args.exit_after),
+            name=f"{args.name}_echo_{i}",
+            description=f"Echo the given text back, prefixed with [{i}].",
+        )
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
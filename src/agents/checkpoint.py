@@ -0,0 +1,129 @@
+import logging
+import os
+from typing import List, Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.config.config import get_config_section
+
+# SQLite检查点需要 langgraph-checkpoint-sqlite 和 aiosqlite，不可用时回退到内存检查点
+_has_sqlite = False
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    _has_sqlite = True
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(".code_agent", "checkpoints.db")
+DEFAULT_THREAD_ID = "thread_1"
+
+# 每个线程默认保留的最近检查点数
+DEFAULT_KEEP_LAST = 20
+
+
+def _settings() -> dict:
+    return get_config_section(["agent", "checkpointer"]) or {}
+
+
+async def create_checkpointer() -> BaseCheckpointSaver:
+    """根据 config.yaml 的 agent.checkpointer 创建检查点存储。
+
+    type 为 memory 时对话只保存在进程内；为 sqlite 时保存在本地磁盘，
+    退出后可以恢复。未配置时使用内存检查点。
+    """
+    settings = _settings()
+    if settings.get("type", "memory") != "sqlite":
+        return InMemorySaver()
+    if not _has_sqlite:
+        # 不能直接print，否则会写进正在运行的Textual界面
+        logger.warning("未安装 langgraph-checkpoint-sqlite/aiosqlite，使用内存检查点")
+        return InMemorySaver()
+
+    path = settings.get("path") or DEFAULT_CHECKPOINT_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = await aiosqlite.connect(path)
+    # WAL模式下写检查点不阻塞读，且每步提交的fsync开销更小
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    return saver
+
+
+async def close_checkpointer(saver: Optional[BaseCheckpointSaver]) -> None:
+    if _has_sqlite and isinstance(saver, AsyncSqliteSaver):
+        await saver.conn.close()
+
+
+async def list_threads(saver: BaseCheckpointSaver) -> List[str]:
+    """返回所有保存过的线程ID，最近使用的在前"""
+    if _has_sqlite and isinstance(saver, AsyncSqliteSaver):
+        # checkpoint_id 是按时间递增的uuid6，可以直接按字符串排序
+        async with saver.conn.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id ORDER BY MAX(checkpoint_id) DESC"
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+    if isinstance(saver, InMemorySaver):
+        latest = {
+            thread_id: max((max(checkpoints) for checkpoints in namespaces.values() if checkpoints), default="")
+            for thread_id, namespaces in saver.storage.items()
+        }
+        return sorted(latest, key=latest.get, reverse=True)
+    return []
+
+
+async def latest_thread(saver: BaseCheckpointSaver) -> Optional[str]:
+    """返回最近使用的线程ID，用于启动时恢复对话"""
+    threads = await list_threads(saver)
+    return threads[0] if threads else None
+
+
+async def compact_thread(saver: BaseCheckpointSaver, thread_id: str, keep_last: Optional[int] = None) -> int:
+    """删除线程中较早的检查点，只保留最近 keep_last 个，返回删除的检查点数。
+
+    恢复对话只需要最新的检查点，较早的检查点只用于回溯历史，
+    压缩可以避免检查点存储随对话步数无限增长。
+    """
+    if keep_last is None:
+        keep_last = _settings().get("keep_last", DEFAULT_KEEP_LAST)
+    if not keep_last:
+        return 0
+
+    if _has_sqlite and isinstance(saver, AsyncSqliteSaver):
+        async with saver.lock:
+            cursor = await saver.conn.execute(
+                """
+                DELETE FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints
+                    WHERE thread_id = ? ORDER BY checkpoint_id DESC LIMIT ?
+                )
+                """,
+                (thread_id, thread_id, keep_last),
+            )
+            removed = cursor.rowcount
+            await saver.conn.execute(
+                """
+                DELETE FROM writes
+                WHERE thread_id = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?
+                )
+                """,
+                (thread_id, thread_id),
+            )
+            await saver.conn.commit()
+        return removed
+
+    if isinstance(saver, InMemorySaver):
+        removed = 0
+        for checkpoint_ns, checkpoints in saver.storage.get(thread_id, {}).items():
+            for checkpoint_id in sorted(checkpoints)[:-keep_last]:
+                del checkpoints[checkpoint_id]
+                saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                removed += 1
+        return removed
+    return 0
@@ -1,19 +1,51 @@
 from langchain.agents import create_agent
 from langchain.tools import BaseTool
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from src.models.chat_model import init_chat_model
+from src.models.usage import UsageMiddleware
+from src.agents.context_budget import create_context_budget_middleware
+from src.agents.tool_scheduler import create_tool_scheduler_middleware
+from src.agents.tool_cache import create_tool_cache_middleware
+from src.config.config import get_config_section
 
 from src.tools.grep import grep_tool
 from src.tools.ls import ls_tool
 from src.tools.tree import tree_tool
 from src.tools.bash import bash_tool
 from src.tools.text_editor import text_editor_tool
+from src.tools.output_budget import read_output_tool
 from src.prompt.load_prompt import apply_prompt_template
 import os
 
 
 
 # 创建agent
-def create_code_agent(plugin_tools: list[BaseTool] = [], **kwargs):
+def create_code_agent(
+    plugin_tools: list[BaseTool] = [],
+    checkpointer: BaseCheckpointSaver | None = None,
+    **kwargs,
+):
+    """创建代码代理，传入checkpointer后对话状态会按thread_id保存并可恢复"""
+    middleware = list(kwargs.pop("middleware", []))
+    # 上下文预算中间件放在最前面，使其他中间件看到的是裁剪后的消息
+    context_budget = create_context_budget_middleware(get_config_section(["agent", "context_budget"]))
+    if context_budget is not None:
+        middleware.insert(0, context_budget)
+    # 同一步中互不冲突的工具调用并行执行，放在其他包装工具调用的中间件外层
+    scheduler_settings = get_config_section(["agent", "tool_scheduler"]) or {}
+    tool_scheduler = create_tool_scheduler_middleware(scheduler_settings)
+    position = 1 if context_budget is not None else 0
+    if tool_scheduler is not None:
+        middleware.insert(position, tool_scheduler)
+        position += 1
+    # 只读工具结果缓存在调度器内层，保证写入与之后的读取按调用顺序执行
+    tool_cache = create_tool_cache_middleware(
+        get_config_section(["agent", "tool_cache"]), scheduler_settings.get("read_only_tools") or ()
+    )
+    if tool_cache is not None:
+        middleware.insert(position, tool_cache)
+    # 记录每次模型请求的token用量和前缀缓存命中率
+    middleware.append(UsageMiddleware())
     return create_agent(
         model = init_chat_model(),
         tools=[
@@ -22,9 +54,12 @@ def create_code_agent(plugin_tools: list[BaseTool] = [], **kwargs):
             text_editor_tool,
             tree_tool,
             grep_tool,
+            read_output_tool,
             *plugin_tools,
         ],
         system_prompt=apply_prompt_template("agent_prompt", PROJECT_ROOT=os.getcwd()),
         name="code_agent",
+        checkpointer=checkpointer,
+        middleware=middleware,
         **kwargs,
     )
\ No newline at end of file
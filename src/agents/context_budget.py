@@ -0,0 +1,246 @@
+import dataclasses
+import json
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain.messages import AnyMessage, SystemMessage
+from langgraph.config import get_stream_writer
+
+# tiktoken首次使用某个编码时可能需要下载词表，因此在第一次计数时才加载，不可用时按字符数估算
+_encoding = None
+_encoding_loaded = False
+
+# 每条消息的固定开销（角色、分隔符等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+# 缓存的消息token数上限
+_TOKEN_CACHE_SIZE = 4096
+# 截断后仍然超出预算时，最近轮次中较早的工具输出只保留的token数
+_OMITTED_TOOL_OUTPUT_TOKENS = 50
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_text_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 粗略估算：英文约4个字符一个token，中文约1个字符一个token，这里取折中
+    return len(text) // 3 + 1
+
+
+def _message_text(message: AnyMessage) -> str:
+    content = message.content
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        content += json.dumps(tool_calls, ensure_ascii=False, default=str)
+    return content
+
+
+class TokenCounter:
+    """按消息ID缓存token数，避免每次模型调用都重新编码整个历史"""
+
+    def __init__(self, max_size: int = _TOKEN_CACHE_SIZE):
+        self._cache: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        self._max_size = max_size
+
+    def count(self, message: AnyMessage) -> int:
+        text = _message_text(message)
+        key = (message.id, len(text)) if message.id else None
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        tokens = count_text_tokens(text) + _MESSAGE_OVERHEAD_TOKENS
+        if key is not None:
+            self._cache[key] = tokens
+            if len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def total(self, messages: Sequence[AnyMessage]) -> int:
+        return sum(self.count(m) for m in messages)
+
+
+def _split_turns(messages: Sequence[AnyMessage]) -> List[List[AnyMessage]]:
+    """按用户消息把历史切分为轮次，保证工具调用和工具结果不会被拆开"""
+    turns: List[List[AnyMessage]] = []
+    for message in messages:
+        if message.type == "human" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _truncate_text(text: str, max_tokens: int) -> str:
+    """保留文本的开头和结尾，中间用省略标记代替"""
+    # 按字符近似截断，保留约 max_tokens 个token
+    max_chars = max_tokens * 3
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars // 2]
+    tail = text[-max_chars // 4:]
+    omitted = len(text) - len(head) - len(tail)
+    return f"{head}\n... [{omitted} characters of earlier tool output omitted to save context] ...\n{tail}"
+
+
+def _digest(turns: List[List[AnyMessage]]) -> str:
+    """为被移除的轮次生成简短的摘要：用户请求以及调用过的工具"""
+    lines = []
+    for turn in turns:
+        for message in turn:
+            if message.type == "human":
+                lines.append(f"- User: {_truncate_text(_message_text(message), 60)}")
+            elif message.type == "ai":
+                for call in getattr(message, "tool_calls", None) or []:
+                    args = json.dumps(call.get("args", {}), ensure_ascii=False, default=str)
+                    lines.append(f"  - called {call.get('name')}({_truncate_text(args, 30)})")
+    return (
+            "[Summary of earlier conversation, removed to stay within the context budget]\n"
+            + "\n".join(lines)
+    )
+
+
+class ContextBudgetMiddleware(AgentMiddleware):
+    """在每次模型调用前把消息历史控制在token预算内。
+
+    只改变发送给模型的消息，不修改保存在状态和检查点中的完整历史：
+    1. 除最近 keep_recent_turns 轮之外，超过 max_tool_output_tokens 的工具输出只保留首尾；
+    2. 仍然超出 max_tokens 时，从最早的轮次开始移除，直到降到预算的 target_ratio 以下，
+       被移除的轮次生成一段摘要（列出用户请求和调用过的工具），附加在系统提示词之后；
+    3. 只剩最近的轮次时仍然超出 max_tokens（例如一轮中调用了大量工具），
+       依次截断这些轮次中较早的工具输出，最后一次模型回复对应的工具结果保持原样。
+    每次裁剪节省的token数以custom事件 {"type": "context_budget"} 报告给界面。
+    """
+
+    def __init__(
+            self,
+            max_tokens: int = 64000,
+            max_tool_output_tokens: int = 2000,
+            keep_recent_turns: int = 1,
+            target_ratio: float = 0.75,
+    ):
+        super().__init__()
+        self.max_tokens = max_tokens
+        self.max_tool_output_tokens = max_tool_output_tokens
+        self.keep_recent_turns = max(1, keep_recent_turns)
+        self.target_ratio = target_ratio
+        self.counter = TokenCounter()
+
+    def fit(self, messages: Sequence[AnyMessage], system_tokens: int = 0) -> Tuple[List[AnyMessage], int, int]:
+        """返回裁剪后的消息列表，以及裁剪前后的token数"""
+        tokens_before = system_tokens + self.counter.total(messages)
+        if tokens_before <= self.max_tokens:
+            return list(messages), tokens_before, tokens_before
+
+        turns = _split_turns(messages)
+        recent = len(turns) - self.keep_recent_turns
+
+        # 1. 截断较早轮次中的大段工具输出
+        for index in range(max(0, recent)):
+            turns[index] = [
+                message.model_copy(update={"content": _truncate_text(message.content, self.max_tool_output_tokens)})
+                if message.type == "tool" and isinstance(message.content, str)
+                and self.counter.count(message) > self.max_tool_output_tokens
+                else message
+                for message in turns[index]
+            ]
+        turn_tokens = [self.counter.total(turn) for turn in turns]
+        total = system_tokens + sum(turn_tokens)
+
+        # 2. 从最早的轮次开始移除，直到低于目标
+        dropped = 0
+        target = self.max_tokens * self.target_ratio
+        while total > target and dropped < recent:
+            total -= turn_tokens[dropped]
+            dropped += 1
+
+        kept = [message for turn in turns[dropped:] for message in turn]
+        if total > self.max_tokens:
+            kept, total = self._trim_recent(kept, total, target)
+        if dropped:
+            summary = SystemMessage(content=_digest(turns[:dropped]))
+            kept.insert(0, summary)
+            total += self.counter.count(summary)
+        return kept, tokens_before, total
+
+    def _trim_recent(self, messages: List[AnyMessage], total: int, target: float) -> Tuple[List[AnyMessage], int]:
+        """从最早的开始截断工具输出，先截断到 max_tool_output_tokens，仍然超出时再截断到更短"""
+        # 最后一条AI消息之后的工具结果是模型接下来要处理的，不截断
+        last_ai = max((i for i, m in enumerate(messages) if m.type == "ai"), default=-1)
+        messages = list(messages)
+        for limit in (self.max_tool_output_tokens, _OMITTED_TOOL_OUTPUT_TOKENS):
+            for index in range(last_ai):
+                if total <= target:
+                    return messages, total
+                message = messages[index]
+                if message.type != "tool" or not isinstance(message.content, str):
+                    continue
+                tokens = self.counter.count(message)
+                if tokens <= limit:
+                    continue
+                truncated = message.model_copy(update={"content": _truncate_text(message.content, limit)})
+                messages[index] = truncated
+                total += self.counter.count(truncated) - tokens
+        return messages, total
+
+    def _apply(self, request: ModelRequest) -> ModelRequest:
+        system_tokens = count_text_tokens(request.system_prompt) if request.system_prompt else 0
+        messages, tokens_before, tokens_after = self.fit(request.messages, system_tokens)
+        if tokens_after >= tokens_before:
+            return request
+        _report(tokens_before, tokens_after)
+        # 摘要附加在系统提示词之后，不作为用户消息发送
+        system_prompt = request.system_prompt
+        if messages and messages[0].type == "system":
+            summary = messages.pop(0).content
+            system_prompt = f"{system_prompt}\n\n{summary}" if system_prompt else summary
+        return dataclasses.replace(request, messages=messages, system_prompt=system_prompt)
+
+    def wrap_model_call(
+            self,
+            request: ModelRequest,
+            handler: Callable[[ModelRequest], ModelResponse],
+    ) -> ModelResponse:
+        return handler(self._apply(request))
+
+    async def awrap_model_call(
+            self,
+            request: ModelRequest,
+            handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        return await handler(self._apply(request))
+
+
+def _report(tokens_before: int, tokens_after: int) -> None:
+    try:
+        writer = get_stream_writer()
+    except Exception:
+        return
+    writer({
+        "type": "context_budget",
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "saved": tokens_before - tokens_after,
+    })
+
+
+def create_context_budget_middleware(settings: Optional[dict[str, Any]]) -> Optional[ContextBudgetMiddleware]:
+    """根据 config.yaml 的 agent.context_budget 创建中间件，未配置或关闭时返回None"""
+    if not settings or not settings.get("enabled", True):
+        return None
+    options = {k: settings[k] for k in ("max_tokens", "max_tool_output_tokens", "keep_recent_turns", "target_ratio")
+               if k in settings}
+    return ContextBudgetMiddleware(**options)
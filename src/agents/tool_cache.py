@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from langchain.agents.middleware import AgentMiddleware, AgentState
+from langchain.messages import ToolMessage
+from langgraph.config import get_stream_writer
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.runtime import Runtime
+from langgraph.types import Command
+
+from src.agents.tool_scheduler import READ, classify_tool_call, paths_overlap, thread_id_of
+from src.tools.bash import is_read_only_command
+
+# 结果可以缓存的只读工具
+CACHEABLE_TOOLS = {"ls", "tree", "grep", "text_editor"}
+# 缓存的工具结果数上限
+DEFAULT_MAX_ENTRIES = 256
+
+# 路径的指纹：(修改时间, 大小)，路径不存在时为None
+Fingerprint = Tuple[Optional[Tuple[int, int]], ...]
+
+
+def _fingerprint(paths: Tuple[str, ...]) -> Fingerprint:
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+
+class _Entry:
+    def __init__(self, paths: Tuple[str, ...], fingerprint: Fingerprint, message: ToolMessage):
+        self.paths = paths
+        self.fingerprint = fingerprint
+        self.message = message
+
+
+class ToolResultCache:
+    """只读工具结果的缓存。
+
+    以工具名和参数为键，同时记录涉及路径的修改时间和大小，
+    路径被代理之外的程序修改后指纹不再匹配，缓存自动失效。
+    目录的修改时间只反映直接子项的增删，因此代理自己的写入还需要调用 invalidate。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: Tuple[str, str], paths: Tuple[str, ...]) -> Optional[ToolMessage]:
+        fingerprint = _fingerprint(paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint == fingerprint:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.message
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple[str, str], paths: Tuple[str, ...], fingerprint: Fingerprint, message: ToolMessage) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(paths, fingerprint, message)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, paths: Optional[Tuple[str, ...]] = None) -> None:
+        """移除涉及 paths（或其上级、下级目录）的缓存结果，paths为None时清空缓存"""
+        with self._lock:
+            if paths is None:
+                stale = list(self._entries)
+            else:
+                stale = [key for key, entry in self._entries.items() if paths_overlap(entry.paths, paths)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+class ToolResultCacheMiddleware(AgentMiddleware):
+    """在一轮对话内复用 ls、tree、grep 和 text_editor view 的结果。
+
+    - 相同参数、且涉及路径的修改时间和大小没有变化时直接返回上次的结果；
+    - text_editor 写入文件后移除涉及该路径的结果；bash执行可能修改文件的命令、
+      或调用任何不确定是只读的工具（包括MCP工具）后清空缓存；
+    - 每个对话线程（thread_id）有独立的缓存，每轮对话开始和结束时清空，
+      两轮之间用户可能在代理之外修改了文件；
+    - 每次查询缓存以custom事件 {"type": "tool_cache"} 报告该对话的命中率。
+    应放在工具调度中间件的内层，这样写入和之后的读取按调用顺序执行。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, read_only_tools: Iterable[str] = ()):
+        super().__init__()
+        self.max_entries = max_entries
+        self.read_only_tools: Set[str] = set(read_only_tools)
+        self._caches: Dict[str, ToolResultCache] = {}
+        self._lock = threading.Lock()
+
+    def cache(self, thread_id: str) -> ToolResultCache:
+        with self._lock:
+            cache = self._caches.get(thread_id)
+            if cache is None:
+                cache = self._caches[thread_id] = ToolResultCache(self.max_entries)
+            return cache
+
+    def before_agent(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        self.cache(thread_id_of()).clear()
+        return None
+
+    async def abefore_agent(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        return self.before_agent(state, runtime)
+
+    def after_agent(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        # 保留统计，释放缓存的结果
+        self.cache(thread_id_of()).clear()
+        return None
+
+    async def aafter_agent(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        return self.after_agent(state, runtime)
+
+    def _plan(self, request: ToolCallRequest) -> Tuple[Optional[Tuple[str, str]], Tuple[str, ...]]:
+        """返回缓存键（不可缓存时为None）和涉及的路径"""
+        call = request.tool_call
+        name, args = call["name"], call.get("args") or {}
+        if name not in CACHEABLE_TOOLS:
+            return None, ()
+        mode, paths = classify_tool_call(name, args)
+        if mode != READ or not paths:
+            return None, paths
+        return (name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)), paths
+
+    def _lookup(self, request: ToolCallRequest, key: Tuple[str, str], paths: Tuple[str, ...]) -> Optional[ToolMessage]:
+        cache = self.cache(thread_id_of(request))
+        cached = cache.get(key, paths)
+        _report(key[0], cached is not None, cache)
+        if cached is None:
+            return None
+        # 结果要对应本次的工具调用
+        return cached.model_copy(update={"tool_call_id": request.tool_call["id"], "id": None})
+
+    def _store(self, request: ToolCallRequest, key: Tuple[str, str], paths: Tuple[str, ...],
+               fingerprint: Fingerprint, result: Any) -> None:
+        if not isinstance(result, ToolMessage) or result.status == "error":
+            return
+        if isinstance(result.content, str) and result.content.startswith("Error"):
+            return
+        self.cache(thread_id_of(request)).put(key, paths, fingerprint, result)
+
+    def _after_call(self, request: ToolCallRequest) -> None:
+        """写入文件、执行修改文件的命令或调用不确定是只读的工具后使缓存失效"""
+        call = request.tool_call
+        name, args = call["name"], call.get("args") or {}
+        mode, paths = classify_tool_call(name, args, self.read_only_tools)
+        if mode == READ:
+            return
+        cache = self.cache(thread_id_of(request))
+        if name == "text_editor":
+            cache.invalidate(paths or None)
+        elif name == "bash" and is_read_only_command(str(args.get("command", ""))):
+            return
+        else:
+            cache.invalidate()
+
+    def wrap_tool_call(
+            self,
+            request: ToolCallRequest,
+            handler: Callable[[ToolCallRequest], Union[ToolMessage, Command]],
+    ) -> Union[ToolMessage, Command]:
+        key, paths = self._plan(request)
+        if key is None:
+            try:
+                return handler(request)
+            finally:
+                self._after_call(request)
+        cached = self._lookup(request, key, paths)
+        if cached is not None:
+            return cached
+        # 在执行前取指纹，执行期间文件被修改时下次查询不会命中
+        fingerprint = _fingerprint(paths)
+        result = handler(request)
+        self._store(request, key, paths, fingerprint, result)
+        return result
+
+    async def awrap_tool_call(
+            self,
+            request: ToolCallRequest,
+            handler: Callable[[ToolCallRequest], Awaitable[Union[ToolMessage, Command]]],
+    ) -> Union[ToolMessage, Command]:
+        key, paths = self._plan(request)
+        if key is None:
+            try:
+                return await handler(request)
+            finally:
+                self._after_call(request)
+        cached = self._lookup(request, key, paths)
+        if cached is not None:
+            return cached
+        fingerprint = _fingerprint(paths)
+        result = await handler(request)
+        self._store(request, key, paths, fingerprint, result)
+        return result
+
+
+def _report(tool_name: str, hit: bool, cache: ToolResultCache) -> None:
+    try:
+        writer = get_stream_writer()
+    except Exception:
+        return
+    writer({
+        "type": "tool_cache",
+        "tool": tool_name,
+        "hit": hit,
+        **cache.summary(),
+    })
+
+
+def create_tool_cache_middleware(
+        settings: Optional[Dict[str, Any]],
+        read_only_tools: Iterable[str] = (),
+) -> Optional[ToolResultCacheMiddleware]:
+    """根据 config.yaml 的 agent.tool_cache 创建中间件，关闭时返回None。
+
+    read_only_tools 中的工具（与工具调度器的配置相同）调用后不会使缓存失效。
+    """
+    settings = settings or {}
+    if not settings.get("enabled", True):
+        return None
+    return ToolResultCacheMiddleware(
+        max_entries=settings.get("max_entries", DEFAULT_MAX_ENTRIES),
+        read_only_tools=read_only_tools,
+    )
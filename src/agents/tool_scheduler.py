@@ -0,0 +1,248 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.messages import ToolMessage
+from langgraph.config import get_config
+from langgraph.prebuilt.tool_node import ToolCallRequest
+from langgraph.types import Command
+
+# 同时执行的工具调用数上限的默认值
+DEFAULT_MAX_CONCURRENCY = 4
+
+# 访问方式：只读调用之间可以并行；写调用与涉及相同路径的调用互斥；独占调用与所有调用互斥
+READ = "read"
+WRITE = "write"
+EXCLUSIVE = "exclusive"
+
+# 内置的只读工具及其参数中的路径字段
+_READ_ONLY_PATH_ARGS = {
+    "ls": "path",
+    "tree": "root",
+    "grep": "paths",
+    "read_output": None,
+}
+
+
+def _normalize(path: str) -> str:
+    return os.path.normpath(os.path.abspath(os.path.expanduser(path)))
+
+
+def _paths(value: Any) -> Tuple[str, ...]:
+    if isinstance(value, str):
+        return (_normalize(value),)
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value if isinstance(item, str))
+    return ()
+
+
+def classify_tool_call(name: str, args: Dict[str, Any], read_only_tools: Iterable[str] = ()) -> Tuple[str, Tuple[str, ...]]:
+    """返回工具调用的访问方式和涉及的路径。
+
+    - ls、tree、grep、read_output 以及 text_editor 的 view 命令是只读的；
+    - text_editor 的其他命令写入 path 参数指定的文件；
+    - bash 可能读写任意文件，和未知工具一样独占执行；
+    - 配置中 read_only_tools 列出的工具（如查询文档的MCP工具）视为不涉及路径的只读工具。
+    """
+    if name in _READ_ONLY_PATH_ARGS:
+        key = _READ_ONLY_PATH_ARGS[name]
+        return READ, _paths(args.get(key)) if key else ()
+    if name == "text_editor":
+        paths = _paths(args.get("path"))
+        if args.get("command") == "view":
+            return READ, paths
+        return (WRITE, paths) if paths else (EXCLUSIVE, ())
+    if name in read_only_tools:
+        return READ, ()
+    return EXCLUSIVE, ()
+
+
+def thread_id_of(request: Optional[ToolCallRequest] = None) -> str:
+    """返回当前调用所属对话线程的thread_id（没有配置时为 "default"）"""
+    config = getattr(getattr(request, "runtime", None), "config", None)
+    if not config:
+        try:
+            config = get_config()
+        except RuntimeError:
+            config = {}
+    return str((config or {}).get("configurable", {}).get("thread_id", "default"))
+
+
+def paths_overlap(a: Tuple[str, ...], b: Tuple[str, ...]) -> bool:
+    """两组路径是否有相同的路径，或者一个是另一个的上级目录"""
+    for x in a:
+        for y in b:
+            if x == y or x.startswith(y.rstrip(os.sep) + os.sep) or y.startswith(x.rstrip(os.sep) + os.sep):
+                return True
+    return False
+
+
+class _Ticket:
+    def __init__(self, mode: str, paths: Tuple[str, ...], wake: Callable[[], None]):
+        self.mode = mode
+        self.paths = paths
+        self.wake = wake
+
+    def conflicts(self, other: "_Ticket") -> bool:
+        if self.mode == EXCLUSIVE or other.mode == EXCLUSIVE:
+            return True
+        if self.mode == READ and other.mode == READ:
+            return False
+        return paths_overlap(self.paths, other.paths)
+
+
+class ToolScheduler:
+    """工具调用的准入调度。
+
+    工具节点会同时启动同一条AI消息中的所有工具调用，调度器决定每个调用何时可以开始执行：
+    - 正在执行的调用数不超过 max_concurrency；
+    - 互相冲突的调用（见 _Ticket.conflicts）按提交顺序依次执行，
+      因此先写后读同一个文件时读到的一定是写入后的内容；
+    - 不冲突的调用可以越过排在前面但仍在等待的调用。
+    同一个调度器可以同时被同步调用（线程）和异步调用（事件循环）使用。
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self._lock = threading.Lock()
+        self._active: List[_Ticket] = []
+        self._waiting: Deque[_Ticket] = deque()
+        # 统计：调用数、等待过的调用数、累计等待时间和最大并行数
+        self.calls = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_parallel = 0
+
+    def _admissible(self, ticket: _Ticket, ahead: Iterable[_Ticket]) -> bool:
+        if len(self._active) >= self.max_concurrency:
+            return False
+        return not any(ticket.conflicts(other) for other in self._active) and \
+            not any(ticket.conflicts(other) for other in ahead)
+
+    def _start(self, ticket: _Ticket) -> None:
+        self._active.append(ticket)
+        self.max_parallel = max(self.max_parallel, len(self._active))
+
+    def _submit(self, ticket: _Ticket) -> bool:
+        """提交调用，可以立即执行时返回True，否则进入等待队列"""
+        with self._lock:
+            self.calls += 1
+            if self._admissible(ticket, self._waiting):
+                self._start(ticket)
+                return True
+            self._waiting.append(ticket)
+            self.waited += 1
+            return False
+
+    def _release(self, ticket: _Ticket) -> None:
+        """调用结束（或等待被取消），按提交顺序唤醒可以执行的等待调用"""
+        with self._lock:
+            if ticket in self._active:
+                self._active.remove(ticket)
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+            ahead: List[_Ticket] = []
+            for waiting in list(self._waiting):
+                if self._admissible(waiting, ahead):
+                    self._waiting.remove(waiting)
+                    self._start(waiting)
+                    waiting.wake()
+                else:
+                    ahead.append(waiting)
+
+    def run(self, mode: str, paths: Tuple[str, ...], func: Callable[[], Any]) -> Any:
+        event = threading.Event()
+        ticket = _Ticket(mode, paths, event.set)
+        if not self._submit(ticket):
+            start_time = time.perf_counter()
+            event.wait()
+            self.wait_seconds += time.perf_counter() - start_time
+        try:
+            return func()
+        finally:
+            self._release(ticket)
+
+    async def arun(self, mode: str, paths: Tuple[str, ...], func: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        ticket = _Ticket(mode, paths, lambda: loop.call_soon_threadsafe(event.set))
+        if not self._submit(ticket):
+            start_time = time.perf_counter()
+            try:
+                await event.wait()
+            except asyncio.CancelledError:
+                # 等待时被取消：如果恰好已经被准入，释放占用的位置
+                self._release(ticket)
+                raise
+            self.wait_seconds += time.perf_counter() - start_time
+        try:
+            return await func()
+        finally:
+            self._release(ticket)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "waited": self.waited,
+            "wait_ms": round(self.wait_seconds * 1000, 1),
+            "max_parallel": self.max_parallel,
+        }
+
+
+class ToolSchedulerMiddleware(AgentMiddleware):
+    """并行执行同一步中互不冲突的工具调用。
+
+    只读工具（ls、tree、grep、text_editor view 等）在并发上限内并行执行，
+    写文件的调用按路径串行，bash和未知工具独占执行。
+    每个对话线程（thread_id）有独立的调度器，批量运行时共用一个代理的各个任务互不阻塞，
+    并发上限也只约束同一对话中同一步的工具调用。
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, read_only_tools: Iterable[str] = ()):
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self.read_only_tools: Set[str] = set(read_only_tools)
+        self._schedulers: Dict[str, ToolScheduler] = {}
+        self._lock = threading.Lock()
+
+    def scheduler(self, thread_id: str) -> ToolScheduler:
+        with self._lock:
+            scheduler = self._schedulers.get(thread_id)
+            if scheduler is None:
+                scheduler = self._schedulers[thread_id] = ToolScheduler(self.max_concurrency)
+            return scheduler
+
+    def _classify(self, request: ToolCallRequest) -> Tuple[str, Tuple[str, ...]]:
+        call = request.tool_call
+        return classify_tool_call(call["name"], call.get("args") or {}, self.read_only_tools)
+
+    def wrap_tool_call(
+            self,
+            request: ToolCallRequest,
+            handler: Callable[[ToolCallRequest], Union[ToolMessage, Command]],
+    ) -> Union[ToolMessage, Command]:
+        mode, paths = self._classify(request)
+        return self.scheduler(thread_id_of(request)).run(mode, paths, lambda: handler(request))
+
+    async def awrap_tool_call(
+            self,
+            request: ToolCallRequest,
+            handler: Callable[[ToolCallRequest], Awaitable[Union[ToolMessage, Command]]],
+    ) -> Union[ToolMessage, Command]:
+        mode, paths = self._classify(request)
+        return await self.scheduler(thread_id_of(request)).arun(mode, paths, lambda: handler(request))
+
+
+def create_tool_scheduler_middleware(settings: Optional[Dict[str, Any]]) -> Optional[ToolSchedulerMiddleware]:
+    """根据 config.yaml 的 agent.tool_scheduler 创建中间件，关闭时返回None"""
+    settings = settings or {}
+    if not settings.get("enabled", True):
+        return None
+    return ToolSchedulerMiddleware(
+        max_concurrency=settings.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+        read_only_tools=settings.get("read_only_tools") or (),
+    )
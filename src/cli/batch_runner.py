@@ -0,0 +1,171 @@
+"""无界面批量运行代理任务
+
+从JSONL文件读取任务，每行一个JSON对象，任务文本取自 prompt 字段
+（没有时使用 title 和 body 拼接），任务ID取自 id 或 request_id 字段。
+每个任务使用独立的对话线程（bash持久化会话也按任务隔离），
+最多同时运行 concurrency 个任务，每个任务完成后立即把对话记录、
+耗时和token用量作为一行写入输出JSONL。超时或出错的任务同样记录到此为止的
+对话记录和token用量。
+
+用法：
+    python -m src.cli.batch_runner requests.jsonl -o results.jsonl --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.messages import AIMessage, AnyMessage, HumanMessage
+
+from src.agents.code_agent import create_code_agent
+from src.mcp.load_mcp import MCPToolLoader
+from src.models.usage import RequestUsage, usage_from_message
+from src.tools.shell_session import get_session_pool
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RECURSION_LIMIT = 100
+
+
+def load_tasks(path: str) -> List[Dict[str, Any]]:
+    """读取任务文件，为缺少ID的任务按行号生成ID"""
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            task = json.loads(line)
+            task.setdefault("id", task.get("request_id") or f"task-{line_num}")
+            tasks.append(task)
+    return tasks
+
+
+def task_prompt(task: Dict[str, Any]) -> str:
+    if task.get("prompt"):
+        return task["prompt"]
+    return "\n\n".join(part for part in (task.get("title"), task.get("body")) if part)
+
+
+def _serialize_message(message: AnyMessage) -> Dict[str, Any]:
+    record = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        record["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in message.tool_calls]
+    if message.type == "tool":
+        record["name"] = message.name
+    return record
+
+
+def _total_usage(messages: List[AnyMessage]) -> RequestUsage:
+    total = RequestUsage()
+    for message in messages:
+        usage = usage_from_message(message) if isinstance(message, AIMessage) else None
+        if usage is not None:
+            total.input_tokens += usage.input_tokens
+            total.cached_tokens += usage.cached_tokens
+            total.output_tokens += usage.output_tokens
+    return total
+
+
+async def run_task(agent, task: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """运行单个任务，返回可写入JSONL的结果；任务失败或超时时记录错误而不抛出异常。
+
+    以 stream_mode="values" 消费代理，每一步之后记录最新的消息列表，
+    因此超时或出错时也能保存到此为止的对话记录和已经产生的token用量。
+    """
+    start_time = time.perf_counter()
+    result: Dict[str, Any] = {"id": task["id"], "status": "ok"}
+    messages: List[AnyMessage] = []
+
+    async def _consume() -> None:
+        nonlocal messages
+        async for state in agent.astream(
+                {"messages": [HumanMessage(content=task_prompt(task))]},
+                stream_mode="values",
+                config={
+                    "recursion_limit": DEFAULT_RECURSION_LIMIT,
+                    # 每个任务使用独立的线程ID，使bash持久化会话按任务隔离
+                    "configurable": {"thread_id": f"batch-{task['id']}"},
+                },
+        ):
+            messages = state.get("messages", messages)
+
+    try:
+        await asyncio.wait_for(_consume(), timeout=timeout)
+    except asyncio.TimeoutError:
+        result.update(status="timeout", error=f"任务执行超时（{timeout}秒）")
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+
+    usage = _total_usage(messages)
+    result.update(
+        duration_ms=round((time.perf_counter() - start_time) * 1000),
+        model_calls=sum(1 for m in messages if isinstance(m, AIMessage)),
+        tool_calls=sum(1 for m in messages if m.type == "tool"),
+        usage={
+            "input_tokens": usage.input_tokens,
+            "cached_tokens": usage.cached_tokens,
+            "output_tokens": usage.output_tokens,
+        },
+        final_answer=messages[-1].content if messages and isinstance(messages[-1], AIMessage) else None,
+        transcript=[_serialize_message(m) for m in messages],
+    )
+    return result
+
+
+async def run_batch(
+        tasks: List[Dict[str, Any]],
+        output_path: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: Optional[float] = None,
+        with_mcp: bool = False,
+) -> List[Dict[str, Any]]:
+    """并发运行所有任务，按完成顺序把结果逐行写入 output_path，返回所有结果"""
+    mcp_loader = MCPToolLoader() if with_mcp else None
+    plugin_tools = await mcp_loader.load_all() if mcp_loader else []
+    # 代理本身不保存状态，所有任务共享一个实例
+    agent = create_code_agent(plugin_tools=plugin_tools)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(task: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_task(agent, task, timeout)
+
+    results = []
+    try:
+        with open(output_path, "w", encoding="utf-8") as output:
+            for future in asyncio.as_completed([_run(task) for task in tasks]):
+                result = await future
+                output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                output.flush()
+                results.append(result)
+                print(f"[{len(results)}/{len(tasks)}] {result['id']}: {result['status']} ({result['duration_ms']} ms)")
+    finally:
+        # 关闭各任务的bash持久化会话和MCP会话
+        await get_session_pool().close_all()
+        if mcp_loader is not None:
+            await mcp_loader.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agent tasks from a JSONL file without the UI")
+    parser.add_argument("tasks", help="任务JSONL文件")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="结果JSONL文件")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同时运行的任务数")
+    parser.add_argument("--timeout", type=float, default=None, help="单个任务的超时时间（秒）")
+    parser.add_argument("--mcp", action="store_true", help="加载 config.yaml 中配置的MCP工具")
+    args = parser.parse_args()
+
+    tasks = load_tasks(args.tasks)
+    start_time = time.perf_counter()
+    results = asyncio.run(run_batch(tasks, args.output, args.concurrency, args.timeout, args.mcp))
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    print(
+        f"完成 {succeeded}/{len(results)} 个任务，总耗时 {time.perf_counter() - start_time:.1f} 秒，"
+        f"结果已写入 {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
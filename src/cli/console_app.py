@@ -1,33 +1,80 @@
+from __future__ import annotations
+
 import asyncio
-import re
+import importlib
+import os
+import time
+from collections import deque
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from langchain.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
-from langgraph.graph.state import CompiledStateGraph
 from textual import work
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import Vertical, VerticalScroll
-from textual.widgets import Footer, Header, Input, TabbedContent, TabPane, Static, TextArea
+from textual.widgets import Button, Footer, Header, Input, Log, TabbedContent, TabPane, Static, TextArea
+
+from src.config.config import get_config_section
+
+if TYPE_CHECKING:
+    from langchain.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+    from langgraph.graph.state import CompiledStateGraph
+
+# 代理相关的模块（模型SDK、MCP客户端、LangGraph等）导入耗时较长，
+# 在界面完成首次绘制后于后台线程中导入，之后各处的局部导入只是查表
+_DEFERRED_MODULES = (
+    "langchain.messages",
+    "src.agents.checkpoint",
+    "src.agents.code_agent",
+    "src.mcp.load_mcp",
+    "src.models.response_cache",
+)
+
+
+def _import_deferred_modules() -> None:
+    for name in _DEFERRED_MODULES:
+        importlib.import_module(name)
+
+
+# 聊天区域最多同时挂载的消息组件数，更早的消息只保存在列表中，按需加载
+MAX_MOUNTED_MESSAGES = 200
+# 每次“加载更早的消息”挂载的消息数
+LOAD_EARLIER_PAGE = 100
+# 流式输出时刷新正在生成的消息的最小间隔（秒）
+STREAM_REFRESH_INTERVAL = 0.05
+
+
+class ChatMessage(Static):
+    """单条聊天消息组件"""
 
-from src.agents.code_agent import create_code_agent
-from src.tools.bash import bash_tool
-from src.tools.text_editor import text_editor_tool
-from src.mcp.load_mcp import load_mcp
+    def __init__(self, text: str, message_index: int):
+        # 禁用标记语言解析，直接显示原始文本
+        super().__init__(text, markup=False, classes="chat-message")
+        self.message_index = message_index
 
 
 class ChatView(Vertical):
-    """聊天视图组件"""
+    """聊天视图组件
+
+    每条消息挂载为一个独立的组件，添加消息只渲染新消息本身；
+    只保留最近的 MAX_MOUNTED_MESSAGES 条消息组件，更早的消息可以按需重新加载。
+    消息区域锚定在底部（见 Widget.anchor），用户向上滚动后不再跟随，滚回底部后恢复跟随。
+    """
     
     def __init__(self, id=None):
         super().__init__(id=id)
         self.input = Input(id="chat-input", placeholder="输入命令或问题...")
         self.is_generating = False
         self.messages = []  # 存储所有消息的列表
+        self._mounted = deque()  # 已挂载的消息组件，按消息顺序排列
+        self._streams = {}  # 正在流式生成的消息: {消息ID: (消息组件, 已收到的文本片段)}
+        self._dirty_streams = set()
+        self._flush_scheduled = False
     
     def compose(self) -> ComposeResult:
         # 可滚动的消息区域 - 使用flex布局来占据剩余空间
-        yield VerticalScroll(id="chat-messages", classes="chat-messages")
+        with VerticalScroll(id="chat-messages", classes="chat-messages"):
+            yield Button("加载更早的消息", id="load-earlier", classes="load-earlier hidden")
         # 固定的底部区域 - 包含加载指示器和输入框
         with Vertical(id="chat-footer", classes="chat-footer"):
             yield Static(id="loading-indicator", classes="loading-indicator hidden")
@@ -35,63 +82,160 @@ class ChatView(Vertical):
             
     def on_mount(self):
         """组件挂载时的初始化"""
-        # 在挂载时向消息区域添加内容静态组件
-        messages_container = self.query_one("#chat-messages", VerticalScroll)
-        messages_container.mount(Static(id="chat-content", classes="chat-content"))
         # 获取滚动容器并设置滚动行为
+        messages_container = self.query_one("#chat-messages", VerticalScroll)
         messages_container.can_focus = True
         messages_container.auto_height = False
+        messages_container.anchor()
+
+    @staticmethod
+    def format_message(message) -> Optional[str]:
+        """将消息格式化为显示文本，不显示的消息返回None"""
+        if not hasattr(message, 'content'):
+            return None
+        # 获取原始内容，不进行特殊格式化
+        raw_content = str(message.content)
+        # 按消息类型字段判断，不需要在界面启动时导入langchain的消息类
+        message_type = getattr(message, "type", None)
+        if message_type == "human":
+            return f"👤 你: {raw_content}"
+        elif message_type in ("ai", "AIMessageChunk"):
+            return f"🤖 AI: {raw_content}"
+        elif message_type == "tool":
+            return f"🔧 工具: {raw_content}"
+        return None
 
     def add_message(self, message):
         # 将消息添加到列表中
         self.messages.append(message)
-        # 重新构建完整的消息内容
-        self._update_chat_content()
-    
-    def _update_chat_content(self):
-        """更新聊天内容显示"""
-        try:
-            # 尝试查询聊天内容节点
-            content = self.query_one("#chat-content", Static)
-        except Exception:
-            # 如果节点不存在，先创建它
+        text = self.format_message(message)
+        if text is None:
+            return
+
+        # 已经流式显示过的消息，用完整内容替换正在生成的组件
+        stream = self._streams.pop(getattr(message, "id", None), None)
+        if stream is not None:
+            widget, _ = stream
+            self._dirty_streams.discard(widget)
+            widget.message_index = len(self.messages) - 1
+            widget.update(text)
+            return
+
+        self._mount_message(ChatMessage(text, len(self.messages) - 1))
+
+    def load_history(self, messages):
+        """用一组历史消息替换当前内容，只挂载最近的 MAX_MOUNTED_MESSAGES 条"""
+        for widget in self._mounted:
+            widget.remove()
+        self._mounted.clear()
+        self._streams.clear()
+        self._dirty_streams.clear()
+        self.messages = list(messages)
+        widgets = []
+        for index in range(len(self.messages) - 1, -1, -1):
+            text = self.format_message(self.messages[index])
+            if text is not None:
+                widgets.append(ChatMessage(text, index))
+                if len(widgets) >= MAX_MOUNTED_MESSAGES:
+                    break
+        widgets.reverse()
+        if widgets:
             messages_container = self.query_one("#chat-messages", VerticalScroll)
-            messages_container.mount(Static(id="chat-content", classes="chat-content"))
-            content = self.query_one("#chat-content", Static)
-        
-        full_content = ""
-        
-        # 重新构建所有消息
-        for message in self.messages:
-            if hasattr(message, 'content'):
-                # 获取原始内容，不进行特殊格式化
-                raw_content = str(message.content)
-                
-                if isinstance(message, HumanMessage):
-                    full_content += f"\n\n👤 你: {raw_content}"
-                elif isinstance(message, AIMessage):
-                    full_content += f"\n\n🤖 AI: {raw_content}"
-                elif isinstance(message, ToolMessage):
-                    full_content += f"\n\n🔧 工具: {raw_content}"
-        
-        try:
-            # 禁用标记语言解析，直接显示原始文本
-            content._render_markup = False
-            # 一次性更新内容
-            content.update(full_content.strip())
-        except Exception as e:
-            # 如果更新失败，显示错误信息
-            error_msg = f"更新聊天内容时出错: {str(e)}"
-            print(error_msg)
-            content.update(error_msg)
-        
-        # 确保视图刷新
-        self.refresh()
-        # 滚动消息区域到底部
-        messages_scroll = self.query_one("#chat-messages", VerticalScroll)
-        messages_scroll.call_later(messages_scroll.scroll_end, animate=True)
-    
+            messages_container.mount(*widgets)
+            self._mounted.extend(widgets)
+            messages_container.call_after_refresh(messages_container.scroll_end, animate=False)
+        self._update_load_earlier()
 
+    def append_stream(self, message_id: str, delta: str):
+        """把模型输出的增量文本追加到正在生成的AI消息中
+
+        第一个片段立即显示，之后的刷新按 STREAM_REFRESH_INTERVAL 合并，
+        避免每个token都触发一次重新渲染。
+        """
+        if not delta:
+            return
+        stream = self._streams.get(message_id)
+        if stream is None:
+            widget = ChatMessage(f"🤖 AI: {delta}", len(self.messages))
+            self._streams[message_id] = (widget, [delta])
+            self._mount_message(widget)
+            return
+        widget, parts = stream
+        parts.append(delta)
+        self._dirty_streams.add(widget)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.set_timer(STREAM_REFRESH_INTERVAL, self._flush_streams)
+
+    def end_streams(self):
+        """结束所有未完成的流式消息（例如请求出错时），保留已显示的内容"""
+        self._flush_streams()
+        self._streams.clear()
+
+    def _flush_streams(self):
+        self._flush_scheduled = False
+        if not self._dirty_streams:
+            return
+        for widget, parts in self._streams.values():
+            if widget in self._dirty_streams:
+                widget.update(f"🤖 AI: {''.join(parts)}")
+        self._dirty_streams.clear()
+
+    def _mount_message(self, widget: ChatMessage):
+        # 是否跟随新消息由锚定决定，这里只负责挂载和回收
+        self._mounted.append(widget)
+        self.query_one("#chat-messages", VerticalScroll).mount(widget)
+        self._trim_mounted()
+
+    def _trim_mounted(self):
+        """移除超出上限的最早的消息组件
+
+        用户停在上方翻看时，按移除的高度向上调整滚动位置，保持看到的内容不动。
+        """
+        if len(self._mounted) <= MAX_MOUNTED_MESSAGES:
+            return
+        messages_container = self.query_one("#chat-messages", VerticalScroll)
+        removed_height = 0
+        while len(self._mounted) > MAX_MOUNTED_MESSAGES:
+            widget = self._mounted.popleft()
+            removed_height += widget.outer_size.height
+            widget.remove()
+        if removed_height and messages_container.scroll_y < messages_container.max_scroll_y:
+            messages_container.call_after_refresh(
+                messages_container.scroll_relative, y=-removed_height, animate=False
+            )
+        self._update_load_earlier()
+
+    def _first_mounted_index(self) -> int:
+        return self._mounted[0].message_index if self._mounted else len(self.messages)
+
+    def _update_load_earlier(self):
+        button = self.query_one("#load-earlier", Button)
+        button.set_class(self._first_mounted_index() == 0, "hidden")
+
+    def load_earlier(self):
+        """挂载更早的一页消息"""
+        end = self._first_mounted_index()
+        widgets = []
+        index = end - 1
+        while index >= 0 and len(widgets) < LOAD_EARLIER_PAGE:
+            text = self.format_message(self.messages[index])
+            if text is not None:
+                widgets.append(ChatMessage(text, index))
+            index -= 1
+        if not widgets:
+            self._update_load_earlier()
+            return
+        widgets.reverse()
+        button = self.query_one("#load-earlier", Button)
+        self.query_one("#chat-messages", VerticalScroll).mount(*widgets, after=button)
+        self._mounted.extendleft(reversed(widgets))
+        self._update_load_earlier()
+
+    def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "load-earlier":
+            event.stop()
+            self.load_earlier()
     
     def update_loading_indicator(self, is_loading):
         """更新加载指示器的显示状态"""
@@ -114,28 +258,74 @@ class ChatView(Vertical):
         self.input.disabled = value
 
 
-class TerminalView(VerticalScroll):
-    """可滚动的终端视图组件"""
+# 终端视图默认保留的行数
+DEFAULT_TERMINAL_SCROLLBACK = 5000
+# 溢出行写入的目录（相对于项目根目录）
+TERMINAL_SPILL_DIR = os.path.join(".code_agent", "terminal")
+
+
+class TerminalView(Vertical):
+    """终端视图组件
+
+    基于只追加渲染的 Log 组件：只保留最近 scrollback 行（环形缓冲），
+    只有可见的行会被渲染。开启 spill_to_disk 时，被淘汰的旧行会追加写入
+    .code_agent/terminal/ 下的日志文件，便于之后搜索。
+    """
     
     def __init__(self, id=None):
         super().__init__(id=id)
-        self._content = "=== 终端视图 ===\n欢迎使用CodeAgentDemo终端!"
+        settings = get_config_section(["ui", "terminal"]) or {}
+        self.scrollback = settings.get("scrollback", DEFAULT_TERMINAL_SCROLLBACK)
+        self.spill_path = None
+        if settings.get("spill_to_disk"):
+            self.spill_path = os.path.join(TERMINAL_SPILL_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.log")
+        self._partial_line = False  # 最后一行是否是未结束的流式输出
+        self._log = Log(id="terminal-log", max_lines=self.scrollback, highlight=False)
     
     def compose(self) -> ComposeResult:
-        yield Static(self._content, id="terminal-content")
+        yield self._log
+
+    def on_mount(self):
+        self.write("=== 终端视图 ===\n欢迎使用CodeAgentDemo终端!")
     
     def write(self, text, is_result=False):
+        """写入一段完整的文本，总是从新的一行开始"""
+        self._append(("\n" if self._partial_line else "") + text + "\n")
+
+    def append(self, text):
+        """追加流式输出片段（不自动换行）"""
+        self._append(text)
+
+    def end_partial_line(self):
+        """如果最后一行是未结束的流式输出，结束该行"""
+        if self._partial_line:
+            self._append("\n")
+
+    def _append(self, data: str):
+        if not data:
+            return
         try:
-            # 首先更新内部内容变量
-            self._content += ("\n" if self._content.strip() else "") + text
-            
-            # 然后更新UI组件
-            content = self.query_one("#terminal-content", Static)
-            content.update(self._content)
-            self.scroll_end(animate=False)
+            self._spill_evicted(data.count("\n"))
+            self._log.write(data)
+            self._partial_line = not data.endswith("\n")
         except Exception as e:
             print(f"终端写入错误: {str(e)}")
 
+    def _spill_evicted(self, new_lines: int):
+        """把即将被环形缓冲淘汰的行写入溢出文件"""
+        if not self.spill_path or not self.scrollback:
+            return
+        overflow = self._log.line_count + new_lines - self.scrollback
+        if overflow <= 0:
+            return
+        evicted = self._log.lines[:overflow]
+        try:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(evicted) + "\n")
+        except OSError as e:
+            print(f"终端溢出写入错误: {str(e)}")
+
 
 from textual.widgets import Input, Button, Label, Static
 from pathlib import Path
@@ -433,6 +623,15 @@ class CodeAgentConsole(App):
         padding: 0;
     }
     
+    TerminalView {
+        height: 1fr;
+    }
+    
+    #terminal-log {
+        height: 1fr;
+        background: $panel;
+    }
+    
     /* 编辑器标签样式 */
     .tabs-bar {
         background: $boost;
@@ -492,12 +691,20 @@ class CodeAgentConsole(App):
         overflow: auto;
     }
     
-    .chat-content {
-        padding: 1 2;
+    .chat-message {
+        padding: 1 2 0 2;
         height: auto;
         width: 100%;
     }
     
+    .load-earlier {
+        width: 100%;
+        height: auto;
+        min-height: 1;
+        border: none;
+        background: $boost;
+    }
+    
     .chat-footer {
         background: $boost;
         border-top: solid $accent;
@@ -531,10 +738,15 @@ class CodeAgentConsole(App):
     _coding_agent: CompiledStateGraph
 
     _is_generating = False
+    _streaming_tool_call_id = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._coding_agent = create_code_agent()
+        # 代理在 _init_agent 中异步创建（需要先加载MCP工具和检查点存储）
+        self._agent_ready = asyncio.Event()
+        self._checkpointer = None
+        self._mcp_loader = None
+        self.thread_id = None
 
     @property
     def is_generating(self) -> bool:
@@ -583,160 +795,45 @@ class CodeAgentConsole(App):
         editor_tabs = self.query_one("#editor-tabs", EditorTabs)
         editor_tabs.open_welcome()
 
-        # 初始化代理并加载工具
-        asyncio.create_task(self._init_agent())
-        
-    async def handle_tool_result(self, tool_name: str, tool_result: str, tool_call_id=None):
-        """处理工具执行结果"""
-        # 先获取终端视图用于后续日志输出
-        terminal_view = None
-        try:
-            # 确保从根组件获取终端视图，而不是在EditorTabs内部查找
-            if hasattr(self, "app") and self.app:
-                terminal_view = self.app.query_one("#terminal-view", TerminalView)
-            else:
-                # 尝试直接从当前组件获取（如果当前是根组件）
-                terminal_view = self.query_one("#terminal-view", TerminalView)
-        except Exception as e:
-            # 如果获取终端视图失败，仍然继续处理逻辑
-            print(f"获取终端视图失败: {str(e)}")
-        
-        # 记录接收到工具结果的日志
-        if terminal_view:
-            terminal_view.write(f"处理工具调用结果 - 工具名: {tool_name}")
+        # 界面完成首次绘制后再在后台初始化代理并加载工具
+        self.call_after_refresh(lambda: asyncio.create_task(self._init_agent()))
         
-        if tool_name == "text_editor":
-            # 解析text_editor工具的结果
-            import re
-            if terminal_view:
-                terminal_view.write(f"tool result是: {tool_result}")
-                        
-            # 优化的正则表达式，更健壮地匹配Windows文件路径
-            # 支持盘符、反斜杠和各种路径格式
-            view_match = re.search(r'Here\'s the result of running.*?on\s+((?:[a-zA-Z]:)?(?:[\\/][^\\/:\n]+)*[\\/]?[^\\/:\n]*):', tool_result)
-            if view_match:
-                file_path = view_match.group(1).strip()
-                
-                # 移除可能的引号和反斜杠转义
-                if (file_path.startswith('"') and file_path.endswith('"')) or (file_path.startswith("'") and file_path.endswith("'")):
-                    file_path = file_path[1:-1]
-                
-                # 规范化路径分隔符，处理Windows路径格式
-                file_path = file_path.replace('\\', '/')
-                
-                # 确保文件路径存在
-                from pathlib import Path
-                path_obj = Path(file_path)
-                
-                # 尝试处理相对路径，相对于当前工作目录
-                if not path_obj.is_absolute():
-                    path_obj = Path.cwd() / path_obj
-                    if terminal_view:
-                        terminal_view.write(f"转换相对路径为绝对路径: {path_obj}")
-                
-                # 记录解析后的文件路径信息
-                if terminal_view:
-                    terminal_view.write(f"解析后的文件路径: {path_obj}")
-                    terminal_view.write(f"路径是否绝对路径: {path_obj.is_absolute()}")
-                    terminal_view.write(f"路径是否存在: {path_obj.exists()}")
-                    terminal_view.write(f"是否为文件: {path_obj.is_file()}")
-                
-                if not path_obj.exists() or not path_obj.is_file():
-                    # 记录日志
-                    if terminal_view:
-                        terminal_view.write(f"文件不存在或不是有效文件，尝试直接从输出中提取内容: {file_path}")
-                        
-                    # 尝试直接从tool_result中提取文件内容
-                    content_match = re.search(r'```\n(.*?)```', tool_result, re.DOTALL)
-                    if content_match:
-                        raw_content = content_match.group(1)
-                        
-                        # 记录提取到内容的日志
-                        if terminal_view:
-                            terminal_view.write(f"成功从输出中提取到文件内容，长度: {len(raw_content)} 字符")
-                        
-                        # 直接更新编辑器内容，而不依赖文件存在
-                        try:
-                            editor_tabs = self.query_one("#editor-tabs", EditorTabs)
-                            editor_tabs._current_file = str(path_obj)
-                            editor_tabs._open_files[str(path_obj)] = raw_content
-                            
-                            # 更新显示
-                            editor_content = editor_tabs.query_one("#editor-content", Static)
-                            editor_content.update(raw_content)
-                            
-                            # 更新标签栏和状态栏
-                            editor_tabs._update_tabs_bar()
-                            editor_tabs.update_status_bar(f"已查看: {path_obj.name}")
-                        except Exception as e:
-                            if terminal_view:
-                                terminal_view.write(f"更新编辑器内容时出错: {str(e)}")
-                    else:
-                        if terminal_view:
-                            terminal_view.write(f"未能从输出中提取到内容块")
-                else:
-                    # 文件存在，使用open_file方法打开
-                    if terminal_view:
-                        terminal_view.write(f"文件存在且有效，使用open_file方法打开: {file_path}")
-                    
-                    try:
-                        editor_tabs = self.query_one("#editor-tabs", EditorTabs)
-                        editor_tabs.open_file(str(path_obj))
-                    except Exception as e:
-                        if terminal_view:
-                            terminal_view.write(f"调用open_file方法时出错: {str(e)}")
-            else:
-                # 尝试其他命令的结果格式（create, str_replace, insert）
-                # 尝试多种格式匹配文件路径
-                path_patterns = [
-                    r'Successfully replaced .*? occurrences in (.*?)\.',
-                    r'Successfully inserted text at line .*? in (.*?)\.',
-                    r'File successfully created at (.*?)\.',
-                    r'File does not exist: (.*?)\.',
-                    r'Path is not a file: (.*?)\.',
-                    r'Error: the path (.*?) is a directory\.'
-                ]
-                
-                file_path = None
-                for pattern in path_patterns:
-                    path_match = re.search(pattern, tool_result)
-                    if path_match:
-                        file_path = path_match.group(1).strip()
-                        # 移除可能的引号
-                        if file_path.startswith('"') and file_path.endswith('"') or file_path.startswith("'") and file_path.endswith("'"):
-                            file_path = file_path[1:-1]
-                        break
-                
-                # 如果是创建或修改文件操作，尝试重新打开文件以显示最新内容
-                if file_path and any(cmd in tool_result.lower() for cmd in ['created', 'replaced', 'inserted']):
-                    if terminal_view:
-                        terminal_view.write(f"检测到文件创建或修改操作，尝试重新打开文件: {file_path}")
-                    
-                    try:
-                        editor_tabs = self.query_one("#editor-tabs", EditorTabs)
-                        # 如果当前正在查看该文件，则重新打开以显示最新内容
-                        if file_path in editor_tabs._open_files or file_path == editor_tabs._current_file:
-                            editor_tabs.open_file(file_path)
-                            if terminal_view:
-                                terminal_view.write(f"成功重新打开文件显示最新内容")
-                    except Exception as e:
-                        if terminal_view:
-                            terminal_view.write(f"重新打开文件时出错: {str(e)}")
-        
-        # 将结果写入到终端视图
-        try:
-            if terminal_view:
-                terminal_view.write(f"$ {tool_name} 命令执行结果:\n{tool_result}\n", is_result=True)
-        except Exception as e:
-            # 最后的错误处理，如果terminal_view对象存在但写入失败
-            pass
-        
-        # 将结果添加到聊天视图
-        chat_view = self.query_one("#chat-view", ChatView)
-        chat_view.add_message(ToolMessage(content=tool_result))
-    
-    # 确保覆盖了所有text_editor命令的处理
-    # 如果是其他命令（create, str_replace, insert），我们已经在修改后的代码中包含了文件路径检查逻辑
+    async def handle_tool_result(self, tool_name: str, tool_result: str, artifact: Optional[dict] = None):
+        """处理工具执行结果
+
+        根据工具返回的结构化附件（ToolMessage.artifact）直接分派，不再解析结果文本。
+        """
+        artifact = artifact or {}
+        terminal_view = self.query_one("#terminal-view", TerminalView)
+        terminal_view.write(f"处理工具调用结果 - 工具名: {tool_name}")
+
+        if tool_name == "text_editor" and not artifact.get("is_error"):
+            self._sync_editor_with_artifact(artifact)
+
+        # 将结果写入到终端视图（bash的输出已经实时写入，只记录退出状态）
+        if tool_name == "bash" and "return_code" in artifact:
+            terminal_view.write(
+                f"$ bash 命令执行完成: 退出码 {artifact['return_code']}, 耗时 {artifact.get('duration_ms', 0)}ms",
+                is_result=True,
+            )
+        else:
+            terminal_view.write(f"$ {tool_name} 命令执行结果:\n{tool_result}\n", is_result=True)
+
+    def _sync_editor_with_artifact(self, artifact: dict) -> None:
+        """在编辑器中打开查看的文件，或刷新被修改的已打开文件"""
+        file_path = artifact.get("path")
+        command = artifact.get("command")
+        if not file_path:
+            return
+        editor_tabs = self.query_one("#editor-tabs", EditorTabs)
+        if command == "view":
+            # 查看目录时不打开编辑器
+            if Path(file_path).is_file():
+                editor_tabs.open_file(file_path)
+        elif command in ("create", "str_replace", "insert"):
+            # 如果当前正在查看该文件，则重新打开以显示最新内容
+            if file_path in editor_tabs._open_files or file_path == editor_tabs._current_file:
+                editor_tabs.open_file(file_path)
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
         if not self.is_generating and event.input.id == "chat-input":
@@ -746,6 +843,11 @@ class CodeAgentConsole(App):
                     self.exit()
                     return
                 event.input.value = ""
+                if user_input.startswith("/"):
+                    self._handle_command(user_input)
+                    return
+                from langchain.messages import HumanMessage
+
                 user_message = HumanMessage(content=user_input)
                 self._handle_user_input(user_message)
 
@@ -753,43 +855,142 @@ class CodeAgentConsole(App):
         terminal_view = self.query_one("#terminal-view", TerminalView)
         terminal_view.write("$ 正在加载工具...")
         try:
-            # 初始化代码代理并加载工具
-            from src.tools.ls import ls_tool
-            from src.tools.grep import grep_tool
-            from src.tools.tree import tree_tool
-            
-            # 创建工具列表
-            tools = [bash_tool, text_editor_tool, ls_tool, grep_tool, tree_tool]
-            
-            # 初始化代码代理
-            terminal_view.write("$ 加载 MCP tools...")
-            mcp_tools = await load_mcp()
-            tool_count = len(mcp_tools)
-            if tool_count > 0:
-                terminal_view.write(f"- 已加载 MCP tools: {tool_count}\n", True)
+            # 在后台线程中导入代理相关的模块，避免阻塞界面
+            start_time = time.perf_counter()
+            await asyncio.to_thread(_import_deferred_modules)
+            terminal_view.write(f"- 已导入代理模块（{(time.perf_counter() - start_time) * 1000:.0f} ms）\n", True)
+
+            from src.agents.checkpoint import DEFAULT_THREAD_ID, create_checkpointer, latest_thread
+            from src.agents.code_agent import create_code_agent
+            from src.mcp.load_mcp import MCPToolLoader
+
+            self.thread_id = DEFAULT_THREAD_ID
+            self._checkpointer = await create_checkpointer()
+
+            # MCP服务器在后台并发连接，先使用磁盘缓存中的工具定义创建代理，
+            # 服务器就绪后再用最新的工具重建代理
+            self._mcp_loader = MCPToolLoader(on_update=self._on_mcp_tools_updated)
+            mcp_tools = self._mcp_loader.start()
+            if self._mcp_loader.servers:
+                terminal_view.write(
+                    f"- 使用缓存的 MCP tools: {len(mcp_tools)}，正在后台连接 {len(self._mcp_loader.servers)} 个 MCP 服务器\n",
+                    True,
+                )
             else:
                 terminal_view.write(f"- 没有找到 MCP tools\n", True)
-            self._coding_agent = create_code_agent(plugin_tools=mcp_tools)
+            self._coding_agent = create_code_agent(plugin_tools=mcp_tools, checkpointer=self._checkpointer)
             terminal_view.write("- 已加载基础工具：bash, text_editor, ls, grep, tree\n", True)
+
+            # 恢复最近一次的对话
+            thread_id = await latest_thread(self._checkpointer)
+            if thread_id:
+                await self._switch_thread(thread_id)
         except Exception as e:
             terminal_view.write(f"错误：无法加载工具 - {str(e)}")
             import traceback
             print(f"详细错误信息：\n{traceback.format_exc()}")
+            if not hasattr(self, "_coding_agent"):
+                try:
+                    from src.agents.code_agent import create_code_agent
+
+                    self._coding_agent = create_code_agent(checkpointer=self._checkpointer)
+                except Exception as e:
+                    terminal_view.write(f"错误：无法创建代理 - {str(e)}")
+        finally:
+            self._agent_ready.set()
+
+    def _on_mcp_tools_updated(self, mcp_tools: list) -> None:
+        """有MCP服务器加载完成时用最新的工具重建代理，正在进行的对话不受影响"""
+        from src.agents.code_agent import create_code_agent
+
+        self._coding_agent = create_code_agent(plugin_tools=mcp_tools, checkpointer=self._checkpointer)
+        terminal_view = self.query_one("#terminal-view", TerminalView)
+        terminal_view.write(f"- 已加载 MCP tools: {len(mcp_tools)}", True)
+        for name, status in self._mcp_loader.status.items():
+            terminal_view.write(f"  {name}: {status}", True)
+
+    async def _switch_thread(self, thread_id: str) -> None:
+        """切换到指定的对话线程，并在聊天视图中显示其历史消息"""
+        self.thread_id = thread_id
+        state = await self._coding_agent.aget_state({"configurable": {"thread_id": thread_id}})
+        messages = state.values.get("messages", []) if state and state.values else []
+        self.query_one("#chat-view", ChatView).load_history(messages)
+        self.sub_title = f"{Path.cwd()} [{thread_id}]"
+        self.query_one("#terminal-view", TerminalView).write(
+            f"$ 当前对话: {thread_id}（{len(messages)} 条历史消息）"
+        )
+
+    @work(exclusive=True, thread=False, group="command")
+    async def _handle_command(self, command: str) -> None:
+        """处理对话管理命令：/threads 列出对话，/thread <名称> 切换或新建对话，/new 新建对话，/mcp 查看MCP服务器状态，/cache 查看响应缓存命中情况"""
+        await self._agent_ready.wait()
+        terminal_view = self.query_one("#terminal-view", TerminalView)
+        name, _, argument = command.partition(" ")
+        argument = argument.strip()
+        from src.agents.checkpoint import list_threads
+        from src.models.response_cache import get_response_cache
+
+        if name == "/threads":
+            threads = await list_threads(self._checkpointer) if self._checkpointer else []
+            lines = [f"{'*' if t == self.thread_id else ' '} {t}" for t in threads] or ["（没有保存的对话）"]
+            terminal_view.write("$ 对话列表:\n" + "\n".join(lines))
+        elif name == "/thread" and argument:
+            await self._switch_thread(argument)
+        elif name == "/new":
+            await self._switch_thread(argument or time.strftime("thread-%Y%m%d-%H%M%S"))
+        elif name == "/mcp":
+            statuses = self._mcp_loader.status if self._mcp_loader else {}
+            metrics = self._mcp_loader.pool.summary() if self._mcp_loader else {}
+            lines = [
+                f"  {server}: {status}" + (f"\n    {metrics[server]}" if server in metrics else "")
+                for server, status in statuses.items()
+            ] or ["（没有配置 MCP 服务器）"]
+            terminal_view.write("$ MCP 服务器:\n" + "\n".join(lines))
+        elif name == "/cache":
+            cache = get_response_cache(get_config_section(["models", "chat_model", "cache"]))
+            if cache is None:
+                terminal_view.write("$ 响应缓存未开启（models.chat_model.cache.enabled）")
+            else:
+                stats = cache.stats()
+                terminal_view.write(
+                    f"$ 响应缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，"
+                    f"命中率 {stats['hit_ratio']:.0%}，共 {stats['entries']} 条"
+                )
+        else:
+            terminal_view.write("用法: /threads | /thread <名称> | /new [名称] | /mcp | /cache")
+
+    async def on_unmount(self) -> None:
+        if self._mcp_loader is not None:
+            await self._mcp_loader.stop()
+        if self._checkpointer is not None:
+            from src.agents.checkpoint import close_checkpointer
+
+            await close_checkpointer(self._checkpointer)
 
     @work(exclusive=True, thread=False)
     async def _handle_user_input(self, user_message: HumanMessage) -> None:
         self._process_outgoing_message(user_message)
         self.is_generating = True
+        await self._agent_ready.wait()
         
         # 添加简单的加载动画
         loading_task = asyncio.create_task(self._show_loading_animation())
         
         try:
-            async for chunk in self._coding_agent.astream(
+            async for mode, chunk in self._coding_agent.astream(
                 {"messages": [user_message]},
-                stream_mode="updates",
-                config={"recursion_limit": 100, "thread_id": "thread_1"},
+                stream_mode=["updates", "messages", "custom"],
+                config={"recursion_limit": 100, "thread_id": self.thread_id},
             ):
+                if mode == "messages":
+                    # 模型输出的增量token，实时显示在正在生成的AI消息中
+                    message_chunk, _ = chunk
+                    self._process_message_chunk(message_chunk)
+                    continue
+                if mode == "custom":
+                    # 工具在执行过程中发送的自定义事件（如bash的实时输出）
+                    self._process_custom_event(chunk)
+                    continue
                 roles = chunk.keys() if hasattr(chunk, 'keys') else []
                 for role in roles:
                     if hasattr(chunk[role], 'get'):
@@ -797,9 +998,20 @@ class CodeAgentConsole(App):
                         for message in messages:
                             self._process_incoming_message(message)
         except Exception as e:
+            from langchain.messages import AIMessage
+
             error_message = f"处理请求时出错：{str(e)}"
             self.query_one("#chat-view", ChatView).add_message(AIMessage(content=error_message))
         finally:
+            self.query_one("#chat-view", ChatView).end_streams()
+            if self._checkpointer is not None:
+                # 压缩当前对话的旧检查点，只保留最近的若干个
+                from src.agents.checkpoint import compact_thread
+
+                try:
+                    await compact_thread(self._checkpointer, self.thread_id)
+                except Exception as e:
+                    print(f"压缩检查点时出错: {str(e)}")
             # 取消加载动画任务
             loading_task.cancel()
             try:
@@ -824,6 +1036,46 @@ class CodeAgentConsole(App):
         except asyncio.CancelledError:
             pass
 
+    def _process_message_chunk(self, message) -> None:
+        # 只显示模型生成的文本片段，完整的工具消息等仍然通过updates处理
+        if getattr(message, "type", None) != "AIMessageChunk":
+            return
+        delta = message.content if isinstance(message.content, str) else message.text
+        if delta:
+            chat_view = self.query_one("#chat-view", ChatView)
+            chat_view.append_stream(message.id, delta)
+
+    def _process_custom_event(self, event) -> None:
+        if not isinstance(event, dict):
+            return
+        if event.get("type") == "tool_output":
+            terminal_view = self.query_one("#terminal-view", TerminalView)
+            # 新的工具调用的输出从新的一行开始
+            if event.get("tool_call_id") != self._streaming_tool_call_id:
+                self._streaming_tool_call_id = event.get("tool_call_id")
+                terminal_view.end_partial_line()
+            terminal_view.append(event.get("text", ""))
+        elif event.get("type") == "context_budget":
+            terminal_view = self.query_one("#terminal-view", TerminalView)
+            terminal_view.write(
+                f"[上下文] 裁剪历史节省 {event.get('saved', 0)} tokens "
+                f"({event.get('tokens_before', 0)} -> {event.get('tokens_after', 0)})"
+            )
+        elif event.get("type") == "usage":
+            terminal_view = self.query_one("#terminal-view", TerminalView)
+            terminal_view.write(
+                f"[用量] 输入 {event.get('input_tokens', 0)} tokens"
+                f"（缓存命中 {event.get('cached_tokens', 0)}，{event.get('cached_ratio', 0):.0%}），"
+                f"输出 {event.get('output_tokens', 0)} tokens，本次会话缓存命中率 {event.get('total_cached_ratio', 0):.0%}"
+            )
+        elif event.get("type") == "tool_cache" and event.get("hit"):
+            terminal_view = self.query_one("#terminal-view", TerminalView)
+            terminal_view.write(
+                f"[工具缓存] {event.get('tool')} 命中缓存，命中率 {event.get('hit_rate', 0):.0%}"
+                f"（{event.get('hits', 0)}/{event.get('hits', 0) + event.get('misses', 0)}，"
+                f"失效 {event.get('invalidations', 0)} 条）"
+            )
+
     def _process_outgoing_message(self, message: HumanMessage) -> None:
         chat_view = self.query_one("#chat-view", ChatView)
         chat_view.add_message(message)
@@ -831,9 +1083,9 @@ class CodeAgentConsole(App):
     def _process_incoming_message(self, message: AnyMessage) -> None:
         chat_view = self.query_one("#chat-view", ChatView)
         chat_view.add_message(message)
-        if isinstance(message, AIMessage) and hasattr(message, 'tool_calls') and message.tool_calls:
+        if message.type == "ai" and getattr(message, 'tool_calls', None):
             self._process_tool_call_message(message)
-        if isinstance(message, ToolMessage):
+        if message.type == "tool":
             self._process_tool_message(message)
 
     _terminal_tool_calls: list[str] = []
@@ -854,99 +1106,15 @@ class CodeAgentConsole(App):
         
     async def _call_handle_tool_result(self, message: ToolMessage):
         """异步调用handle_tool_result的包装方法"""
-        # 获取终端视图用于日志输出
-        terminal_view = None
-        try:
-            if hasattr(self, "app") and self.app:
-                terminal_view = self.app.query_one("#terminal-view", TerminalView)
-            else:
-                terminal_view = self.query_one("#terminal-view", TerminalView)
-        except Exception as e:
-            print(f"获取终端视图失败: {str(e)}")
-        
         try:
-            # 记录调用开始的日志
-            if terminal_view:
-                terminal_view.write(f"开始处理工具消息: {message.__class__.__name__}")
-                terminal_view.write(f"消息内容预览: {message.content[:50]}...")
-            
-            # 提取工具名称并调用handle_tool_result
-            tool_name = "unknown_tool"
-            
-            # 尝试从消息结构中直接获取工具名称（如果可用）
-            if hasattr(message, 'name'):
-                tool_name = message.name
-                if terminal_view:
-                    terminal_view.write(f"从message.name获取工具名称: {tool_name}")
-            elif hasattr(message, 'tool_call_id'):
-                # 如果有tool_call_id，可能需要其他方式获取工具名称
-                if terminal_view:
-                    terminal_view.write(f"消息包含tool_call_id: {message.tool_call_id}")
-            elif hasattr(message, 'additional_kwargs'):
-                # 尝试从additional_kwargs获取
-                if 'name' in message.additional_kwargs:
-                    tool_name = message.additional_kwargs['name']
-                    if terminal_view:
-                        terminal_view.write(f"从additional_kwargs获取工具名称: {tool_name}")
-            
-            # 如果仍然未知，尝试从内容中提取
-            if tool_name == "unknown_tool":
-                # 尝试从消息内容中提取工具名称
-                import re
-                tool_match = re.search(r'\$ (\w+) 命令执行结果:', message.content)
-                if tool_match:
-                    tool_name = tool_match.group(1)
-                    if terminal_view:
-                        terminal_view.write(f"从内容中提取工具名称: {tool_name}")
-                elif "text_editor" in message.content:
-                    tool_name = "text_editor"
-                    if terminal_view:
-                        terminal_view.write(f"检测到text_editor内容")
-                elif "bash" in message.content:
-                    tool_name = "bash"
-                    if terminal_view:
-                        terminal_view.write(f"检测到bash内容")
-                elif "ls" in message.content:
-                    tool_name = "ls"
-                    if terminal_view:
-                        terminal_view.write(f"检测到ls内容")
-                elif "grep" in message.content:
-                    tool_name = "grep"
-                    if terminal_view:
-                        terminal_view.write(f"检测到grep内容")
-                elif "tree" in message.content:
-                    tool_name = "tree"
-                    if terminal_view:
-                        terminal_view.write(f"检测到tree内容")
-            
-            # 提取tool_call_id（如果存在）
-            tool_call_id = getattr(message, 'tool_call_id', None)
-            if tool_call_id is None and hasattr(message, 'additional_kwargs'):
-                tool_call_id = message.additional_kwargs.get('tool_call_id')
-            
-            # 记录即将调用handle_tool_result
-            if terminal_view:
-                terminal_view.write(f"准备调用handle_tool_result，工具名称: {tool_name}, tool_call_id: {tool_call_id}")
-            
-            # 调用handle_tool_result方法
-            await self.handle_tool_result(tool_name, message.content, tool_call_id)
-            
-            # 记录调用成功
-            if terminal_view:
-                terminal_view.write(f"handle_tool_result调用成功完成")
-                
+            artifact = message.artifact if isinstance(message.artifact, dict) else {}
+            tool_name = message.name or artifact.get("tool") or "unknown_tool"
+            await self.handle_tool_result(tool_name, message.content, artifact)
         except Exception as e:
-            # 记录详细的错误信息
             error_message = f"调用handle_tool_result时出错: {str(e)}"
             print(error_message)
             import traceback
             print(f"详细错误堆栈:\n{traceback.format_exc()}")
-            
-            # 在终端视图中显示错误
-            # if terminal_view:
-            #     terminal_view.write(error_message, is_result=True)
-            #     terminal_view.write(f"错误类型: {type(e).__name__}", is_result=True)
-            #     terminal_view.write(f"错误堆栈预览: {str(traceback.format_exc()).splitlines()[0]}", is_result=True)
 
 def main():
     """主入口函数"""
@@ -1,5 +1,4 @@
 import os
-import yaml
 
 __local_config = None
 
@@ -18,14 +17,16 @@ def load_config():
         if config_file is None:
             raise FileNotFoundError('config.yaml not found in any expected location')
         
+        import yaml
+
         # 明确使用UTF-8编码打开文件，避免在Windows上使用默认的gbk编码
         with open(config_file, "r", encoding="utf-8") as f:
             __local_config = yaml.safe_load(f)
     return __local_config
 
 def get_config_section(key: str | list[str]) -> dict | None:
-    global __local_config
-    section = __local_config
+    # 第一次读取配置时才加载config.yaml，导入本模块不产生IO
+    section = load_config()
     path = []
     if isinstance(key, str):
         path.append(key)
@@ -36,5 +37,3 @@ def get_config_section(key: str | list[str]) -> dict | None:
             return None
         section = section[key]
     return section
-
-load_config()
\ No newline at end of file
@@ -1,11 +1,192 @@
-from src.config.config import get_config_section
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.tools import BaseTool
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp import ClientSession
+from mcp.types import Tool as MCPTool
+
+from src.config.config import get_config_section
+from .session_pool import MCPSessionPool
+
+# 各服务器工具定义的磁盘缓存，启动时先用缓存的工具，不必等待连接
+MCP_CACHE_PATH = os.path.join(".code_agent", "mcp_tools.json")
+
+# 单个服务器连接并列出工具的默认超时（秒），可在服务器配置中用 connect_timeout 覆盖
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# 连接失败后后台重试的次数和首次重试的等待时间（之后每次翻倍）
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 5.0
+
+# 服务器配置中只供加载器使用、不传给MCP客户端的字段
+_LOADER_KEYS = ("connect_timeout", "pool_size", "keepalive_interval")
+
+
+def _connections(servers: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {key: value for key, value in config.items() if key not in _LOADER_KEYS}
+        for name, config in servers.items()
+    }
+
+
+def _fingerprint(connection: Dict[str, Any]) -> str:
+    """服务器配置的指纹，配置变化后缓存的工具定义失效"""
+    return hashlib.sha256(json.dumps(connection, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _read_cache() -> Dict[str, Any]:
+    try:
+        with open(MCP_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache: Dict[str, Any]) -> None:
+    try:
+        os.makedirs(os.path.dirname(MCP_CACHE_PATH), exist_ok=True)
+        tmp_path = MCP_CACHE_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, MCP_CACHE_PATH)
+    except OSError as e:
+        print(f"写入MCP工具缓存失败: {str(e)}")
+
+
+async def _list_all_tools(session: ClientSession) -> List[MCPTool]:
+    tools: List[MCPTool] = []
+    cursor = None
+    while True:
+        page = await session.list_tools(cursor=cursor)
+        tools.extend(page.tools)
+        cursor = page.nextCursor
+        if not cursor:
+            return tools
+
 
-async def load_mcp():
+class MCPToolLoader:
+    """并发连接各MCP服务器并加载工具。
+
+    - 每个服务器单独连接，有各自的超时，一个服务器慢或不可达不影响其他服务器；
+    - 启动时先返回磁盘缓存中的工具定义，工具被调用时才连接服务器，代理可以立即使用；
+    - 工具调用通过会话池（MCPSessionPool）复用每个服务器的长期会话；
+    - 连接成功后用最新的工具定义替换缓存并写回磁盘，失败的服务器在后台按指数退避重试；
+    - 每次有服务器的工具变化时调用 on_update(全部工具)，由调用方重建代理。
+    """
+
+    def __init__(
+            self,
+            servers: Optional[Dict[str, Dict[str, Any]]] = None,
+            on_update: Optional[Callable[[List[BaseTool]], None]] = None,
+            retries: int = DEFAULT_RETRIES,
+            retry_delay: float = DEFAULT_RETRY_DELAY,
+    ):
+        if servers is None:
+            servers = get_config_section(["tools", "mcp_servers"]) or {}
+        self.servers = servers
+        self.connections = _connections(servers)
+        self.client = MultiServerMCPClient(self.connections)
+        # 列出工具和调用工具都使用会话池中的长期会话，避免每次调用重新握手
+        self.pool = MCPSessionPool(self.client, servers)
+        self.on_update = on_update
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # 各服务器当前的工具和状态（cached / connecting / ready / failed: ...）
+        self.tools: Dict[str, List[BaseTool]] = {}
+        self.status: Dict[str, str] = {name: "pending" for name in servers}
+        self._cache = _read_cache()
+        self._tasks: List[asyncio.Task] = []
+
+    def _convert(self, name: str, mcp_tools: List[MCPTool]) -> List[BaseTool]:
+        session = self.pool.proxy(name)
+        return [convert_mcp_tool_to_langchain_tool(session, tool) for tool in mcp_tools]
+
+    def all_tools(self) -> List[BaseTool]:
+        return [tool for name in self.servers for tool in self.tools.get(name, [])]
+
+    def load_cached(self) -> List[BaseTool]:
+        """从磁盘缓存加载配置未变化的服务器的工具定义"""
+        for name, connection in self.connections.items():
+            entry = self._cache.get(name)
+            if not entry or entry.get("fingerprint") != _fingerprint(connection):
+                continue
+            try:
+                self.tools[name] = self._convert(name, [MCPTool.model_validate(t) for t in entry["tools"]])
+                self.status[name] = "cached"
+            except Exception as e:
+                print(f"MCP工具缓存无效（{name}）: {str(e)}")
+        return self.all_tools()
+
+    async def _fetch(self, name: str) -> List[MCPTool]:
+        return await _list_all_tools(await self.pool.session(name))
+
+    async def load_server(self, name: str) -> bool:
+        """连接单个服务器并刷新其工具，返回是否成功"""
+        timeout = self.servers[name].get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)
+        self.status[name] = "connecting"
+        start_time = time.perf_counter()
+        try:
+            mcp_tools = await asyncio.wait_for(self._fetch(name), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.status[name] = f"failed: timed out after {timeout}s"
+            return False
+        except Exception as e:
+            self.status[name] = f"failed: {type(e).__name__}: {e}"
+            return False
+
+        self.tools[name] = self._convert(name, mcp_tools)
+        self.status[name] = f"ready ({len(mcp_tools)} tools, {(time.perf_counter() - start_time) * 1000:.0f} ms)"
+        self._cache[name] = {
+            "fingerprint": _fingerprint(self.connections[name]),
+            "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in mcp_tools],
+        }
+        _write_cache(self._cache)
+        if self.on_update:
+            self.on_update(self.all_tools())
+        return True
+
+    async def _load_with_retry(self, name: str) -> None:
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            if await self.load_server(name):
+                return
+            if attempt < self.retries:
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def load_all(self, retry: bool = False) -> List[BaseTool]:
+        """并发加载所有服务器，等待全部完成（成功、超时或失败）后返回已加载的工具"""
+        load = self._load_with_retry if retry else self.load_server
+        await asyncio.gather(*(load(name) for name in self.servers))
+        return self.all_tools()
+
+    def start(self) -> List[BaseTool]:
+        """返回缓存中的工具，并在后台连接所有服务器（失败时重试）"""
+        tools = self.load_cached()
+        self._tasks = [asyncio.create_task(self._load_with_retry(name)) for name in self.servers]
+        return tools
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.pool.close_all()
+
+
+async def load_mcp() -> List[BaseTool]:
+    """并发加载所有MCP服务器的工具，不可达或超时的服务器被跳过（回退到缓存的工具定义）。
+
+    返回的工具使用的会话在进程退出前一直保持，需要关闭会话时直接使用 MCPToolLoader。
+    """
     servers = get_config_section(["tools", "mcp_servers"])
     if not servers:
         return []
-    client = MultiServerMCPClient(servers)
-    return await client.get_tools()
-
-
+    loader = MCPToolLoader(servers)
+    loader.load_cached()
+    return await loader.load_all()
@@ -0,0 +1,235 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import anyio
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp import ClientSession
+
+# 每个服务器默认保持的会话数，MCP会话本身支持并发请求，一般一个就够
+DEFAULT_POOL_SIZE = 1
+# 空闲会话发送ping保活的间隔（秒），0表示不保活
+DEFAULT_KEEPALIVE_INTERVAL = 30.0
+# ping的超时时间（秒）
+_PING_TIMEOUT = 10.0
+# 每个服务器保留的最近调用延迟数
+_LATENCY_WINDOW = 1000
+
+# 这些异常说明会话的连接已经断开，可以重新连接后重试
+_CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, ConnectionError)
+
+
+class _PooledSession:
+    """一个长期保持的MCP会话。
+
+    MCP客户端的会话是基于anyio的上下文管理器，必须在同一个任务中进入和退出，
+    因此由一个专门的任务持有会话，直到 close() 被调用或连接断开。
+    """
+
+    def __init__(self, client: MultiServerMCPClient, server: str):
+        self.client = client
+        self.server = server
+        self.session: Optional[ClientSession] = None
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._hold())
+        try:
+            await self._ready.wait()
+        except asyncio.CancelledError:
+            # 等待连接时被取消（如连接超时），同时终止正在建立的连接
+            self._task.cancel()
+            raise
+        if not self.alive:
+            raise ConnectionError(f"无法连接MCP服务器 {self.server}: {self._error}")
+
+    async def _hold(self) -> None:
+        try:
+            async with self.client.session(self.server) as session:
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def close(self) -> None:
+        self._closing.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class ServerMetrics:
+    """单个服务器的调用统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.connect_ms: List[float] = []
+        self.latencies_ms: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies_ms)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "connect_ms": round(statistics.mean(self.connect_ms), 1) if self.connect_ms else None,
+            "p50_ms": round(ordered[len(ordered) // 2], 1) if ordered else None,
+            "p95_ms": round(ordered[int(len(ordered) * 0.95)], 1) if ordered else None,
+        }
+
+
+class SessionProxy:
+    """代替固定的ClientSession传给langchain-mcp-adapters，工具调用经过会话池转发"""
+
+    def __init__(self, pool: "MCPSessionPool", server: str):
+        self._pool = pool
+        self._server = server
+
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        return await self._pool.call_tool(self._server, name, arguments, **kwargs)
+
+
+class MCPSessionPool:
+    """按服务器复用MCP会话的会话池。
+
+    - 每个服务器最多保持 pool_size 个长期会话，工具调用选择正在处理请求最少的会话，
+      不必为每次调用重新握手；
+    - 空闲会话定期发送ping保活，ping失败或调用时发现连接断开会重新连接，
+      连接断开导致的调用失败会在新会话上重试一次；
+    - 记录每个服务器的连接耗时、调用延迟、错误数和重连次数。
+    会话与创建它的事件循环绑定。
+    """
+
+    def __init__(
+            self,
+            client: MultiServerMCPClient,
+            settings: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.client = client
+        self.settings = settings or {}
+        self.metrics: Dict[str, ServerMetrics] = {}
+        self._sessions: Dict[str, List[_PooledSession]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._keepalive_tasks: Dict[str, asyncio.Task] = {}
+
+    def _setting(self, server: str, key: str, default: Any) -> Any:
+        return self.settings.get(server, {}).get(key, default)
+
+    def _server_metrics(self, server: str) -> ServerMetrics:
+        return self.metrics.setdefault(server, ServerMetrics())
+
+    async def _connect(self, server: str) -> _PooledSession:
+        metrics = self._server_metrics(server)
+        start_time = time.perf_counter()
+        pooled = _PooledSession(self.client, server)
+        await pooled.start()
+        metrics.connect_ms.append((time.perf_counter() - start_time) * 1000)
+        if metrics.connects:
+            metrics.reconnects += 1
+        metrics.connects += 1
+        return pooled
+
+    async def acquire(self, server: str) -> _PooledSession:
+        """返回一个可用的会话：优先复用空闲会话，全部繁忙且未达上限时新建"""
+        lock = self._locks.setdefault(server, asyncio.Lock())
+        async with lock:
+            sessions = [s for s in self._sessions.get(server, []) if s.alive]
+            self._sessions[server] = sessions
+            pool_size = self._setting(server, "pool_size", DEFAULT_POOL_SIZE)
+            idle = [s for s in sessions if s.in_flight == 0]
+            if idle or len(sessions) >= pool_size:
+                return min(idle or sessions, key=lambda s: s.in_flight)
+            pooled = await self._connect(server)
+            sessions.append(pooled)
+            self._start_keepalive(server)
+            return pooled
+
+    async def session(self, server: str) -> ClientSession:
+        """返回服务器的一个长期会话（如用于列出工具）"""
+        return (await self.acquire(server)).session
+
+    async def call_tool(self, server: str, name: str, arguments: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        metrics = self._server_metrics(server)
+        metrics.calls += 1
+        start_time = time.perf_counter()
+        for attempt in range(2):
+            try:
+                pooled = await self.acquire(server)
+            except Exception:
+                metrics.errors += 1
+                raise
+            pooled.in_flight += 1
+            try:
+                result = await pooled.session.call_tool(name, arguments, **kwargs)
+                metrics.latencies_ms.append((time.perf_counter() - start_time) * 1000)
+                return result
+            except Exception as e:
+                # 只有连接断开时才重试，避免重复执行有副作用的工具
+                if attempt == 0 and (isinstance(e, _CONNECTION_ERRORS) or not pooled.alive):
+                    await self._discard(server, pooled)
+                    continue
+                metrics.errors += 1
+                raise
+            finally:
+                pooled.in_flight -= 1
+                pooled.last_used = time.monotonic()
+
+    async def _discard(self, server: str, pooled: _PooledSession) -> None:
+        sessions = self._sessions.get(server, [])
+        if pooled in sessions:
+            sessions.remove(pooled)
+        await pooled.close()
+
+    def _start_keepalive(self, server: str) -> None:
+        interval = self._setting(server, "keepalive_interval", DEFAULT_KEEPALIVE_INTERVAL)
+        task = self._keepalive_tasks.get(server)
+        if interval and (task is None or task.done()):
+            self._keepalive_tasks[server] = asyncio.create_task(self._keepalive(server, interval))
+
+    async def _keepalive(self, server: str, interval: float) -> None:
+        """定期ping空闲会话，失败的会话被丢弃，下次调用时重新连接"""
+        while self._sessions.get(server):
+            await asyncio.sleep(interval)
+            for pooled in list(self._sessions.get(server, [])):
+                if pooled.in_flight or time.monotonic() - pooled.last_used < interval:
+                    continue
+                try:
+                    if not pooled.alive:
+                        raise ConnectionError("session closed")
+                    await asyncio.wait_for(pooled.session.send_ping(), timeout=_PING_TIMEOUT)
+                    pooled.last_used = time.monotonic()
+                except Exception:
+                    await self._discard(server, pooled)
+
+    def proxy(self, server: str) -> SessionProxy:
+        return SessionProxy(self, server)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {server: metrics.summary() for server, metrics in self.metrics.items()}
+
+    async def close_all(self) -> None:
+        for task in self._keepalive_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._keepalive_tasks.values(), return_exceptions=True)
+        self._keepalive_tasks.clear()
+        sessions = [pooled for server_sessions in self._sessions.values() for pooled in server_sessions]
+        self._sessions.clear()
+        await asyncio.gather(*(pooled.close() for pooled in sessions), return_exceptions=True)
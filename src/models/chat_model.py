@@ -3,6 +3,8 @@ from langchain_deepseek import ChatDeepSeek
 from langchain_openai import ChatOpenAI
 
 from src.config.config import get_config_section
+from src.models.fake_model import create_fake_model
+from src.models.response_cache import get_response_cache
 
 def init_chat_model():
     settings = get_config_section(["models", "chat_model"])
@@ -10,6 +12,9 @@ def init_chat_model():
         raise ValueError(
             "The `models/chat_model` section in `config.yaml` is not found"
         )
+    if settings.get("type") == "fake":
+        # 按脚本回放响应，不需要模型名和API密钥
+        return create_fake_model(settings)
     model = settings.get("model")
     if not model:
         raise ValueError("The `model` in `config.yaml` is not found")
@@ -21,6 +26,12 @@ def init_chat_model():
     rest_settings = settings.copy()
     del rest_settings["model"]
     del rest_settings["api_key"]
+    # 流式输出时同样返回token用量（包括命中前缀缓存的token数）
+    rest_settings.setdefault("stream_usage", True)
+    # 响应缓存不是模型构造参数，单独创建后通过cache传入
+    cache = get_response_cache(rest_settings.pop("cache", None))
+    if cache is not None:
+        rest_settings["cache"] = cache
     if settings.get("type") == "deepseek" or settings.get("type") == "doubao":
         del rest_settings["type"]
         model = ChatDeepSeek(model=model, api_key=api_key, **rest_settings)
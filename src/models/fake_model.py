@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import yaml
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# 脚本中的字符串参数可以使用 {cwd} 引用运行时的当前工作目录（即项目根目录）
+_CWD_PLACEHOLDER = "{cwd}"
+
+_SCRIPT_FINISHED = "Scripted session finished."
+
+
+def load_script(path: str) -> List[Dict[str, Any]]:
+    """读取回放脚本（JSON或YAML），返回按顺序排列的模型响应列表。
+
+    脚本可以是响应列表，也可以是包含 steps 字段的对象。每个响应形如：
+        {"content": "说明文字", "tool_calls": [{"name": "grep", "args": {...}}]}
+    没有 tool_calls 的响应会结束当前一轮对话。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        script = json.load(f) if path.endswith(".json") else yaml.safe_load(f)
+    if isinstance(script, dict):
+        script = script.get("steps", [])
+    return script
+
+
+def _substitute(value: Any, cwd: str) -> Any:
+    if isinstance(value, str):
+        return value.replace(_CWD_PLACEHOLDER, cwd)
+    if isinstance(value, list):
+        return [_substitute(item, cwd) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, cwd) for key, item in value.items()}
+    return value
+
+
+class ScriptedChatModel(BaseChatModel):
+    """按脚本回放响应和工具调用的聊天模型，用于在没有模型服务的情况下测量代理自身的开销。
+
+    返回第几个响应由对话中已有的AI消息数决定，因此同一个模型实例可以同时用于多个对话线程，
+    多轮对话会依次消费脚本中的响应。脚本用完后返回一条不含工具调用的结束消息。
+    上下文预算中间件裁剪历史后AI消息数会减少，回放时应调大 agent.context_budget.max_tokens。
+    """
+
+    steps: List[Dict[str, Any]]
+    # 模拟模型服务的响应延迟（秒）
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        # 工具调用已经写在脚本中，不需要把工具定义发送给模型
+        return self
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        index = sum(1 for message in messages if isinstance(message, AIMessage))
+        if index >= len(self.steps):
+            return AIMessage(content=_SCRIPT_FINISHED)
+        step = _substitute(self.steps[index], os.getcwd())
+        tool_calls = [
+            {"name": call["name"], "args": call.get("args", {}), "id": f"call_{index}_{i}", "type": "tool_call"}
+            for i, call in enumerate(step.get("tool_calls") or [])
+        ]
+        return AIMessage(content=step.get("content", ""), tool_calls=tool_calls)
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Any = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Any = None,
+            **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+
+def create_fake_model(settings: Dict[str, Any]) -> ScriptedChatModel:
+    script = settings.get("script")
+    if not script:
+        raise ValueError("The `script` of the fake chat model in `config.yaml` is not found")
+    return ScriptedChatModel(steps=load_script(script), latency=settings.get("latency", 0.0))
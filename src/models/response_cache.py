@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+DEFAULT_CACHE_PATH = os.path.join(".code_agent", "llm_cache.db")
+DEFAULT_MAX_ENTRIES = 1000
+# 默认缓存7天
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# 序列化消息中每次运行都会变化、但不影响模型输出的字段
+_VOLATILE_KWARGS = ("id", "response_metadata", "usage_metadata")
+
+
+def _normalize(value: Any) -> Any:
+    """去掉序列化消息中的消息ID、响应元数据等易变字段，并按键排序"""
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    normalized = {key: _normalize(item) for key, item in value.items()}
+    kwargs = normalized.get("kwargs")
+    if normalized.get("lc") and isinstance(kwargs, dict):
+        for key in _VOLATILE_KWARGS:
+            kwargs.pop(key, None)
+    return normalized
+
+
+def _strip_message(generation: Any) -> Any:
+    """去掉生成结果中消息的ID和token用量"""
+    message = getattr(generation, "message", None)
+    if message is None or (not message.id and not getattr(message, "usage_metadata", None)):
+        return generation
+    update = {"id": None}
+    if hasattr(message, "usage_metadata"):
+        update["usage_metadata"] = None
+    return generation.model_copy(update={"message": message.model_copy(update=update)})
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """由消息和模型配置生成缓存键。
+
+    prompt 是序列化后的消息列表，llm_string 包含模型名、温度等参数以及绑定的工具定义，
+    因此消息、工具或模型设置任何一项变化都会得到不同的键。
+    """
+    try:
+        prompt = json.dumps(_normalize(json.loads(prompt)), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseCache(BaseCache):
+    """保存在本地SQLite中的模型响应缓存。
+
+    只在 temperature 为0等输出确定的场景下开启。条目超过 ttl_seconds 后失效，
+    总数超过 max_entries 时按最近访问时间淘汰最久未使用的条目。
+    """
+
+    def __init__(
+            self,
+            path: str = DEFAULT_CACHE_PATH,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 异步调用会通过线程池访问缓存，连接由锁保护
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        # 命中缓存没有实际调用模型，去掉保存的token用量，避免用量统计重复计算
+        return [_strip_message(generation) for generation in loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        # 不保存消息ID，命中时由模型为本次运行分配新的ID，避免不同对话中出现重复的消息ID；
+        # 也不保存token用量，命中时不会产生用量
+        generations = [_strip_message(generation) for generation in return_val]
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, dumps(generations), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                """
+                DELETE FROM responses WHERE key NOT IN (
+                    SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+
+_response_cache: Optional[SQLiteResponseCache] = None
+
+
+def get_response_cache(settings: Optional[Dict[str, Any]]) -> Optional[SQLiteResponseCache]:
+    """根据 config.yaml 的 models.chat_model.cache 返回共享的响应缓存，未开启时返回None"""
+    global _response_cache
+    if not settings or not settings.get("enabled", False):
+        return None
+    if _response_cache is None:
+        _response_cache = SQLiteResponseCache(
+            path=settings.get("path") or DEFAULT_CACHE_PATH,
+            max_entries=settings.get("max_entries", DEFAULT_MAX_ENTRIES),
+            ttl_seconds=settings.get("ttl_seconds", DEFAULT_TTL_SECONDS),
+        )
+    return _response_cache
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from langchain.agents.middleware import AgentMiddleware, AgentState
+from langchain.messages import AIMessage
+from langgraph.config import get_stream_writer
+from langgraph.runtime import Runtime
+
+
+@dataclass
+class RequestUsage:
+    """单次模型请求的token用量"""
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def cached_ratio(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+
+def _cached_tokens(message: AIMessage) -> int:
+    """读取命中前缀缓存的输入token数。
+
+    OpenAI兼容接口的 prompt_tokens_details.cached_tokens 会被映射到
+    usage_metadata.input_token_details.cache_read；DeepSeek 在原始用量中
+    单独返回 prompt_cache_hit_tokens。
+    """
+    details = (message.usage_metadata or {}).get("input_token_details") or {}
+    if details.get("cache_read"):
+        return details["cache_read"]
+    token_usage = (message.response_metadata or {}).get("token_usage") or {}
+    return token_usage.get("prompt_cache_hit_tokens") or 0
+
+
+def usage_from_message(message: AIMessage) -> Optional[RequestUsage]:
+    if not message.usage_metadata:
+        return None
+    return RequestUsage(
+        input_tokens=message.usage_metadata.get("input_tokens", 0),
+        cached_tokens=_cached_tokens(message),
+        output_tokens=message.usage_metadata.get("output_tokens", 0),
+    )
+
+
+class UsageTracker:
+    """累计模型请求的token用量和前缀缓存命中率"""
+
+    def __init__(self):
+        self.requests = 0
+        self.total = RequestUsage()
+
+    def record(self, usage: RequestUsage) -> None:
+        self.requests += 1
+        self.total.input_tokens += usage.input_tokens
+        self.total.cached_tokens += usage.cached_tokens
+        self.total.output_tokens += usage.output_tokens
+
+
+class UsageMiddleware(AgentMiddleware):
+    """在每次模型调用后记录token用量，并以custom事件 {"type": "usage"} 报告给界面"""
+
+    def __init__(self, tracker: Optional[UsageTracker] = None):
+        super().__init__()
+        self.tracker = tracker or UsageTracker()
+
+    def after_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        message = state["messages"][-1] if state["messages"] else None
+        usage = usage_from_message(message) if isinstance(message, AIMessage) else None
+        if usage is None:
+            return None
+        self.tracker.record(usage)
+        try:
+            writer = get_stream_writer()
+        except Exception:
+            return None
+        writer({
+            "type": "usage",
+            "input_tokens": usage.input_tokens,
+            "cached_tokens": usage.cached_tokens,
+            "output_tokens": usage.output_tokens,
+            "cached_ratio": usage.cached_ratio,
+            "total_cached_ratio": self.tracker.total.cached_ratio,
+        })
+        return None
+
+    async def aafter_model(self, state: AgentState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        return self.after_model(state, runtime)
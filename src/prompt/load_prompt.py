@@ -1,16 +1,43 @@
 import os
 import logging
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
-from jinja2 import Environment, FileSystemLoader, TemplateError
+from jinja2 import Environment, FileSystemLoader, Template, TemplateError
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=1)
+def _get_environment() -> Environment:
+    """返回进程内共享的Jinja2环境，避免每次渲染都重新创建环境和模板缓存"""
+    # 获取prompt目录作为模板目录
+    prompt_dir = os.path.dirname(__file__)
+    return Environment(
+        loader=FileSystemLoader(prompt_dir),
+        autoescape=False,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        # 提示词模板随代码发布，运行期间不会变化，不需要每次检查文件修改时间
+        auto_reload=False,
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_template(template_name: str) -> Template:
+    """加载并编译模板，编译结果按模板名缓存"""
+    logger.info(f"加载模板: {template_name} 从目录: {os.path.dirname(__file__)}")
+    return _get_environment().get_template(template_name)
+
+
 def apply_prompt_template(template: str, **kwargs) -> str:
     """
     应用模板渲染功能
+
+    模板只在第一次使用时读取和编译。为了让模型服务商的前缀缓存能够命中，
+    模板中与会话相关的变量（如PROJECT_ROOT）应放在模板末尾，
+    使不同会话渲染出的提示词拥有相同的静态前缀。
     
     Args:
         template: 模板文件名（不含.md扩展名）或完整的模板文件路径
@@ -24,27 +51,14 @@ def apply_prompt_template(template: str, **kwargs) -> str:
         TemplateError: 当模板渲染出错时
     """
     try:
-        # 获取prompt目录作为模板目录
-        prompt_dir = os.path.dirname(__file__)
-        
-        # 创建Jinja2环境
-        env = Environment(
-            loader=FileSystemLoader(prompt_dir),
-            autoescape=False,
-            trim_blocks=True,
-            lstrip_blocks=True
-        )
-        
         # 确定模板文件名
         if template.endswith('.md'):
             template_name = os.path.basename(template)
         else:
             template_name = f"{template}.md"
         
-        logger.info(f"加载模板: {template_name} 从目录: {prompt_dir}")
-        
         # 获取并渲染模板
-        template_obj = env.get_template(template_name)
+        template_obj = _get_template(template_name)
         rendered_content = template_obj.render(**kwargs)
         
         logger.debug(f"模板渲染成功，输出长度: {len(rendered_content)} 字符")
@@ -0,0 +1,21 @@
+from typing import Any, Dict
+
+
+def tool_artifact(tool: str, content: str, **fields: Any) -> Dict[str, Any]:
+    """构建工具结果的结构化附件（ToolMessage.artifact）。
+
+    附件不会发送给模型，只供界面使用：界面根据其中的工具名、路径、命令等字段
+    直接分派处理，而不需要再用正则表达式解析可能很大的工具输出文本。
+
+    参数：
+        tool: 工具名称。
+        content: 返回给模型的文本内容，用于记录字节数和是否为错误。
+        **fields: 各工具特有的字段（如path、command、return_code）。
+    """
+    artifact = {
+        "tool": tool,
+        "bytes": len(content.encode("utf-8", errors="ignore")),
+        "is_error": content.startswith("Error"),
+    }
+    artifact.update(fields)
+    return artifact
@@ -1,12 +1,25 @@
+import asyncio
+import codecs
+import signal
 import subprocess
 import os
 import platform
+import re
+import shlex
 import time
-from typing import Optional, List, Dict, Any
+from collections import deque
+from typing import Optional, List, Dict, Any, Callable, Tuple
 from pathlib import Path
 
 from langchain.tools import ToolRuntime, tool
 
+from src.config.config import get_config_section
+from .artifact import tool_artifact
+from .output_budget import SpillFile, max_output_chars, spill_marker
+from .trigram_index import mark_indexes_stale
+from .shell_session import ShellSessionError, get_session_pool, sessions_supported
+
+
 # 常见的安全命令白名单示例
 DEFAULT_ALLOWED_COMMANDS = [
     "ls", "dir", "pwd", "cd", "echo", "cat", "head", "tail", "find", 
@@ -20,11 +33,113 @@ DANGEROUS_COMMANDS = [
     "mkfs", "rm -rf", "shutdown", "reboot", "halt", "poweroff"
 ]
 
+# 不会修改文件的命令，用于判断能否保留只读工具的结果缓存。
+# 能执行其他命令（env、xargs）或通过参数写文件（sort -o、uniq 输出文件、tree -o）的命令不在其中
+READ_ONLY_COMMANDS = {
+    "ls", "dir", "pwd", "cd", "echo", "cat", "head", "tail", "find", "grep", "rg", "wc",
+    "date", "whoami", "printenv", "which", "stat", "file", "du", "df",
+    "cut", "diff", "less", "more", "true",
+}
+# 只读的git子命令
+READ_ONLY_GIT_COMMANDS = {"status", "log", "diff", "show", "ls-files", "grep", "blame", "rev-parse"}
+# 会写文件或执行其他命令的参数
+_MUTATING_ARGS = {
+    "find": {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"},
+    "file": {"-C", "--compile"},
+}
+
 # 全局状态变量
 _command_history: List[Dict[str, Any]] = []
 _default_timeout = 30
 _enable_security_checks = True
 
+# 输出保留开头的比例，其余用环形缓冲区保留结尾；总上限为 tools.output_budget.max_chars
+_OUTPUT_HEAD_RATIO = 0.25
+# stdout和stderr都超出预算时，stderr至少分得的比例
+_STDERR_MIN_RATIO = 0.25
+
+# 流式读取子进程输出的块大小
+_STREAM_CHUNK_BYTES = 4096
+
+
+class OutputBuffer:
+    """有上限的输出缓冲区。
+
+    保留输出的开头部分，之后的输出进入按字符数计的环形缓冲区，
+    只保留最近的结尾部分，因此内存占用与命令输出总量无关。
+    指定 spill_name 时，输出一旦超出上限，完整输出会逐块写入溢出文件，
+    模型可以通过 read_output 工具分页读取被省略的部分。
+    上限默认为 tools.output_budget.max_chars，getvalue 可以再按更小的上限截取。
+    """
+
+    def __init__(self, max_chars: int = None, spill_name: Optional[str] = None):
+        max_chars = max_chars or max_output_chars()
+        self.max_chars = max_chars
+        self._head_limit = int(max_chars * _OUTPUT_HEAD_RATIO)
+        self._tail_limit = max_chars - self._head_limit
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self.total_chars = 0
+        self._spill_name = spill_name
+        self._spill: Optional[SpillFile] = None
+
+    def write(self, text: str) -> None:
+        self.total_chars += len(text)
+        if self._spill is not None:
+            self._spill.write(text)
+        if self._head_size < self._head_limit:
+            part = text[:self._head_limit - self._head_size]
+            self._head.append(part)
+            self._head_size += len(part)
+            text = text[len(part):]
+        if not text:
+            return
+        self._tail.append(text)
+        self._tail_size += len(text)
+        # 第一次超出上限时还没有丢弃任何输出，把已有的全部输出写入溢出文件
+        if self._tail_size > self._tail_limit and self._spill is None and self._spill_name:
+            self._spill = SpillFile(self._spill_name)
+            self._spill.write("".join(self._head) + "".join(self._tail))
+        # 丢弃超出上限的最早的块（最后一块可能需要截掉开头）
+        while self._tail_size > self._tail_limit:
+            overflow = self._tail_size - self._tail_limit
+            first = self._tail[0]
+            if len(first) <= overflow:
+                self._tail.popleft()
+                self._tail_size -= len(first)
+            else:
+                self._tail[0] = first[overflow:]
+                self._tail_size -= overflow
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_chars > self._head_size + self._tail_size
+
+    def getvalue(self, limit: Optional[int] = None) -> str:
+        """返回保留的输出（不超过limit个字符），被丢弃的中间部分用省略标记代替。"""
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        limit = min(limit or self.max_chars, self.max_chars)
+        if self.total_chars <= limit:
+            return head + tail
+        if self._spill is None and self._spill_name:
+            # 输出没有超出缓冲区但超出了本次的上限，此时缓冲区中就是完整输出
+            self._spill = SpillFile(self._spill_name)
+            self._spill.write(head + tail)
+        head_keep = min(len(head), int(limit * _OUTPUT_HEAD_RATIO))
+        tail_keep = min(len(tail), limit - head_keep)
+        head_keep = min(len(head), limit - tail_keep)
+        head = head[:head_keep]
+        tail = tail[len(tail) - tail_keep:]
+        omitted = self.total_chars - head_keep - tail_keep
+        spill_id = None
+        if self._spill is not None:
+            self._spill.close()
+            spill_id = self._spill.spill_id
+        return f"{head}{spill_marker(omitted, spill_id)}{tail}"
+
 
 def _check_security(command: str) -> tuple[bool, str]:
     """检查命令的安全性。"""
@@ -51,6 +166,78 @@ def _check_security(command: str) -> tuple[bool, str]:
     return True, ""
 
 
+def is_read_only_command(command: str) -> bool:
+    """保守地判断命令是否不会修改文件：所有子命令都在只读命令列表中，且没有重定向、命令替换和 --output 参数。"""
+    if re.search(r"[>`]|\$\(|--output", command):
+        return False
+    # & 后台执行的命令同样是独立的子命令
+    for segment in re.split(r"&&|\|\||[;|&\n]", command):
+        try:
+            words = shlex.split(segment)
+        except ValueError:
+            return False
+        # 跳过开头的环境变量赋值
+        while words and re.match(r"^[A-Za-z_][A-Za-z0-9_]*=", words[0]):
+            words = words[1:]
+        if not words:
+            continue
+        name = os.path.basename(words[0])
+        if name == "git":
+            if len(words) < 2 or words[1] not in READ_ONLY_GIT_COMMANDS:
+                return False
+        elif name not in READ_ONLY_COMMANDS or _MUTATING_ARGS.get(name, set()) & set(words[1:]):
+            return False
+    return True
+
+
+def _output_buffers() -> Tuple[OutputBuffer, OutputBuffer]:
+    """创建一次命令的stdout和stderr缓冲区"""
+    return OutputBuffer(spill_name="bash"), OutputBuffer(spill_name="bash")
+
+
+def _combined_output(stdout_buffer: OutputBuffer, stderr_buffer: OutputBuffer) -> Tuple[str, str]:
+    """按 tools.output_budget.max_chars 的总预算返回stdout和stderr。
+
+    两者合计不超过预算时原样返回；否则stderr至少分得预算的 _STDERR_MIN_RATIO
+    （自身更短时只占实际长度），其余留给stdout。
+    """
+    budget = max_output_chars()
+    out_chars, err_chars = stdout_buffer.total_chars, stderr_buffer.total_chars
+    if out_chars + err_chars <= budget:
+        return stdout_buffer.getvalue(), stderr_buffer.getvalue()
+    err_limit = min(err_chars, max(int(budget * _STDERR_MIN_RATIO), budget - out_chars))
+    return stdout_buffer.getvalue(budget - err_limit), stderr_buffer.getvalue(err_limit)
+
+
+def _cap_outputs(stdout: str, stderr: str) -> Tuple[str, str]:
+    """将一次性获得的输出截断到总预算以内。"""
+    stdout_buffer, stderr_buffer = _output_buffers()
+    stdout_buffer.write(stdout or "")
+    stderr_buffer.write(stderr or "")
+    return _combined_output(stdout_buffer, stderr_buffer)
+
+
+def _build_command(command: str) -> List[str]:
+    """根据系统选择shell类型，构建命令参数。"""
+    if platform.system() == "Windows":
+        # 在Windows上使用PowerShell
+        return ["powershell", "-Command", command]
+    # 在Unix-like系统上使用bash
+    return ["bash", "-c", command]
+
+
+def _validate_cwd(cwd: Optional[str]) -> Optional[str]:
+    """验证工作目录，返回错误信息（合法时返回None）。"""
+    if not cwd:
+        return None
+    cwd_path = Path(cwd)
+    if not cwd_path.is_absolute():
+        return f"工作目录 '{cwd}' 不是绝对路径"
+    if not cwd_path.exists() or not cwd_path.is_dir():
+        return f"工作目录 '{cwd}' 不存在或不是目录"
+    return None
+
+
 def _execute_command(
     command: str,
     timeout: int,
@@ -67,45 +254,23 @@ def _execute_command(
         env.update(env_vars)
     
     # 验证工作目录
-    if cwd:
-        cwd_path = Path(cwd)
-        if not cwd_path.is_absolute():
-            return {
-                "success": False,
-                "output": "",
-                "error": f"工作目录 '{cwd}' 不是绝对路径",
-                "return_code": -1,
-                "command": command,
-                "duration_ms": int((time.time() - start_time) * 1000),
-                "system": system_type
-            }
-        if not cwd_path.exists() or not cwd_path.is_dir():
-            return {
-                "success": False,
-                "output": "",
-                "error": f"工作目录 '{cwd}' 不存在或不是目录",
-                "return_code": -1,
-                "command": command,
-                "duration_ms": int((time.time() - start_time) * 1000),
-                "system": system_type
-            }
+    cwd_error = _validate_cwd(cwd)
+    if cwd_error:
+        return {
+            "success": False,
+            "output": "",
+            "error": cwd_error,
+            "return_code": -1,
+            "command": command,
+            "duration_ms": int((time.time() - start_time) * 1000),
+            "system": system_type
+        }
     
     try:
-        # 根据系统选择shell类型
-        shell_type = True
-        if system_type == "Windows":
-            # 在Windows上使用PowerShell
-            cmd_args = ["powershell", "-Command", command]
-            shell_type = False
-        else:
-            # 在Unix-like系统上使用bash
-            cmd_args = ["bash", "-c", command]
-            shell_type = False
-        
         # 执行命令
         result = subprocess.run(
-            cmd_args,
-            shell=shell_type,
+            _build_command(command),
+            shell=False,
             check=False,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -119,10 +284,11 @@ def _execute_command(
         duration_ms = int((time.time() - start_time) * 1000)
         
         # 返回结果
+        output, error = _cap_outputs(result.stdout, result.stderr)
         return {
             "success": result.returncode == 0,
-            "output": result.stdout,
-            "error": result.stderr,
+            "output": output,
+            "error": error,
             "return_code": result.returncode,
             "command": command,
             "duration_ms": duration_ms,
@@ -164,36 +330,261 @@ def _execute_command(
         }
 
 
-@tool("bash", parse_docstring=True)
+def _build_result(
+    command: str,
+    start_time: float,
+    success: bool,
+    output: str,
+    error: str,
+    return_code: int,
+) -> Dict[str, Any]:
+    return {
+        "success": success,
+        "output": output,
+        "error": error,
+        "return_code": return_code,
+        "command": command,
+        "duration_ms": int((time.time() - start_time) * 1000),
+        "system": platform.system()
+    }
+
+
+def _kill_process(process: asyncio.subprocess.Process) -> None:
+    """终止子进程及其创建的整个进程组。"""
+    if process.returncode is not None:
+        return
+    try:
+        if platform.system() == "Windows":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _pump_stream(
+    stream: asyncio.StreamReader,
+    buffer: OutputBuffer,
+    name: str,
+    on_output: Optional[Callable[[str, str], None]],
+) -> None:
+    """逐块读取子进程输出，写入有上限的缓冲区并转发给回调。"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = await stream.read(_STREAM_CHUNK_BYTES)
+        text = decoder.decode(chunk, final=not chunk)
+        if text:
+            buffer.write(text)
+            if on_output:
+                on_output(name, text)
+        if not chunk:
+            break
+
+
+async def _execute_command_streaming(
+    command: str,
+    timeout: int,
+    cwd: Optional[str] = None,
+    env_vars: Optional[Dict[str, str]] = None,
+    on_output: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, Any]:
+    """内部方法：异步执行命令，输出按块转发给on_output(stream_name, text)。
+
+    stdout和stderr合计只保留输出预算以内的首尾部分，返回结果的格式与_execute_command相同。
+    """
+    start_time = time.time()
+    system_type = platform.system()
+
+    # 构建执行环境
+    env = os.environ.copy()
+    if env_vars:
+        env.update(env_vars)
+
+    # 验证工作目录
+    cwd_error = _validate_cwd(cwd)
+    if cwd_error:
+        return _build_result(command, start_time, False, "", cwd_error, -1)
+
+    try:
+        # 在新会话中启动，超时时可以终止命令派生的所有子进程
+        process = await asyncio.create_subprocess_exec(
+            *_build_command(command),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            start_new_session=system_type != "Windows",
+        )
+    except PermissionError:
+        return _build_result(command, start_time, False, "", "权限不足，无法执行命令", -3)
+    except Exception as e:
+        return _build_result(command, start_time, False, "", f"执行命令时发生错误: {str(e)}", -1)
+
+    stdout_buffer, stderr_buffer = _output_buffers()
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                _pump_stream(process.stdout, stdout_buffer, "stdout", on_output),
+                _pump_stream(process.stderr, stderr_buffer, "stderr", on_output),
+                process.wait(),
+            ),
+            timeout=timeout,
+        )
+    except asyncio.TimeoutError:
+        _kill_process(process)
+        await process.wait()
+        # 超时仍返回已经产生的输出，便于定位卡住的位置
+        output, stderr = _combined_output(stdout_buffer, stderr_buffer)
+        error = f"命令执行超时（{timeout}秒）"
+        if stderr:
+            error += "\n" + stderr
+        return _build_result(command, start_time, False, output, error, -2)
+    finally:
+        # 任务被取消时同样要终止子进程
+        _kill_process(process)
+
+    output, error = _combined_output(stdout_buffer, stderr_buffer)
+    return _build_result(command, start_time, process.returncode == 0, output, error, process.returncode)
+
+
+async def _execute_in_session(
+    session_key: str,
+    command: str,
+    timeout: int,
+    cwd: Optional[str] = None,
+    env_vars: Optional[Dict[str, str]] = None,
+    on_output: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, Any]:
+    """内部方法：在对话线程的持久化shell会话中执行命令。
+
+    命令中的cd、export和激活的virtualenv会保留到同一线程的后续调用中，
+    cwd和env_vars参数只作用于本次命令。
+    返回结果的格式与_execute_command相同。
+    """
+    start_time = time.time()
+
+    cwd_error = _validate_cwd(cwd)
+    if cwd_error:
+        return _build_result(command, start_time, False, "", cwd_error, -1)
+
+    stdout_buffer, stderr_buffer = _output_buffers()
+
+    def _collect(stream_name: str, text: str) -> None:
+        (stdout_buffer if stream_name == "stdout" else stderr_buffer).write(text)
+        if on_output:
+            on_output(stream_name, text)
+
+    session = await get_session_pool().get(session_key)
+    async with session.lock:
+        try:
+            return_code = await asyncio.wait_for(
+                session.run(command, _collect, cwd=cwd, env_vars=env_vars),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            # 超时后重启会话，工作目录保留，环境变量重置
+            await session.close()
+            output, stderr = _combined_output(stdout_buffer, stderr_buffer)
+            error = f"命令执行超时（{timeout}秒），shell会话已重启，之前导出的环境变量已失效"
+            if stderr:
+                error += "\n" + stderr
+            return _build_result(command, start_time, False, output, error, -2)
+        except ShellSessionError:
+            await session.close()
+            output, stderr = _combined_output(stdout_buffer, stderr_buffer)
+            error = "shell会话在命令完成前退出（命令中可能执行了exit），下次调用将启动新的会话"
+            if stderr:
+                error += "\n" + stderr
+            return _build_result(command, start_time, False, output, error, -1)
+        except ValueError as e:
+            return _build_result(command, start_time, False, "", str(e), -1)
+        except asyncio.CancelledError:
+            await session.close()
+            raise
+        except Exception as e:
+            await session.close()
+            return _build_result(command, start_time, False, "", f"执行命令时发生错误: {str(e)}", -1)
+
+    output, error = _combined_output(stdout_buffer, stderr_buffer)
+    return _build_result(command, start_time, return_code == 0, output, error, return_code)
+
+
+def _use_persistent_sessions() -> bool:
+    settings = get_config_section(["tools", "bash"]) or {}
+    return settings.get("persistent_sessions", False) and sessions_supported()
+
+
+def _security_error(command: str) -> Optional[str]:
+    """执行安全检查，未通过时记录历史并返回错误信息。"""
+    if not _enable_security_checks:
+        return None
+    is_safe, error_msg = _check_security(command)
+    if is_safe:
+        return None
+    _command_history.append({
+        "success": False,
+        "output": "",
+        "error": error_msg,
+        "return_code": -4,
+        "command": command,
+        "duration_ms": 0,
+        "system": platform.system()
+    })
+    return error_msg
+
+
+def _record_and_format(result: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """记录命令历史，返回格式化后给代理的结果及其结构化附件。"""
+    # 记录到历史
+    _command_history.append(result)
+    # 只保留最近100条历史记录
+    if len(_command_history) > 100:
+        _command_history.pop(0)
+    # 可能修改了文件的命令执行后，grep索引需要在下次搜索前重新检查
+    if not is_read_only_command(result["command"]):
+        mark_indexes_stale()
+    
+    # 格式化输出结果
+    if result["success"]:
+        output_lines = []
+        if result["output"]:
+            output_lines.append(result["output"])
+        content = f"Command executed successfully (exit code: {result['return_code']}, duration: {result['duration_ms']}ms):\n```\n" + "\n".join(output_lines) + "\n```"
+    else:
+        error_msg = result["error"] if result["error"] else "Unknown error"
+        content = f"Command failed (exit code: {result['return_code']}, duration: {result['duration_ms']}ms):\n```\n{error_msg}\n```"
+    return content, tool_artifact(
+        "bash",
+        content,
+        command=result["command"],
+        return_code=result["return_code"],
+        duration_ms=result["duration_ms"],
+    )
+
+
+@tool("bash", parse_docstring=True, response_format="content_and_artifact")
 def bash_tool(
     runtime: ToolRuntime,
     command: str,
     cwd: Optional[str] = None,
     env_vars: Optional[Dict[str, str]] = None
-) -> str:
+) -> Tuple[str, Dict[str, Any]]:
     """执行Bash/shell命令并返回格式化结果。
 
+    启用持久化会话时，同一对话中的命令共享一个shell进程，命令中执行的cd、export和virtualenv激活等状态会保留到后续调用；
+    cwd和env_vars参数只作用于本次调用。
+
     Args:
         runtime: ToolRuntime实例，由LangChain框架提供。
         command: 要执行的命令字符串。
-        cwd: 执行命令的工作目录，None表示使用当前目录。
+        cwd: 执行命令的工作目录，None表示使用当前目录（持久化会话中为上一条命令结束时的目录）。
         env_vars: 额外的环境变量，将与当前环境变量合并。
     """
     # 执行安全检查
-    if _enable_security_checks:
-        is_safe, error_msg = _check_security(command)
-        if not is_safe:
-            result = {
-                "success": False,
-                "output": "",
-                "error": error_msg,
-                "return_code": -4,
-                "command": command,
-                "duration_ms": 0,
-                "system": platform.system()
-            }
-            _command_history.append(result)
-            return f"Error: {error_msg}"
+    error_msg = _security_error(command)
+    if error_msg:
+        content = f"Error: {error_msg}"
+        return content, tool_artifact("bash", content, command=command, return_code=-4, duration_ms=0)
     
     # 执行命令
     result = _execute_command(
@@ -202,20 +593,58 @@ def bash_tool(
         cwd=cwd,
         env_vars=env_vars
     )
-    
-    # 记录到历史
-    _command_history.append(result)
-    # 只保留最近100条历史记录
-    if len(_command_history) > 100:
-        _command_history.pop(0)
-    
-    # 格式化输出结果
-    if result["success"]:
-        output_lines = []
-        if result["output"]:
-            output_lines.append(result["output"])
-        return f"Command executed successfully (exit code: {result['return_code']}, duration: {result['duration_ms']}ms):\n```\n" + "\n".join(output_lines) + "\n```"
+    return _record_and_format(result)
+
+
+async def _abash_tool(
+    runtime: ToolRuntime,
+    command: str,
+    cwd: Optional[str] = None,
+    env_vars: Optional[Dict[str, str]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """bash_tool的异步流式版本：命令输出实时以custom事件发送给界面。
+
+    启用tools.bash.persistent_sessions时，命令在对话线程的持久化shell会话中执行。
+    """
+    error_msg = _security_error(command)
+    if error_msg:
+        content = f"Error: {error_msg}"
+        return content, tool_artifact("bash", content, command=command, return_code=-4, duration_ms=0)
+
+    writer = getattr(runtime, "stream_writer", None)
+    tool_call_id = getattr(runtime, "tool_call_id", None)
+
+    def _forward(stream_name: str, text: str) -> None:
+        writer({
+            "type": "tool_output",
+            "tool": "bash",
+            "tool_call_id": tool_call_id,
+            "stream": stream_name,
+            "text": text,
+        })
+
+    on_output = _forward if writer else None
+    if _use_persistent_sessions():
+        # 同一对话线程的命令共享一个shell会话
+        config = getattr(runtime, "config", None) or {}
+        session_key = str(config.get("configurable", {}).get("thread_id", "default"))
+        result = await _execute_in_session(
+            session_key=session_key,
+            command=command,
+            timeout=_default_timeout,
+            cwd=cwd,
+            env_vars=env_vars,
+            on_output=on_output,
+        )
     else:
-        error_msg = result["error"] if result["error"] else "Unknown error"
-        return f"Command failed (exit code: {result['return_code']}, duration: {result['duration_ms']}ms):\n```\n{error_msg}\n```"
+        result = await _execute_command_streaming(
+            command=command,
+            timeout=_default_timeout,
+            cwd=cwd,
+            env_vars=env_vars,
+            on_output=on_output,
+        )
+    return _record_and_format(result)
+
 
+bash_tool.coroutine = _abash_tool
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from langchain.tools import BaseTool
+
+from src.config.config import get_config_section
+
+# 工具执行线程池的默认大小，与 asyncio 默认线程池保持一致
+DEFAULT_TOOL_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """返回内置工具共享的线程池（首次使用时创建，大小可通过 tools.max_workers 配置）。"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = get_config_section(["tools", "max_workers"]) or DEFAULT_TOOL_WORKERS
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在工具线程池中执行阻塞函数，不阻塞事件循环。
+
+    调用时的 contextvars 会被复制到工作线程中，
+    因此工具内部仍然可以访问 LangGraph 的运行时上下文（如 stream writer）。
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_tool_executor(), call)
+
+
+def async_variant(tool: BaseTool) -> BaseTool:
+    """为同步工具添加异步执行路径（ainvoke）。
+
+    同一个 AIMessage 中的多个工具调用会被并发 await，
+    阻塞的文件读写和子进程等待都放在工具线程池中执行，
+    从而多个工具调用能够真正并行，且不会阻塞 UI 的事件循环。
+    已经定义了 coroutine 的工具保持不变。
+    """
+    if getattr(tool, "coroutine", None) is not None or getattr(tool, "func", None) is None:
+        return tool
+    func = tool.func
+
+    @functools.wraps(func)
+    async def _coroutine(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+
+    tool.coroutine = _coroutine
+    return tool
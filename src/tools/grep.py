@@ -1,93 +1,247 @@
-import fnmatch
+import os
+import re
 from pathlib import Path
-from typing import Optional, List
+from typing import Iterator, Optional, List
 
 from langchain.tools import ToolRuntime, tool
 
 
-from .ignore import DEFAULT_IGNORE_PATTERNS
+from src.config.config import get_config_section
+from .artifact import tool_artifact
+from .executor import async_variant
+from .ignore import DEFAULT_IGNORE_PATTERNS, match_patterns
+from .output_budget import budget_output
+from .search import FileResult, ScanOptions, compile_pattern, iter_file_results
+from .trigram_index import DEFAULT_MAX_STALENESS, get_index, required_literals
+from .walk import walk_files
 
 
-@tool("grep", parse_docstring=True)
-def grep_tool(
-        runtime: ToolRuntime,
+def _iter_files(paths: List[str], recursive: bool) -> Iterator[str]:
+    """惰性产出要搜索的文件（应用默认忽略规则，忽略的目录不会被遍历）"""
+    for path_str in paths:
+        if os.path.isfile(path_str):
+            if not match_patterns(os.path.basename(path_str), False, DEFAULT_IGNORE_PATTERNS):
+                yield path_str
+        elif os.path.isdir(path_str):
+            yield from walk_files(path_str, DEFAULT_IGNORE_PATTERNS, recursive=recursive)
+
+
+def _walk_order_key(path: str) -> tuple:
+    """与walk_files相同的顺序：同一目录下先文件后子目录，各自按名称排序"""
+    parts = path.split(os.sep)
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+def _indexed_files(
+        pattern: str,
+        paths: List[str],
+        case_sensitive: bool,
+        recursive: bool,
+        invert: bool,
+        regex: bool,
+) -> Optional[List[str]]:
+    """用项目根目录的trigram索引缩小候选文件范围，无法使用索引时返回None"""
+    settings = get_config_section(["tools", "grep"]) or {}
+    if not settings.get("use_index") or invert or not recursive:
+        return None
+
+    # 只对项目根目录（当前工作目录）内的目录搜索使用索引
+    root = os.path.abspath(os.getcwd())
+    dirs = [os.path.abspath(p) for p in paths]
+    if not all(os.path.isdir(d) and (d == root or d.startswith(root + os.sep)) for d in dirs):
+        return None
+
+    # 索引只保存ASCII小写化的trigram，非ASCII字面量在忽略大小写时无法可靠命中
+    literals = required_literals(pattern, regex)
+    if not literals or (not case_sensitive and not all(literal.isascii() for literal in literals)):
+        return None
+
+    index = get_index(root)
+    # 索引遍历时跳过了被忽略的目录（如 build/、node_modules/ 和 .gitignore 中的目录），
+    # 搜索这些目录时必须全量扫描，否则会错误地返回没有匹配
+    if not all(index.covers(d) for d in dirs):
+        return None
+    if not index.ready:
+        # 首次搜索在后台建立索引，本次仍然全量扫描
+        index.start_background_build()
+        return None
+    try:
+        index.update(max_staleness=settings.get("index_max_staleness", DEFAULT_MAX_STALENESS))
+        candidates = index.candidates(literals)
+    except Exception:
+        return None
+    if candidates is None:
+        return None
+
+    prefixes = tuple(d if d.endswith(os.sep) else d + os.sep for d in dirs)
+    return sorted((c for c in candidates if c.startswith(prefixes)), key=_walk_order_key)
+
+
+OUTPUT_MODES = ("content", "files_with_matches", "count")
+
+
+def _truncate_matches(result: FileResult, keep: int, after: int) -> None:
+    """只保留文件结果中的前keep个匹配行及其上下文行"""
+    matches = [line.line_num for line in result.lines if not line.is_context]
+    last_line = matches[keep - 1] + after
+    result.lines = [line for line in result.lines if line.line_num <= last_line]
+    result.count = keep
+
+
+def _format_file_lines(result: FileResult, before: int, after: int) -> List[str]:
+    """格式化单个文件的匹配行与上下文行，显示上下文时不连续的行组之间用 -- 分隔"""
+    lines = []
+    previous_line = 0
+    for line in result.lines:
+        if (before or after) and previous_line and line.line_num > previous_line + 1:
+            lines.append("--")
+        separator = "-" if line.is_context else ":"
+        lines.append(f"{line.path}{separator}{line.line_num}{separator} {line.content}")
+        previous_line = line.line_num
+    return lines
+
+
+def _grep(
         pattern: str,
         paths: List[str],
         case_sensitive: bool = True,
         recursive: bool = False,
         invert: bool = False,
-):
-    """Searches for a text pattern in files/directories. Returns matching lines with context.
+        regex: bool = False,
+        output_mode: str = "content",
+        max_results: int = 200,
+        max_count: Optional[int] = None,
+        context: int = 0,
+        before_context: Optional[int] = None,
+        after_context: Optional[int] = None,
+) -> str:
+    """搜索文件内容并格式化输出"""
+    # 校验输出参数
+    if output_mode not in OUTPUT_MODES:
+        return f"Error: invalid output_mode '{output_mode}'. Use one of: {', '.join(OUTPUT_MODES)}."
+    before = context if before_context is None else before_context
+    after = context if after_context is None else after_context
+    for name, value in (("max_results", max_results), ("max_count", max_count), ("context", before), ("context", after)):
+        if value is not None and value < 0:
+            return f"Error: {name} must not be negative."
 
-    Args:
-        pattern: Text to search for (simple string matching, not regex).
-        paths: List of absolute paths to files/directories to search.
-        case_sensitive: Whether the search is case-sensitive (default: True).
-        recursive: If paths include directories, search subdirectories (default: False).
-        invert: Return lines that DO NOT match the pattern (default: False).
-    """
-    # 预处理模式（大小写不敏感时转为小写）
-    target = pattern if case_sensitive else pattern.lower()
+    # 编译搜索模式
+    try:
+        matcher = compile_pattern(pattern, case_sensitive=case_sensitive, regex=regex)
+    except re.error as e:
+        return f"Error: invalid regular expression '{pattern}': {e}"
 
-    # 收集所有要搜索的文件
-    files_to_search: List[Path] = []
+    # 校验路径合法性
     for path_str in paths:
         path = Path(path_str)
-        # 校验路径合法性
         if not path.is_absolute():
             return f"Error: {path_str} is not an absolute path. Provide absolute paths."
         if not path.exists():
             return f"Error: {path_str} does not exist. Provide valid paths."
 
-        # 处理文件
-        if path.is_file():
-            files_to_search.append(path)
-        # 处理目录（递归或非递归）
-        elif path.is_dir():
-            if recursive:
-                # 递归遍历所有文件
-                for file in path.rglob("*"):
-                    if file.is_file():
-                        files_to_search.append(file)
-            else:
-                # 仅当前目录文件
-                for file in path.iterdir():
-                    if file.is_file():
-                        files_to_search.append(file)
-
-    # 过滤文件（应用默认忽略规则）
-    filtered_files = []
-    for file in files_to_search:
-        if not any(fnmatch.fnmatch(file.name, p) for p in DEFAULT_IGNORE_PATTERNS):
-            filtered_files.append(file)
-    files_to_search = filtered_files
-
-    # 搜索文件内容
+    files_to_search = _indexed_files(pattern, paths, case_sensitive, recursive, invert, regex)
+    if files_to_search is None:
+        files_to_search = _iter_files(paths, recursive)
+
+    # 只有content模式需要解码匹配行；files_with_matches模式找到第一处匹配即可停止扫描该文件
+    content_mode = output_mode == "content"
+    options = ScanOptions(
+        invert=invert,
+        max_count=1 if output_mode == "files_with_matches" else max_count,
+        before=before if content_mode else 0,
+        after=after if content_mode else 0,
+        collect_lines=content_mode,
+    )
+
+    # 并发搜索文件内容（结果按文件顺序流式返回），达到上限后立即停止遍历与扫描
+    # max_results在content模式下限制匹配行数，其他模式下限制文件数
     results = []
-    for file in files_to_search:
-        try:
-            # 读取文件内容（按行处理）
-            with open(file, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()
-        except (PermissionError, IsADirectoryError):
-            continue  # 跳过无权限或意外目录
-
-        # 检查每行是否匹配
-        for line_num, line in enumerate(lines, 1):  # 行号从1开始
-            content = line.strip()
-            # 大小写处理
-            line_to_check = content if case_sensitive else content.lower()
-            # 匹配逻辑
-            is_match = (target in line_to_check) != invert  # 取反如果invert=True
-            if is_match:
-                results.append(f"{file}:{line_num}: {content}")
+    matched_files = 0
+    total = 0
+    truncated = False
+    file_results = iter_file_results(files_to_search, matcher, options)
+    try:
+        for file_result in file_results:
+            shown = total if content_mode else matched_files
+            if max_results and shown >= max_results:
+                # 上限之后仍有结果
+                truncated = True
+                break
+            matched_files += 1
+            total += file_result.count
+            if output_mode == "files_with_matches":
+                results.append(str(file_result.path))
+            elif output_mode == "count":
+                results.append(f"{file_result.path}:{file_result.count}")
+            else:
+                if max_results and total > max_results:
+                    # 截掉超出上限的匹配行及其后的上下文
+                    _truncate_matches(file_result, file_result.count - (total - max_results), after)
+                    total = max_results
+                    truncated = True
+                if results and (before or after):
+                    results.append("--")
+                results.extend(_format_file_lines(file_result, before, after))
+                if truncated:
+                    break
+    finally:
+        # 提前退出时取消尚未完成的扫描
+        file_results.close()
 
     # 格式化输出
     if not results:
         return f"No matches found for '{pattern}'."
 
-    return (
-            f"Matches for '{pattern}' ({len(results)} total):\n```\n"
-            + "\n".join(results)
-            + "\n```"
-    )
\ No newline at end of file
+    note = f", truncated at max_results={max_results}; narrow the search to see more" if truncated else ""
+    if output_mode == "files_with_matches":
+        header = f"Files matching '{pattern}' ({matched_files} files{note}):"
+    elif output_mode == "count":
+        header = f"Match counts for '{pattern}' ({matched_files} files, {total} total matches{note}):"
+    else:
+        header = f"Matches for '{pattern}' ({total} total{note}):"
+    return header + "\n```\n" + "\n".join(results) + "\n```"
+
+
+@async_variant
+@tool("grep", parse_docstring=True, response_format="content_and_artifact")
+def grep_tool(
+        runtime: ToolRuntime,
+        pattern: str,
+        paths: List[str],
+        case_sensitive: bool = True,
+        recursive: bool = False,
+        invert: bool = False,
+        regex: bool = False,
+        output_mode: str = "content",
+        max_results: int = 200,
+        max_count: Optional[int] = None,
+        context: int = 0,
+        before_context: Optional[int] = None,
+        after_context: Optional[int] = None,
+):
+    """Searches for a text pattern in files/directories. Returns matching lines with context.
+
+    Directories excluded by default ignore rules or by .gitignore/.ignore files are skipped, and so are binary files.
+    The search stops as soon as max_results is reached; narrow the pattern or paths if the output is truncated.
+
+    Args:
+        pattern: Text to search for (plain string by default, or a Python regular expression when regex is True).
+        paths: List of absolute paths to files/directories to search.
+        case_sensitive: Whether the search is case-sensitive (default: True).
+        recursive: If paths include directories, search subdirectories (default: False).
+        invert: Return lines that DO NOT match the pattern (default: False).
+        regex: Treat pattern as a regular expression (default: False).
+        output_mode: "content" returns matching lines, "files_with_matches" returns only file paths, "count" returns per-file match counts (default: "content").
+        max_results: Maximum number of matching lines (content mode) or files (other modes) to return; 0 means unlimited (default: 200).
+        max_count: Stop searching a file after this many matching lines (default: unlimited).
+        context: Number of lines to show before and after each match, like grep -C (default: 0).
+        before_context: Number of lines to show before each match, like grep -B (overrides context).
+        after_context: Number of lines to show after each match, like grep -A (overrides context).
+    """
+    content, spill_id = budget_output("grep", _grep(
+        pattern, paths, case_sensitive, recursive, invert, regex,
+        output_mode, max_results, max_count, context, before_context, after_context,
+    ))
+    return content, tool_artifact(
+        "grep", content, pattern=pattern, paths=paths, output_mode=output_mode, spill_id=spill_id
+    )
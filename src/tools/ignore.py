@@ -1,3 +1,9 @@
+import fnmatch
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
 DEFAULT_IGNORE_PATTERNS = [
     # Version Control
     ".git/**",
@@ -74,4 +80,325 @@ DEFAULT_IGNORE_PATTERNS = [
     ".DS_Store",
     "Thumbs.db",
     "desktop.ini",
-]
\ No newline at end of file
+    # Code Agent
+    ".code_agent/**",
+]
+
+
+# 目录中会被读取的忽略规则文件，后者优先级更高
+IGNORE_FILES = (".gitignore", ".ignore")
+
+# glob中的通配符
+_MAGIC_CHARS = re.compile(r"[*?[]")
+
+# 与fnmatch.fnmatch保持一致：仅在Windows上大小写不敏感
+_CASE_INSENSITIVE = os.path.normcase("A") == "a"
+
+
+class _NameMatcher:
+    """按模式种类编译的文件名匹配器。
+
+    不含通配符的模式放入集合做O(1)查找，"*.ext" 形式的模式用 str.endswith
+    批量判断，其余模式合并为单个正则表达式。
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        exact = set()
+        suffixes = []
+        regexes = []
+        for pattern in patterns:
+            if _CASE_INSENSITIVE:
+                pattern = pattern.lower()
+            if not _MAGIC_CHARS.search(pattern):
+                exact.add(pattern)
+            elif pattern.startswith("*") and not _MAGIC_CHARS.search(pattern[1:]):
+                suffixes.append(pattern[1:])
+            else:
+                regexes.append(fnmatch.translate(pattern))
+        self._exact = frozenset(exact)
+        self._suffixes = tuple(suffixes)
+        self._regex = re.compile("|".join(regexes)) if regexes else None
+
+    def match(self, name: str) -> bool:
+        if _CASE_INSENSITIVE:
+            name = name.lower()
+        if name in self._exact:
+            return True
+        if self._suffixes and name.endswith(self._suffixes):
+            return True
+        return self._regex is not None and self._regex.match(name) is not None
+
+
+class IgnoreMatcher:
+    """编译后的glob模式集合，语义与 match_patterns 相同。
+
+    请通过 get_matcher 获取实例，相同的模式集合只会编译一次。
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        any_patterns = []
+        dir_patterns = []
+        for pattern in patterns:
+            if pattern.endswith("/**"):
+                dir_patterns.append(pattern[:-3])
+            elif pattern.endswith("/"):
+                dir_patterns.append(pattern[:-1])
+            else:
+                any_patterns.append(pattern)
+        self._any = _NameMatcher(any_patterns)
+        self._dir = _NameMatcher(dir_patterns)
+
+    def match(self, name: str, is_dir: bool) -> bool:
+        """判断文件或目录名是否匹配任一模式。"""
+        return self._any.match(name) or (is_dir and self._dir.match(name))
+
+
+@lru_cache(maxsize=64)
+def _get_matcher_cached(patterns: Tuple[str, ...]) -> IgnoreMatcher:
+    return IgnoreMatcher(patterns)
+
+
+def get_matcher(patterns: Sequence[str]) -> IgnoreMatcher:
+    """获取模式集合对应的编译匹配器（按模式集合缓存）。"""
+    return _get_matcher_cached(tuple(patterns))
+
+
+def match_patterns(name: str, is_dir: bool, patterns: Sequence[str]) -> bool:
+    """判断文件或目录名是否匹配任一glob模式。
+
+    以 "/**" 或 "/" 结尾的模式（如 "node_modules/**"、"docs/"）只匹配目录名，
+    其余模式同时匹配文件名和目录名。
+
+    参数：
+        name: 文件或目录名（不含路径）。
+        is_dir: 该名称是否为目录。
+        patterns: glob模式列表。
+    """
+    return get_matcher(patterns).match(name, is_dir)
+
+
+def _translate_gitignore_glob(pattern: str) -> str:
+    """将gitignore风格的glob转换为正则表达式（* 和 ? 不匹配 /，** 可跨目录）。"""
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                i += 2
+                if i < n and pattern[i] == "/":
+                    # "**/" 匹配零个或多个目录
+                    out.append("(?:.*/)?")
+                    i += 1
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 2)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class GitIgnoreRules:
+    """单个目录下 .gitignore/.ignore 文件中的规则。
+
+    支持注释、转义、取反（!）、仅目录（结尾的 /）、锚定（包含 /）和 ** 语法，
+    同一目录内后出现的规则优先。
+    """
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base
+        # (正则, 是否取反, 是否仅匹配目录, 是否相对base锚定)
+        self._rules: List[Tuple[re.Pattern, bool, bool, bool]] = []
+        for line in lines:
+            rule = self._parse_line(line)
+            if rule is not None:
+                self._rules.append(rule)
+        # 没有取反规则时匹配结果与顺序无关，可将同类规则合并为单个正则
+        self._combined: Optional[Dict[Tuple[bool, bool], re.Pattern]] = None
+        if not any(negate for _, negate, _, _ in self._rules):
+            groups: Dict[Tuple[bool, bool], List[str]] = {}
+            for regex, _, dir_only, anchored in self._rules:
+                groups.setdefault((dir_only, anchored), []).append(regex.pattern)
+            flags = re.IGNORECASE if _CASE_INSENSITIVE else 0
+            self._combined = {key: re.compile("|".join(parts), flags) for key, parts in groups.items()}
+
+    @staticmethod
+    def _parse_line(line: str) -> Optional[Tuple[re.Pattern, bool, bool, bool]]:
+        line = line.rstrip("\n").rstrip("\r")
+        # 去掉未转义的行尾空格
+        stripped = line.rstrip(" ")
+        if stripped.endswith("\\") and len(stripped) < len(line):
+            stripped += " "
+        line = stripped
+        if not line or line.startswith("#"):
+            return None
+        negate = False
+        if line.startswith("!"):
+            negate = True
+            line = line[1:]
+        elif line.startswith(("\\#", "\\!")):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return None
+        anchored = "/" in line
+        line = line.lstrip("/")
+        flags = re.IGNORECASE if _CASE_INSENSITIVE else 0
+        regex = re.compile(f"(?s:{_translate_gitignore_glob(line)})\\Z", flags)
+        return regex, negate, dir_only, anchored
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def match(self, rel_path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """判断路径是否被规则忽略。
+
+        参数：
+            rel_path: 相对于base、以 / 分隔的路径。
+            name: 文件或目录名。
+            is_dir: 是否为目录。
+
+        返回：
+            True表示忽略，False表示被取反规则显式保留，None表示没有规则匹配。
+        """
+        if self._combined is not None:
+            for (dir_only, anchored), regex in self._combined.items():
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(rel_path if anchored else name):
+                    return True
+            return None
+        for regex, negate, dir_only, anchored in reversed(self._rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path if anchored else name):
+                return not negate
+        return None
+
+
+# 已解析的忽略文件缓存：{目录: (各忽略文件的mtime, 规则)}
+_rules_cache: Dict[str, Tuple[Tuple[int, ...], GitIgnoreRules]] = {}
+
+
+def _load_ignore_rules(directory: str, names: Sequence[str]) -> Optional[GitIgnoreRules]:
+    """读取目录下指定的忽略文件并解析为规则（按mtime缓存）。"""
+    paths = [os.path.join(directory, name) for name in names]
+    try:
+        mtimes = tuple(os.stat(p).st_mtime_ns for p in paths)
+    except OSError:
+        return None
+    cached = _rules_cache.get(directory)
+    if cached is not None and cached[0] == mtimes:
+        return cached[1]
+    lines: List[str] = []
+    for p in paths:
+        try:
+            with open(p, "r", encoding="utf-8", errors="ignore") as f:
+                lines.extend(f.read().splitlines())
+        except OSError:
+            continue
+    rules = GitIgnoreRules(directory, lines)
+    _rules_cache[directory] = (mtimes, rules)
+    return rules
+
+
+def _find_repo_root(path: str) -> Optional[str]:
+    """向上查找包含 .git 的目录。"""
+    current = path
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+class IgnoreContext:
+    """遍历目录时的忽略上下文：编译后的忽略模式 + 沿途各级目录的忽略文件规则。
+
+    深层目录的规则优先于浅层目录，与git的语义一致。上下文是不可变的，
+    进入子目录时通过 child 派生新的上下文。
+    """
+
+    def __init__(self, matcher: IgnoreMatcher, frames: Tuple[GitIgnoreRules, ...] = (), use_ignore_files: bool = True):
+        self.matcher = matcher
+        self.frames = frames
+        self.use_ignore_files = use_ignore_files
+
+    @classmethod
+    def for_directory(cls, path: str, patterns: Sequence[str], use_ignore_files: bool = True) -> "IgnoreContext":
+        """为即将遍历的目录创建上下文，会加载从仓库根目录到该目录父目录的忽略文件。
+
+        参数：
+            path: 即将遍历的目录（其自身的忽略文件在扫描时加载）。
+            patterns: 忽略模式列表。
+            use_ignore_files: 是否读取 .gitignore/.ignore 文件。
+        """
+        context = cls(get_matcher(patterns), use_ignore_files=use_ignore_files)
+        if not use_ignore_files:
+            return context
+        path = os.path.abspath(path)
+        repo_root = _find_repo_root(path)
+        if repo_root is None or repo_root == path:
+            return context
+        # 从仓库根目录依次向下到path的父目录
+        ancestors = []
+        current = os.path.dirname(path)
+        while True:
+            ancestors.append(current)
+            if current == repo_root:
+                break
+            current = os.path.dirname(current)
+        for directory in reversed(ancestors):
+            names = [name for name in IGNORE_FILES if os.path.isfile(os.path.join(directory, name))]
+            context = context.child(directory, names)
+        return context
+
+    def child(self, directory: str, names: Iterable[str]) -> "IgnoreContext":
+        """派生进入directory后的上下文。
+
+        参数：
+            directory: 子目录路径。
+            names: 子目录中的条目名（用于判断是否存在忽略文件，避免额外的stat调用）。
+        """
+        if not self.use_ignore_files:
+            return self
+        present = [name for name in IGNORE_FILES if name in names]
+        if not present:
+            return self
+        rules = _load_ignore_rules(directory, present)
+        if not rules:
+            return self
+        return IgnoreContext(self.matcher, self.frames + (rules,), self.use_ignore_files)
+
+    def is_ignored(self, path: str, name: str, is_dir: bool) -> bool:
+        """判断路径是否应被忽略。"""
+        if self.matcher.match(name, is_dir):
+            return True
+        for rules in reversed(self.frames):
+            rel_path = path[len(rules.base):].lstrip(os.sep)
+            if os.sep != "/":
+                rel_path = rel_path.replace(os.sep, "/")
+            result = rules.match(rel_path, name, is_dir)
+            if result is not None:
+                return result
+        return False
@@ -1,27 +1,18 @@
-import fnmatch
 from pathlib import Path
 from typing import Optional, List
 
 from langchain.tools import ToolRuntime, tool
 
 
-from .ignore import DEFAULT_IGNORE_PATTERNS
+from .artifact import tool_artifact
+from .executor import async_variant
+from .ignore import DEFAULT_IGNORE_PATTERNS, IgnoreContext, match_patterns
+from .output_budget import budget_output
+from .walk import scan_dir
 
 
-@tool("ls", parse_docstring=True)
-def ls_tool(
-        runtime: ToolRuntime,
-        path: str,
-        match: Optional[List[str]] = None,
-        ignore: Optional[List[str]] = None,
-):
-    """Lists files and directories in a given path. Optionally provide glob patterns to match and ignore.
-
-    Args:
-        path: Absolute path to list contents from (relative paths are not allowed).
-        match: Optional list of glob patterns to include (e.g., ["*.py", "docs/"]).
-        ignore: Optional list of glob patterns to exclude (e.g., [".git", "*.log"]).
-    """
+def _list_directory(path: str, match: Optional[List[str]], ignore: Optional[List[str]]) -> str:
+    """列出目录内容并格式化输出"""
     _path = Path(path)
 
     # 路径合法性校验
@@ -32,32 +23,19 @@ def ls_tool(
     if not _path.is_dir():
         return f"Error: {path} is not a directory. Provide a directory path."
 
-    # 读取目录内容（处理权限问题）
+    # 读取目录内容（处理权限问题），同时应用忽略模式（ignore + 默认忽略规则 + .gitignore）
+    ignore_patterns = (ignore or []) + DEFAULT_IGNORE_PATTERNS
     try:
-        items = list(_path.iterdir())
+        items, _ = scan_dir(path, IgnoreContext.for_directory(path, ignore_patterns))
     except PermissionError:
         return f"Error: Permission denied to access {path}."
 
     # 排序：目录优先，按名称字母序
-    items.sort(key=lambda x: (x.is_file(), x.name.lower()))
+    items.sort(key=lambda x: (not x.is_dir(), x.name.lower()))
 
     # 应用匹配模式（match）
     if match:
-        filtered = []
-        for item in items:
-            for pattern in match:
-                if fnmatch.fnmatch(item.name, pattern):
-                    filtered.append(item)
-                    break
-        items = filtered
-
-    # 应用忽略模式（ignore + 默认忽略规则）
-    ignore_patterns = (ignore or []) + DEFAULT_IGNORE_PATTERNS
-    filtered = []
-    for item in items:
-        if not any(fnmatch.fnmatch(item.name, p) for p in ignore_patterns):
-            filtered.append(item)
-    items = filtered
+        items = [item for item in items if match_patterns(item.name, item.is_dir(), match)]
 
     # 格式化输出
     if not items:
@@ -68,4 +46,25 @@ def ls_tool(
             f"Contents of {path}:\n```\n"
             + "\n".join(result_lines)
             + "\n```"
-    )
\ No newline at end of file
+    )
+
+
+@async_variant
+@tool("ls", parse_docstring=True, response_format="content_and_artifact")
+def ls_tool(
+        runtime: ToolRuntime,
+        path: str,
+        match: Optional[List[str]] = None,
+        ignore: Optional[List[str]] = None,
+):
+    """Lists files and directories in a given path. Optionally provide glob patterns to match and ignore.
+
+    Entries excluded by default ignore rules or by .gitignore/.ignore files are not listed.
+
+    Args:
+        path: Absolute path to list contents from (relative paths are not allowed).
+        match: Optional list of glob patterns to include (e.g., ["*.py", "docs/"]).
+        ignore: Optional list of glob patterns to exclude (e.g., [".git", "*.log"]).
+    """
+    content, spill_id = budget_output("ls", _list_directory(path, match, ignore))
+    return content, tool_artifact("ls", content, path=path, spill_id=spill_id)
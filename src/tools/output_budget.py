@@ -0,0 +1,180 @@
+import os
+import re
+import uuid
+from typing import Optional, Tuple
+
+from langchain.tools import ToolRuntime, tool
+
+from src.config.config import get_config_section
+
+from .executor import async_variant
+
+# 超出上限的完整输出保存在项目根目录下的 .code_agent/spill 中（该目录在默认忽略规则内）
+SPILL_DIR = os.path.join(".code_agent", "spill")
+
+# 返回给模型的单次工具输出的默认字符上限，截断时保留开头和结尾
+DEFAULT_MAX_OUTPUT_CHARS = 20000
+_HEAD_RATIO = 0.6
+
+# 最多保留的溢出文件数，以及单个溢出文件的字符上限
+_MAX_SPILL_FILES = 200
+_MAX_SPILL_CHARS = 50_000_000
+
+# read_output 每页的默认行数，以及单行的最大字符数
+_DEFAULT_PAGE_LINES = 200
+_MAX_LINE_CHARS = 2000
+
+_SPILL_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def _settings() -> dict:
+    return get_config_section(["tools", "output_budget"]) or {}
+
+
+def max_output_chars() -> int:
+    return _settings().get("max_chars", DEFAULT_MAX_OUTPUT_CHARS)
+
+
+def _spill_path(spill_id: str) -> str:
+    return os.path.join(SPILL_DIR, f"{spill_id}.txt")
+
+
+def _prune_spill_files() -> None:
+    """删除最早的溢出文件，只保留最近的 _MAX_SPILL_FILES 个"""
+    try:
+        entries = [entry for entry in os.scandir(SPILL_DIR) if entry.name.endswith(".txt")]
+    except FileNotFoundError:
+        return
+    if len(entries) <= _MAX_SPILL_FILES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - _MAX_SPILL_FILES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def spill_marker(omitted: int, spill_id: Optional[str]) -> str:
+    """截断处的省略标记，有溢出文件时提示如何读取完整输出"""
+    if not spill_id:
+        return f"\n... [{omitted} characters omitted] ...\n"
+    return (
+        f"\n... [{omitted} characters omitted; full output saved as '{spill_id}', "
+        f"use the read_output tool with spill_id='{spill_id}' to page through it] ...\n"
+    )
+
+
+class SpillFile:
+    """逐步写入的溢出文件，用于保存无法整体放入内存的输出（如长时间运行的命令）"""
+
+    def __init__(self, tool_name: str):
+        self.spill_id = f"{tool_name}-{uuid.uuid4().hex[:12]}"
+        self._file = None
+        self._size = 0
+        try:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            _prune_spill_files()
+            self._file = open(_spill_path(self.spill_id), "w", encoding="utf-8", errors="replace")
+        except OSError:
+            self.spill_id = None
+
+    def write(self, text: str) -> None:
+        if self._file is None:
+            return
+        if self._size + len(text) > _MAX_SPILL_CHARS:
+            self._file.write(text[:_MAX_SPILL_CHARS - self._size])
+            self._file.write(f"\n... [spill file truncated at {_MAX_SPILL_CHARS} characters] ...\n")
+            self.close()
+            return
+        self._file.write(text)
+        self._size += len(text)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def budget_output(tool_name: str, content: str, max_chars: Optional[int] = None) -> Tuple[str, Optional[str]]:
+    """把工具输出限制在字符上限以内。
+
+    超出上限时完整输出写入溢出文件，返回的内容只保留开头和结尾，
+    中间用带溢出ID的省略标记代替，模型可以通过 read_output 工具按行分页读取。
+
+    返回：
+        (返回给模型的内容, 溢出ID；未截断或写文件失败时为None)
+    """
+    max_chars = max_chars or max_output_chars()
+    if len(content) <= max_chars:
+        return content, None
+
+    spill = SpillFile(tool_name)
+    spill.write(content)
+    spill.close()
+
+    head = content[:int(max_chars * _HEAD_RATIO)]
+    tail = content[len(content) - (max_chars - len(head)):]
+    omitted = len(content) - len(head) - len(tail)
+    return head + spill_marker(omitted, spill.spill_id) + tail, spill.spill_id
+
+
+def _read_spill(spill_id: str, offset: int, limit: int) -> str:
+    """按行读取溢出文件并格式化输出"""
+    if not _SPILL_ID_PATTERN.match(spill_id):
+        return f"Error: invalid spill_id: {spill_id}"
+    path = _spill_path(spill_id)
+    if not os.path.isfile(path):
+        return f"Error: no saved output with spill_id '{spill_id}'. It may have been cleaned up."
+    if offset < 1 or limit < 1:
+        return "Error: offset and limit must be positive integers."
+
+    budget = max_output_chars()
+    lines = []
+    used = 0
+    last_line = offset - 1
+    has_more = False
+    total_lines = 0
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line_num, line in enumerate(f, start=1):
+            total_lines = line_num
+            if line_num < offset:
+                continue
+            if len(lines) >= limit or used >= budget:
+                has_more = True
+                break
+            line = line.rstrip("\n")
+            if len(line) > _MAX_LINE_CHARS:
+                line = line[:_MAX_LINE_CHARS] + f"... [{len(line) - _MAX_LINE_CHARS} characters omitted]"
+            lines.append(f"{line_num:6}\t{line}")
+            used += len(line)
+            last_line = line_num
+
+    if not lines:
+        return f"No lines at offset {offset} in '{spill_id}' (the output has {total_lines} lines)."
+    footer = (
+        f"\n[More output available: call read_output with offset={last_line + 1}]"
+        if has_more else "\n[End of output]"
+    )
+    return f"Lines {offset}-{last_line} of '{spill_id}':\n```\n" + "\n".join(lines) + "\n```" + footer
+
+
+@async_variant
+@tool("read_output", parse_docstring=True)
+def read_output_tool(
+        runtime: ToolRuntime,
+        spill_id: str,
+        offset: int = 1,
+        limit: int = _DEFAULT_PAGE_LINES,
+):
+    """Reads a page of a tool output that was too large to return in full.
+
+    When a tool output is truncated, the omission marker contains a spill_id. Use this tool to page
+    through the full output by line number instead of re-running the original command.
+
+    Args:
+        spill_id: The spill_id shown in the truncated output's omission marker.
+        offset: 1-based line number to start reading from.
+        limit: Maximum number of lines to return.
+    """
+    return _read_spill(spill_id, offset, limit)
@@ -0,0 +1,351 @@
+import io
+import mmap
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    from re import _constants as _sre_constants, _parser as _sre_parser
+except ImportError:  # Python < 3.11
+    import sre_constants as _sre_constants
+    import sre_parse as _sre_parser
+
+# 默认并发度：文件读取以I/O为主，线程数可以略多于CPU核数
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# 用于判断二进制文件的文件头大小
+_BINARY_SNIFF_BYTES = 8192
+
+# 小于该大小的文件直接整体读入，更大的文件使用mmap
+_MMAP_MIN_BYTES = 256 * 1024
+
+# 统计行号时每次切片的最大字节数
+_COUNT_CHUNK_BYTES = 1024 * 1024
+
+# 大文件按窗口搜索，扫描完的窗口会释放其映射页面
+_WINDOW_BYTES = 16 * 1024 * 1024
+
+# 逐行扫描时每隔多少行检查一次停止标志
+_STOP_CHECK_LINES = 4096
+
+
+@dataclass
+class LineMatch:
+    """单条匹配结果（或上下文行）"""
+    path: Union[str, Path]
+    line_num: int
+    content: str
+    is_context: bool = False
+
+
+@dataclass
+class FileResult:
+    """单个文件的搜索结果"""
+    path: Union[str, Path]
+    count: int  # 匹配的行数（受max_count限制）
+    lines: List[LineMatch] = field(default_factory=list)  # 匹配行及上下文行，按行号排序
+
+
+@dataclass
+class ScanOptions:
+    """文件扫描选项"""
+    invert: bool = False
+    max_count: Optional[int] = None  # 每个文件最多匹配的行数
+    before: int = 0  # 匹配行之前的上下文行数
+    after: int = 0  # 匹配行之后的上下文行数
+    collect_lines: bool = True  # 为False时只计数，不解码任何行
+
+
+# 在bytes正则中按单个字节而不是按字符匹配的语法：. 、取反字符类、\w \d \s 等字符类别，
+# 以及 \b \B（单词边界依赖 \w 的定义）
+_BYTE_UNSAFE_OPS = {_sre_constants.ANY, _sre_constants.NOT_LITERAL, _sre_constants.CATEGORY, _sre_constants.NEGATE}
+_BYTE_UNSAFE_AT = {_sre_constants.AT_BOUNDARY, _sre_constants.AT_NON_BOUNDARY}
+
+
+def _byte_safe(parsed) -> bool:
+    """正则的解析树中是否没有在字节和字符上匹配结果不同的语法"""
+    for op, av in parsed:
+        if op in _BYTE_UNSAFE_OPS or (op == _sre_constants.AT and av in _BYTE_UNSAFE_AT):
+            return False
+        if op == _sre_constants.IN and not _byte_safe(av):
+            return False
+        for item in av if isinstance(av, (tuple, list)) else (av,):
+            if isinstance(item, _sre_parser.SubPattern) and not _byte_safe(item):
+                return False
+            if isinstance(item, list) and any(
+                    isinstance(sub, _sre_parser.SubPattern) and not _byte_safe(sub) for sub in item):
+                return False
+    return True
+
+
+def _regex_byte_safe(source: str, flags: int) -> bool:
+    try:
+        return _byte_safe(_sre_parser.parse(source, flags))
+    except Exception:
+        return False
+
+
+def compile_pattern(pattern: str, case_sensitive: bool = True, regex: bool = False) -> re.Pattern:
+    """将搜索模式编译为正则表达式。
+
+    普通字符串（区分大小写，或为ASCII）以及不含 . 、取反字符类、\w \d \s \b 等语法的
+    ASCII正则会被编译为bytes正则，直接在文件字节上搜索，匹配结果与解码后匹配相同；
+    其余正则这些语法在字节上的含义不同（如 \w 不匹配中文、. 只匹配一个字节），
+    编译为str正则并在解码后的行上匹配。
+
+    参数：
+        pattern: 搜索模式。
+        case_sensitive: 是否区分大小写。
+        regex: 为True时按正则表达式解析，否则按普通字符串匹配。
+
+    异常：
+        re.error: 如果正则表达式无效。
+    """
+    # MULTILINE使^和$在整文件搜索时也按行匹配
+    flags = re.MULTILINE if case_sensitive else re.MULTILINE | re.IGNORECASE
+    source = pattern if regex else re.escape(pattern)
+    if not regex:
+        if pattern.isascii() or case_sensitive:
+            return re.compile(source.encode("utf-8"), flags)
+    elif pattern.isascii() and _regex_byte_safe(source, flags):
+        return re.compile(source.encode("utf-8"), flags)
+    return re.compile(source, flags)
+
+
+def _is_binary(head: bytes) -> bool:
+    """根据文件开头的数据判断是否为二进制文件（与git/grep相同，检查NUL字节）。"""
+    return b"\0" in head
+
+
+def _decode_line(line: bytes) -> str:
+    return line.decode("utf-8", errors="ignore").strip()
+
+
+def _count_newlines(data, start: int, end: int) -> int:
+    """统计data[start:end]中的换行数，按块切片以避免在大文件上复制大段内存。"""
+    count = 0
+    while start < end:
+        chunk_end = min(end, start + _COUNT_CHUNK_BYTES)
+        count += data[start:chunk_end].count(b"\n")
+        start = chunk_end
+    return count
+
+
+def _line_boundary(data, target: int, size: int) -> int:
+    """返回target之后第一个行首位置（不超过size）。"""
+    if target >= size:
+        return size
+    newline = data.find(b"\n", target)
+    return size if newline == -1 else newline + 1
+
+
+def _release_pages(data, start: int, end: int) -> None:
+    """通知内核已扫描区域的页面不再需要，使大文件扫描时常驻内存保持平稳。"""
+    if not isinstance(data, mmap.mmap) or not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    start -= start % mmap.PAGESIZE
+    try:
+        data.madvise(mmap.MADV_DONTNEED, start, end - start)
+    except (OSError, ValueError):
+        pass
+
+
+def _iter_byte_matches(data, matcher: re.Pattern, stop: threading.Event) -> Iterator[Tuple[int, int, int]]:
+    """在文件字节数据上按窗口搜索，产出匹配行的(行号, 行起始位置, 行结束位置)。
+
+    窗口边界总是落在行首，因此任何单行内的匹配都完整位于某个窗口中。
+    行结束位置为换行符的位置（最后一行没有换行符时为数据长度）。
+    """
+    size = len(data)
+    line_num = 1
+    counted = 0  # line_num 对应的行起始位置
+    window_start = 0
+    while window_start < size and not stop.is_set():
+        window_end = _line_boundary(data, window_start + _WINDOW_BYTES, size)
+        pos = window_start
+        while pos < window_end:
+            m = matcher.search(data, pos, window_end)
+            if m is None:
+                break
+            start = data.rfind(b"\n", 0, m.start()) + 1
+            if start >= window_end:
+                break  # 空匹配落在下一个窗口的行首，留给下一个窗口处理
+            end = data.find(b"\n", m.start(), window_end)
+            if end == -1:
+                end = window_end
+            line_num += _count_newlines(data, counted, start)
+            counted = start
+            # 跨行的匹配（如 \s 匹配到换行符）需要在单行内再次确认
+            if m.end() <= end or matcher.search(data[start:end].rstrip(b"\r")) is not None:
+                yield line_num, start, end
+            pos = end + 1
+        # 在释放窗口前统计完其中剩余的换行，避免之后重新读入这些页面
+        line_num += _count_newlines(data, counted, window_end)
+        counted = window_end
+        _release_pages(data, window_start, window_end)
+        window_start = window_end
+
+
+def _search_bytes(path, data, matcher: re.Pattern, options: ScanOptions, stop: threading.Event) -> FileResult:
+    """在文件字节数据上搜索，只解码匹配行及其上下文行。"""
+    result = FileResult(path, 0)
+    size = len(data)
+    last_line = 0  # 最后输出的行号
+    last_end = -1  # 最后输出的行的结束位置
+    pending_after = 0
+
+    def _emit_after(limit: int):
+        # 输出上一个匹配行的后置上下文，不超过limit行号
+        nonlocal last_line, last_end, pending_after
+        while pending_after and last_line + 1 < limit and last_end + 1 < size:
+            start = last_end + 1
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = size
+            last_line += 1
+            last_end = end
+            pending_after -= 1
+            result.lines.append(LineMatch(path, last_line, _decode_line(data[start:end]), True))
+        pending_after = 0
+
+    for line_num, start, end in _iter_byte_matches(data, matcher, stop):
+        result.count += 1
+        if options.collect_lines:
+            _emit_after(line_num)
+            # 前置上下文（不与已输出的行重复）
+            before_lines = []
+            line_start = start
+            for ctx_num in range(line_num - 1, max(last_line, line_num - options.before - 1), -1):
+                line_end = line_start - 1
+                line_start = data.rfind(b"\n", 0, line_end) + 1
+                before_lines.append(LineMatch(path, ctx_num, _decode_line(data[line_start:line_end]), True))
+            result.lines.extend(reversed(before_lines))
+            result.lines.append(LineMatch(path, line_num, _decode_line(data[start:end])))
+            last_line, last_end, pending_after = line_num, end, options.after
+        if options.max_count and result.count >= options.max_count:
+            break
+    if options.collect_lines:
+        _emit_after(last_line + options.after + 1)
+    return result
+
+
+def _scan_lines(path, f, matcher: re.Pattern, options: ScanOptions, stop: threading.Event) -> FileResult:
+    """逐行扫描（取反匹配或str正则时使用），内存占用只与单行长度有关。"""
+    result = FileResult(path, 0)
+    if isinstance(matcher.pattern, bytes):
+        lines = (line.rstrip(b"\r\n") for line in f)
+        decode = _decode_line
+    else:
+        lines = (line.rstrip("\n") for line in io.TextIOWrapper(f, encoding="utf-8", errors="ignore"))
+        decode = str.strip
+    # 前置上下文缓冲区保存未解码的原始行，只有真正输出时才解码
+    before_buffer = deque(maxlen=options.before)
+    pending_after = 0
+    finished = False
+    for line_num, line in enumerate(lines, 1):
+        if line_num % _STOP_CHECK_LINES == 0 and stop.is_set():
+            break
+        if finished:
+            # 已达到max_count，只继续输出剩余的后置上下文
+            if not pending_after:
+                break
+            result.lines.append(LineMatch(path, line_num, decode(line), True))
+            pending_after -= 1
+            continue
+        if (matcher.search(line) is not None) != options.invert:
+            result.count += 1
+            if options.collect_lines:
+                result.lines.extend(LineMatch(path, n, decode(raw), True) for n, raw in before_buffer)
+                before_buffer.clear()
+                result.lines.append(LineMatch(path, line_num, decode(line)))
+                pending_after = options.after
+            if options.max_count and result.count >= options.max_count:
+                finished = True
+                if not options.collect_lines:
+                    break
+        elif options.collect_lines:
+            if pending_after:
+                result.lines.append(LineMatch(path, line_num, decode(line), True))
+                pending_after -= 1
+            else:
+                before_buffer.append((line_num, line))
+    return result
+
+
+def _scan_file(path: Union[str, Path], matcher: re.Pattern, options: ScanOptions, stop: threading.Event) -> Optional[FileResult]:
+    """扫描单个文件，没有匹配时返回None。二进制文件会被跳过。"""
+    if stop.is_set():
+        return None
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_MMAP_MIN_BYTES)
+            if not head or _is_binary(head[:_BINARY_SNIFF_BYTES]):
+                return None
+            # 取反、str正则以及含 $ 的模式（需要在行尾忽略CRLF中的\r）逐行扫描
+            if options.invert or not isinstance(matcher.pattern, bytes) or b"$" in matcher.pattern:
+                f.seek(0)
+                result = _scan_lines(path, f, matcher, options, stop)
+            elif len(head) < _MMAP_MIN_BYTES:
+                # 小文件已完整读入，无需mmap
+                result = _search_bytes(path, head, matcher, options, stop)
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    result = _search_bytes(path, data, matcher, options, stop)
+    except (OSError, ValueError):
+        # 跳过无权限、意外目录、扫描期间被删除或无法映射的文件
+        return None
+    return result if result.count else None
+
+
+def iter_file_results(
+        files: Iterable[Union[str, Path]],
+        matcher: re.Pattern,
+        options: Optional[ScanOptions] = None,
+        max_workers: Optional[int] = None,
+) -> Iterator[FileResult]:
+    """在线程池中并发扫描文件，并按文件顺序流式产出有匹配的文件结果。
+
+    同一时刻最多只有 max_workers * 2 个文件处于扫描中，
+    因此文件列表可以是惰性的生成器，内存占用与文件总数无关。
+    调用方提前停止迭代时，尚未开始的扫描任务会被取消，
+    正在扫描的大文件也会在下一个检查点停止。
+    """
+    options = options or ScanOptions()
+    workers = max_workers or DEFAULT_MAX_WORKERS
+    window = workers * 2
+    pending = deque()
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grep") as executor:
+        try:
+            for file in files:
+                pending.append(executor.submit(_scan_file, file, matcher, options, stop))
+                # 窗口已满时先产出最早提交的文件的结果，保证输出顺序稳定
+                if len(pending) >= window:
+                    result = pending.popleft().result()
+                    if result is not None:
+                        yield result
+            while pending:
+                result = pending.popleft().result()
+                if result is not None:
+                    yield result
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
+
+
+def iter_matches(
+        files: Iterable[Union[str, Path]],
+        matcher: re.Pattern,
+        invert: bool = False,
+        max_workers: Optional[int] = None,
+) -> Iterator[LineMatch]:
+    """按文件顺序流式产出所有匹配行（不含上下文）。"""
+    options = ScanOptions(invert=invert)
+    for result in iter_file_results(files, matcher, options, max_workers=max_workers):
+        yield from result.lines
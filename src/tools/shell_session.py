@@ -0,0 +1,233 @@
+import asyncio
+import codecs
+import os
+import platform
+import re
+import signal
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# 读取会话输出的块大小
+_READ_CHUNK_BYTES = 4096
+
+# 每个会话池最多保持的shell进程数，超出时关闭最久未使用的会话
+DEFAULT_MAX_SESSIONS = 8
+
+_ENV_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class ShellSessionError(Exception):
+    """会话进程意外退出（例如命令中执行了exit）"""
+
+
+def _quote(text: str) -> str:
+    """将文本转义为bash单引号字符串"""
+    return "'" + text.replace("'", "'\\''") + "'"
+
+
+class ShellSession:
+    """一个长期运行的bash进程。
+
+    命令通过stdin写入，用eval在当前shell中执行，因此cd、export和
+    virtualenv激活等状态会在多次调用之间保留。每条命令结束后会向
+    stdout和stderr各输出一行带随机标记的哨兵，用于判断命令何时完成，
+    stdout的哨兵行同时携带退出码和当前工作目录。
+    """
+
+    def __init__(self, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        self.cwd = cwd or os.getcwd()
+        self._env = env
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        # 在新会话中启动，超时时可以连同命令派生的子进程一起终止
+        self._process = await asyncio.create_subprocess_exec(
+            "bash", "--noprofile", "--norc",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            env=self._env if self._env is not None else os.environ.copy(),
+            start_new_session=True,
+        )
+
+    async def run(
+            self,
+            command: str,
+            on_output: Callable[[str, str], None],
+            cwd: Optional[str] = None,
+            env_vars: Optional[Dict[str, str]] = None,
+    ) -> int:
+        """执行一条命令，输出按块转发给on_output(stream_name, text)，返回退出码。
+
+        cwd和env_vars只作用于这一条命令，命令结束后恢复原来的工作目录和环境变量；
+        命令自身执行的cd和export（命令改变了目录或变量的值）会保留到之后的调用中。
+        调用方负责超时控制；超时或被取消时应调用close()，下次调用会在最后的工作目录中重新启动会话。
+
+        异常：
+            ShellSessionError: 会话进程在命令完成前退出。
+            ValueError: 环境变量名不合法。
+        """
+        if not self.alive:
+            await self.start()
+        marker = f"__CODE_AGENT_DONE_{uuid.uuid4().hex}__"
+        env_vars = env_vars or {}
+        for key in env_vars:
+            if not _ENV_NAME.fullmatch(key):
+                raise ValueError(f"invalid environment variable name: {key}")
+        # 记录调用前的工作目录和变量，命令结束后恢复
+        lines = []
+        steps = []
+        if cwd:
+            lines.append("__code_agent_prev_pwd=$PWD")
+            steps.append(f"cd {_quote(cwd)}")
+            steps.append("__code_agent_call_pwd=$PWD")
+        for index, (key, value) in enumerate(env_vars.items()):
+            lines.append(f"__code_agent_set_{index}=${{{key}+1}}; __code_agent_old_{index}=${{{key}-}}")
+            steps.append(f"export {key}={_quote(value)}")
+        # 命令的stdin重定向到/dev/null，避免读取stdin的命令吞掉后续输入
+        steps.append(f"eval {_quote(command)} < /dev/null")
+        lines += [" && ".join(steps), "__code_agent_rc=$?"]
+        # 命令自己没有修改的变量和目录才恢复
+        for index, (key, value) in enumerate(env_vars.items()):
+            lines.append(
+                f"if [ \"${{{key}-}}\" = {_quote(value)} ]; then "
+                f"if [ -n \"$__code_agent_set_{index}\" ]; then {key}=$__code_agent_old_{index}; else unset {key}; fi; fi"
+            )
+        if cwd:
+            lines.append(
+                "if [ \"$PWD\" = \"${__code_agent_call_pwd-}\" ]; then cd \"$__code_agent_prev_pwd\"; fi"
+            )
+        lines.append(f"printf '\\n%s %d %s\\n' '{marker}' \"$__code_agent_rc\" \"$PWD\"")
+        lines.append(f"printf '\\n%s\\n' '{marker}' >&2")
+        script = ("\n".join(lines) + "\n").encode("utf-8")
+
+        try:
+            self._process.stdin.write(script)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise ShellSessionError("shell session exited") from e
+
+        stdout_tail, _ = await asyncio.gather(
+            self._read_until_marker(self._process.stdout, marker, "stdout", on_output),
+            self._read_until_marker(self._process.stderr, marker, "stderr", on_output),
+        )
+        # 哨兵行格式: " <退出码> <工作目录>"
+        return_code, _, new_cwd = stdout_tail.strip().partition(" ")
+        if new_cwd:
+            self.cwd = new_cwd
+        return int(return_code)
+
+    @staticmethod
+    async def _read_until_marker(
+            stream: asyncio.StreamReader,
+            marker: str,
+            name: str,
+            on_output: Callable[[str, str], None],
+    ) -> str:
+        """读取输出直到哨兵行，返回哨兵之后同一行的剩余内容。
+
+        末尾可能是哨兵前缀的部分数据会暂时保留，确认不是哨兵后再转发。
+        """
+        needle = ("\n" + marker).encode("utf-8")
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = b""
+        while True:
+            chunk = await stream.read(_READ_CHUNK_BYTES)
+            if not chunk:
+                raise ShellSessionError("shell session exited")
+            pending += chunk
+            index = pending.find(needle)
+            if index != -1:
+                text = decoder.decode(pending[:index], final=True)
+                if text:
+                    on_output(name, text)
+                rest = pending[index + len(needle):]
+                while b"\n" not in rest:
+                    more = await stream.read(_READ_CHUNK_BYTES)
+                    if not more:
+                        raise ShellSessionError("shell session exited")
+                    rest += more
+                return rest.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+            keep = len(needle) - 1
+            if len(pending) > keep:
+                text = decoder.decode(pending[:-keep])
+                pending = pending[-keep:]
+                if text:
+                    on_output(name, text)
+
+    def kill(self) -> Optional[asyncio.subprocess.Process]:
+        """终止会话进程及其派生的所有子进程，返回被终止的进程"""
+        process, self._process = self._process, None
+        if process is None or process.returncode is not None:
+            return None
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return process
+
+    async def close(self) -> None:
+        process = self.kill()
+        if process is not None:
+            await process.wait()
+
+
+class ShellSessionPool:
+    """按对话线程复用shell会话的会话池。
+
+    同一线程内的命令在同一个会话中串行执行，不同线程的会话互不影响。
+    会话与创建它的事件循环绑定，事件循环变化时（如同步调用的asyncio.run）
+    会话会被重新创建。
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def get(self, key: str) -> ShellSession:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # 旧事件循环中的进程无法在新循环中读写，直接终止
+            for stale in self._sessions.values():
+                stale.kill()
+            self._sessions.clear()
+            self._loop = loop
+        session = self._sessions.get(key)
+        if session is None:
+            session = ShellSession()
+            self._sessions[key] = session
+            # 关闭最久未使用且空闲的会话
+            idle = [k for k, v in self._sessions.items() if k != key and not v.lock.locked()]
+            for evicted_key in idle[:max(0, len(self._sessions) - self.max_sessions)]:
+                await self._sessions.pop(evicted_key).close()
+        self._sessions.move_to_end(key)
+        return session
+
+    async def close_all(self) -> None:
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+
+def sessions_supported() -> bool:
+    """持久化会话依赖bash和进程组，Windows上回退为每次调用启动新进程"""
+    return platform.system() != "Windows"
+
+
+_pool: Optional[ShellSessionPool] = None
+
+
+def get_session_pool() -> ShellSessionPool:
+    global _pool
+    if _pool is None:
+        _pool = ShellSessionPool()
+    return _pool
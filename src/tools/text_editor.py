@@ -12,6 +12,11 @@ except ImportError:
 
 from langchain.tools import ToolRuntime, tool
 
+from .artifact import tool_artifact
+from .executor import async_variant
+from .output_budget import budget_output
+from .trigram_index import mark_indexes_stale
+
 TextEditorCommand = Literal[
     "view",
     "create",
@@ -19,7 +24,41 @@ TextEditorCommand = Literal[
     "insert",
 ]
 
-@tool("text_editor", parse_docstring=True)
+def _run_command(
+    command: str,
+    path: str,
+    file_text: Optional[str] = None,
+    view_range: Optional[list[int]] = None,
+    old_str: Optional[str] = None,
+    new_str: Optional[str] = None,
+    insert_line: Optional[int] = None,
+) -> str:
+    """执行编辑器命令并格式化输出"""
+    _path = Path(path)
+    try:
+        editor = TextEditor()
+        editor.validate_path(command, _path)
+        if command == "view":
+            return f"Here's the result of running `cat -n` on {_path}:\n\n```\n{editor.view(_path, view_range)}\n```"
+        elif command == "str_replace" and old_str is not None and new_str is not None:
+            occurrences = editor.str_replace(_path, old_str, new_str)
+            return f"Successfully replaced {occurrences} occurrences in {_path}."
+        elif command == "insert" and insert_line is not None and new_str is not None:
+            editor.insert(_path, insert_line, new_str)
+            return f"Successfully inserted text at line {insert_line} in {path}."
+        elif command == "create":
+            if _path.is_dir():
+                return f"Error: the path {_path} is a directory. Please provide a valid file path."
+            editor.write_file(_path, file_text if file_text is not None else "")
+            return f"File successfully created at {_path}."
+        else:
+            return f"Error: invalid command: {command}"
+    except Exception as e:
+        return f"Error: {e}"
+
+
+@async_variant
+@tool("text_editor", parse_docstring=True, response_format="content_and_artifact")
 def text_editor_tool(
     runtime: ToolRuntime,
     command: str,
@@ -49,28 +88,14 @@ def text_editor_tool(
         new_str: Only applies for the "str_replace" and "insert" commands. The new text to insert in place of the old text.
         insert_line: Only applies for the "insert" command. The line number after which to insert the text (0 for beginning of file).
     """
+    content, spill_id = budget_output(
+        "text_editor", _run_command(command, path, file_text, view_range, old_str, new_str, insert_line)
+    )
+    if command != "view":
+        # 写入后grep索引需要在下次搜索前重新检查
+        mark_indexes_stale()
+    return content, tool_artifact("text_editor", content, command=command, path=str(Path(path)), spill_id=spill_id)
 
-    _path = Path(path)
-    try:
-        editor = TextEditor()
-        editor.validate_path(command, _path)
-        if command == "view":
-            return f"Here's the result of running `cat -n` on {_path}:\n\n```\n{editor.view(_path, view_range)}\n```"
-        elif command == "str_replace" and old_str is not None and new_str is not None:
-            occurrences = editor.str_replace(_path, old_str, new_str)
-            return f"Successfully replaced {occurrences} occurrences in {_path}."
-        elif command == "insert" and insert_line is not None and new_str is not None:
-            editor.insert(_path, insert_line, new_str)
-            return f"Successfully inserted text at line {insert_line} in {path}."
-        elif command == "create":
-            if _path.is_dir():
-                return f"Error: the path {_path} is a directory. Please provide a valid file path."
-            editor.write_file(_path, file_text if file_text is not None else "")
-            return f"File successfully created at {_path}."
-        else:
-            return f"Error: invalid command: {command}"
-    except Exception as e:
-        return f"Error: {e}"
 
 class TextEditor:
     """一个独立的文本编辑器工具，用于AI代理与文件交互。
@@ -1,29 +1,23 @@
-import fnmatch
 from pathlib import Path
 from typing import Optional, List
 
 from langchain.tools import ToolRuntime, tool
 
 
-from .ignore import DEFAULT_IGNORE_PATTERNS
+from .artifact import tool_artifact
+from .executor import async_variant
+from .ignore import DEFAULT_IGNORE_PATTERNS, IgnoreContext, match_patterns
+from .output_budget import budget_output
+from .walk import scan_dir
 
 
-@tool("tree", parse_docstring=True)
-def tree_tool(
-        runtime: ToolRuntime,
+def _build_tree(
         root: str,
-        max_depth: Optional[int] = None,
-        match: Optional[List[str]] = None,
-        ignore: Optional[List[str]] = None,
-):
-    """Displays directory structure as a tree. Recursively lists subdirectories with indentation.
-
-    Args:
-        root: Absolute path to the root directory (relative paths are not allowed).
-        max_depth: Maximum recursion depth (None = unlimited).
-        match: Optional glob patterns to include items (e.g., ["*.md", "src/"]).
-        ignore: Optional glob patterns to exclude items (e.g., ["__pycache__", "*.tmp"]).
-    """
+        max_depth: Optional[int],
+        match: Optional[List[str]],
+        ignore: Optional[List[str]],
+) -> str:
+    """递归构建目录树并格式化输出"""
     root_path = Path(root)
 
     # 路径合法性校验
@@ -40,49 +34,67 @@ def tree_tool(
     # 递归构建树形结构
     tree_lines = [f"{root_path.name}/"]  # 根目录作为第一行
 
-    def _recurse(current_path: Path, prefix: str, depth: int):
-        """递归遍历目录，生成树形行"""
+    def _recurse(current_path: str, context: IgnoreContext, prefix: str, depth: int):
+        """递归遍历目录，生成树形行（被忽略的目录不会被遍历）"""
         # 检查深度限制
         if max_depth is not None and depth > max_depth:
             return
 
-        # 获取当前目录下的项目并过滤
+        # 获取当前目录下未被忽略的项目
         try:
-            items = list(current_path.iterdir())
+            items, context = scan_dir(current_path, context)
         except PermissionError:
             tree_lines.append(f"{prefix}├── [Permission Denied]")
             return
 
-        # 过滤并排序（目录优先）
-        filtered = []
-        for item in items:
-            # 应用忽略规则
-            if any(fnmatch.fnmatch(item.name, p) for p in ignore_patterns):
-                continue
-            # 应用匹配规则
-            if match and not any(fnmatch.fnmatch(item.name, p) for p in match):
-                continue
-            filtered.append(item)
-        filtered.sort(key=lambda x: (x.is_file(), x.name.lower()))
+        # 应用匹配规则并排序（目录优先）
+        if match:
+            items = [item for item in items if match_patterns(item.name, item.is_dir(), match)]
+        items.sort(key=lambda x: (not x.is_dir(), x.name.lower()))
 
         # 生成树形行
-        for i, item in enumerate(filtered):
-            is_last = i == len(filtered) - 1
+        for i, item in enumerate(items):
+            is_last = i == len(items) - 1
             connector = "└──" if is_last else "├──"
-            line = f"{prefix}{connector} {item.name}{'/' if item.is_dir() else ''}"
+            is_dir = item.is_dir()
+            line = f"{prefix}{connector} {item.name}{'/' if is_dir else ''}"
             tree_lines.append(line)
 
-            # 递归处理子目录
-            if item.is_dir():
+            # 递归处理子目录（不跟随符号链接，避免循环）
+            if is_dir and not item.is_symlink():
                 new_prefix = prefix + ("    " if is_last else "│   ")
-                _recurse(item, new_prefix, depth + 1)
+                _recurse(item.path, context, new_prefix, depth + 1)
 
     # 从根目录的子项开始递归（深度为1）
-    _recurse(root_path, "", 1)
+    root_context = IgnoreContext.for_directory(root, ignore_patterns)
+    _recurse(root, root_context, "", 1)
 
     # 格式化输出
     return (
             f"Directory tree for {root}:\n```\n"
             + "\n".join(tree_lines)
             + "\n```"
-    )
\ No newline at end of file
+    )
+
+
+@async_variant
+@tool("tree", parse_docstring=True, response_format="content_and_artifact")
+def tree_tool(
+        runtime: ToolRuntime,
+        root: str,
+        max_depth: Optional[int] = None,
+        match: Optional[List[str]] = None,
+        ignore: Optional[List[str]] = None,
+):
+    """Displays directory structure as a tree. Recursively lists subdirectories with indentation.
+
+    Entries excluded by default ignore rules or by .gitignore/.ignore files are not shown.
+
+    Args:
+        root: Absolute path to the root directory (relative paths are not allowed).
+        max_depth: Maximum recursion depth (None = unlimited).
+        match: Optional glob patterns to include items (e.g., ["*.md", "src/"]).
+        ignore: Optional glob patterns to exclude items (e.g., ["__pycache__", "*.tmp"]).
+    """
+    content, spill_id = budget_output("tree", _build_tree(root, max_depth, match, ignore))
+    return content, tool_artifact("tree", content, path=root, spill_id=spill_id)
@@ -0,0 +1,384 @@
+import array
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .ignore import DEFAULT_IGNORE_PATTERNS, IGNORE_FILES, IgnoreContext
+from .walk import walk_files
+
+# 索引文件位于项目根目录下的 .code_agent 目录中（该目录在默认忽略规则内）
+INDEX_DIR = ".code_agent"
+INDEX_FILE = "grep_index.db"
+
+# 距上次检查不足该秒数时跳过增量检查；代理自己写入文件后会立即标记索引需要检查
+DEFAULT_MAX_STALENESS = 2.0
+
+# 超过该大小的文件不建立索引，搜索时总是作为候选文件
+MAX_INDEXED_FILE_SIZE = 4 * 1024 * 1024
+
+# 内存中累计的倒排项超过该数量时写出一个段，限制构建索引时的内存占用
+_SEGMENT_FLUSH_POSTINGS = 5_000_000
+
+# 段数量超过该值时合并除最大段以外的所有段
+_MAX_SEGMENTS = 8
+
+# 候选文件少于该数量时停止求交集，剩余的过滤交给匹配验证
+_MIN_CANDIDATES = 16
+
+_THREE_BYTES = re.compile(b"...", re.DOTALL)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    indexed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    segment INTEGER PRIMARY KEY,
+    postings INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram INTEGER NOT NULL,
+    segment INTEGER NOT NULL,
+    ids BLOB NOT NULL,
+    PRIMARY KEY (trigram, segment)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def extract_trigrams(data: bytes) -> Set[int]:
+    """提取数据中所有（ASCII小写化后的）字节trigram，编码为24位整数。"""
+    data = data.lower()
+    # 从三个起始偏移各做一次按3字节切分，合起来即为全部trigram（切分在C中完成）
+    grams = set(_THREE_BYTES.findall(data))
+    grams.update(_THREE_BYTES.findall(data, 1))
+    grams.update(_THREE_BYTES.findall(data, 2))
+    return {int.from_bytes(gram, "big") for gram in grams}
+
+
+def required_literals(pattern: str, regex: bool) -> List[str]:
+    """提取任何匹配都必须包含的字面量片段。
+
+    普通字符串模式直接返回自身；正则模式只分析最外层的连续字面量，
+    遇到分支、可选重复等无法确定的结构时返回空列表（即不能用索引缩小范围）。
+    """
+    if not regex:
+        return [pattern]
+    try:
+        from re import _parser as sre_parse
+    except ImportError:  # Python < 3.11
+        import sre_parse
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    literals = []
+    current = []
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(value))
+            continue
+        if current:
+            literals.append("".join(current))
+            current = []
+        if op is sre_parse.BRANCH:
+            return []
+    if current:
+        literals.append("".join(current))
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+class TrigramIndex:
+    """项目目录的持久化trigram索引。
+
+    索引以SQLite保存，按文件的mtime和大小增量更新。倒排表按段存储：每个段中
+    一个trigram对应一个压缩后的有序文件ID数组；增量更新时变化的文件获得新的
+    ID并写入新段，旧ID随文件记录删除而失效，段数量过多时再合并。
+    """
+
+    def __init__(self, root: str, ignore_patterns: Sequence[str] = DEFAULT_IGNORE_PATTERNS, db_path: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.ignore_patterns = list(ignore_patterns)
+        self.db_path = db_path or os.path.join(self.root, INDEX_DIR, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 内存中的文件表：{路径: (id, mtime_ns, size, indexed)}
+        self._files: Dict[str, Tuple[int, int, int, int]] = {}
+        self._id_to_path: Dict[int, str] = {}
+        self._last_update = 0.0
+        self._building = False
+        self.ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._load_files()
+        return self._conn
+
+    def _load_files(self) -> None:
+        """从数据库重新加载内存中的文件表。"""
+        self._files.clear()
+        self._id_to_path.clear()
+        for file_id, path, mtime_ns, size, indexed in self._conn.execute("SELECT id, path, mtime_ns, size, indexed FROM files"):
+            self._files[path] = (file_id, mtime_ns, size, indexed)
+            self._id_to_path[file_id] = path
+
+    def start_background_build(self) -> None:
+        """在后台线程中构建（或增量更新）索引，完成后 ready 置为True。"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._background_build, name="grep-index", daemon=True).start()
+
+    def _background_build(self) -> None:
+        try:
+            self.update()
+        except Exception:
+            pass  # 索引不可用时grep会退回到全量扫描
+        finally:
+            self._building = False
+
+    def update(self, max_staleness: float = 0.0) -> Dict[str, int]:
+        """按mtime/大小增量更新索引。
+
+        参数：
+            max_staleness: 距上次更新不足该秒数时跳过检查。
+
+        返回：
+            Dict[str, int]: 本次新增/变化、删除的文件数。
+        """
+        with self._lock:
+            if self.ready and self._last_update and time.monotonic() - self._last_update < max_staleness:
+                return {"changed": 0, "removed": 0}
+            conn = self._connect()
+
+            seen = set()
+            changed: List[Tuple[str, os.stat_result]] = []
+            for path in walk_files(self.root, self.ignore_patterns):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                row = self._files.get(path)
+                if row is None or row[1] != st.st_mtime_ns or row[2] != st.st_size:
+                    changed.append((path, st))
+            removed = [path for path in self._files if path not in seen]
+
+            if changed or removed:
+                try:
+                    with conn:
+                        self._remove_files(conn, removed + [path for path, _ in changed if path in self._files])
+                        self._index_files(conn, changed)
+                        self._maybe_compact(conn)
+                except Exception:
+                    # 事务已回滚，内存中的文件表需要与数据库保持一致
+                    self._load_files()
+                    raise
+
+            self._last_update = time.monotonic()
+            self.ready = True
+            return {"changed": len(changed), "removed": len(removed)}
+
+    def mark_stale(self) -> None:
+        """标记索引可能过期，下次 update 时无论 max_staleness 都重新检查"""
+        self._last_update = 0.0
+
+    def covers(self, path: str) -> bool:
+        """目录是否在索引范围内：位于根目录之下，且沿途没有被忽略规则排除的目录"""
+        path = os.path.abspath(path)
+        if path == self.root:
+            return True
+        if not path.startswith(self.root + os.sep):
+            return False
+        context = IgnoreContext.for_directory(self.root, self.ignore_patterns)
+        current = self.root
+        for part in os.path.relpath(path, self.root).split(os.sep):
+            names = [name for name in IGNORE_FILES if os.path.isfile(os.path.join(current, name))]
+            context = context.child(current, names)
+            current = os.path.join(current, part)
+            if context.is_ignored(current, part, True):
+                return False
+        return True
+
+    def _remove_files(self, conn: sqlite3.Connection, paths: Iterable[str]) -> None:
+        dead = 0
+        for path in paths:
+            file_id = self._files.pop(path)[0]
+            self._id_to_path.pop(file_id, None)
+            conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            dead += 1
+        if dead:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('dead_files', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (dead,),
+            )
+
+    def _index_files(self, conn: sqlite3.Connection, files: List[Tuple[str, os.stat_result]]) -> None:
+        postings: Dict[int, array.array] = {}
+        pending = 0
+        for path, st in files:
+            trigrams = None
+            if st.st_size <= MAX_INDEXED_FILE_SIZE:
+                try:
+                    with open(path, "rb") as f:
+                        trigrams = extract_trigrams(f.read())
+                except OSError:
+                    continue
+            cursor = conn.execute(
+                "INSERT INTO files (path, mtime_ns, size, indexed) VALUES (?, ?, ?, ?)",
+                (path, st.st_mtime_ns, st.st_size, int(trigrams is not None)),
+            )
+            file_id = cursor.lastrowid
+            self._files[path] = (file_id, st.st_mtime_ns, st.st_size, int(trigrams is not None))
+            self._id_to_path[file_id] = path
+            if not trigrams:
+                continue
+            # 文件ID单调递增，因此每个数组天然有序
+            for trigram in trigrams:
+                ids = postings.get(trigram)
+                if ids is None:
+                    postings[trigram] = ids = array.array("I")
+                ids.append(file_id)
+            pending += len(trigrams)
+            if pending >= _SEGMENT_FLUSH_POSTINGS:
+                self._write_segment(conn, postings, pending)
+                postings, pending = {}, 0
+        if postings:
+            self._write_segment(conn, postings, pending)
+
+    @staticmethod
+    def _write_segment(conn: sqlite3.Connection, postings: Dict[int, array.array], count: int) -> None:
+        segment = conn.execute("SELECT COALESCE(MAX(segment), 0) + 1 FROM segments").fetchone()[0]
+        conn.execute("INSERT INTO segments (segment, postings) VALUES (?, ?)", (segment, count))
+        conn.executemany(
+            "INSERT INTO postings (trigram, segment, ids) VALUES (?, ?, ?)",
+            ((trigram, segment, zlib.compress(ids.tobytes(), 1)) for trigram, ids in postings.items()),
+        )
+
+    def _maybe_compact(self, conn: sqlite3.Connection) -> None:
+        segments = conn.execute("SELECT segment, postings FROM segments ORDER BY postings DESC").fetchall()
+        dead = conn.execute("SELECT value FROM meta WHERE key = 'dead_files'").fetchone()
+        dead = dead[0] if dead else 0
+        if dead > len(self._files):
+            # 失效的文件ID过多时全量合并，清理倒排表中的无效项
+            self._merge_segments(conn, [segment for segment, _ in segments])
+            conn.execute("DELETE FROM meta WHERE key = 'dead_files'")
+        elif len(segments) > _MAX_SEGMENTS:
+            self._merge_segments(conn, [segment for segment, _ in segments[1:]])
+
+    def _merge_segments(self, conn: sqlite3.Connection, segments: List[int]) -> None:
+        if len(segments) < 2:
+            return
+        placeholders = ",".join("?" * len(segments))
+        target = conn.execute("SELECT MAX(segment) + 1 FROM segments").fetchone()[0]
+        live = self._id_to_path
+        merged_rows = []
+        count = 0
+
+        def _flush(trigram: int, ids: Set[int]) -> None:
+            nonlocal count
+            live_ids = array.array("I", sorted(i for i in ids if i in live))
+            if live_ids:
+                merged_rows.append((trigram, target, zlib.compress(live_ids.tobytes(), 1)))
+                count += len(live_ids)
+
+        # 按trigram顺序流式读取，内存中只保留压缩后的合并结果
+        current_trigram = None
+        current_ids: Set[int] = set()
+        cursor = conn.execute(
+            f"SELECT trigram, ids FROM postings WHERE segment IN ({placeholders}) ORDER BY trigram",
+            segments,
+        )
+        for trigram, blob in cursor:
+            if trigram != current_trigram:
+                if current_trigram is not None:
+                    _flush(current_trigram, current_ids)
+                current_trigram, current_ids = trigram, set()
+            current_ids.update(array.array("I", zlib.decompress(blob)))
+        if current_trigram is not None:
+            _flush(current_trigram, current_ids)
+        conn.execute(f"DELETE FROM postings WHERE segment IN ({placeholders})", segments)
+        conn.execute(f"DELETE FROM segments WHERE segment IN ({placeholders})", segments)
+        conn.execute("INSERT INTO segments (segment, postings) VALUES (?, ?)", (target, count))
+        conn.executemany("INSERT INTO postings (trigram, segment, ids) VALUES (?, ?, ?)", merged_rows)
+
+    def candidates(self, literals: Sequence[str]) -> Optional[Set[str]]:
+        """返回可能包含全部字面量的文件路径。
+
+        参数：
+            literals: 匹配必须包含的字面量片段。
+
+        返回：
+            Optional[Set[str]]: 候选文件集合；无法用索引缩小范围时返回None。
+        """
+        trigrams: Set[int] = set()
+        for literal in literals:
+            trigrams |= extract_trigrams(literal.encode("utf-8"))
+        if not trigrams:
+            return None
+        with self._lock:
+            conn = self._connect()
+            posting_blobs = []
+            for trigram in trigrams:
+                blobs = [blob for (blob,) in conn.execute("SELECT ids FROM postings WHERE trigram = ?", (trigram,))]
+                posting_blobs.append(blobs)
+            # 从最稀有的trigram开始求交集，候选集足够小时提前结束
+            posting_blobs.sort(key=lambda blobs: sum(len(blob) for blob in blobs))
+            result: Optional[Set[int]] = None
+            for blobs in posting_blobs:
+                ids: Set[int] = set()
+                for blob in blobs:
+                    ids.update(array.array("I", zlib.decompress(blob)))
+                result = ids if result is None else result & ids
+                if len(result) < _MIN_CANDIDATES:
+                    break
+            paths = {self._id_to_path[i] for i in result or () if i in self._id_to_path}
+            # 未建立索引的大文件总是候选
+            paths.update(path for path, row in self._files.items() if not row[3])
+            return paths
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_indexes: Dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root: str) -> TrigramIndex:
+    """获取（必要时创建）项目根目录对应的索引实例。"""
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = TrigramIndex(root)
+        return index
+
+
+def mark_indexes_stale() -> None:
+    """文件被修改后调用，使所有索引在下次搜索时重新检查"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.mark_stale()
@@ -0,0 +1,79 @@
+import os
+from typing import Iterator, List, Sequence, Tuple
+
+from .ignore import IgnoreContext
+
+
+def scan_dir(path: str, context: IgnoreContext) -> Tuple[List[os.DirEntry], IgnoreContext]:
+    """列出单个目录下未被忽略的条目。
+
+    基于 os.scandir，目录类型信息直接来自目录项，不会对每个条目额外调用stat。
+    目录中存在 .gitignore/.ignore 时，其规则会加入返回的上下文，
+    供遍历子目录时继续使用。
+
+    参数：
+        path: 目录路径。
+        context: 该目录所在位置的忽略上下文。
+
+    返回：
+        Tuple[List[os.DirEntry], IgnoreContext]: 未被忽略的目录项（未排序），以及该目录的忽略上下文。
+
+    异常：
+        PermissionError: 如果没有权限读取该目录。
+    """
+    with os.scandir(path) as it:
+        entries = list(it)
+    context = context.child(path, [entry.name for entry in entries])
+    kept = [
+        entry for entry in entries
+        if not context.is_ignored(entry.path, entry.name, _is_dir(entry))
+    ]
+    return kept, context
+
+
+def walk_files(
+        root: str,
+        ignore_patterns: Sequence[str],
+        recursive: bool = True,
+        use_ignore_files: bool = True,
+) -> Iterator[str]:
+    """遍历目录下所有未被忽略的文件路径。
+
+    被忽略的目录在下降之前就会被剪枝，因此 .git、node_modules、venv 等
+    目录中的文件永远不会被枚举。不跟随指向目录的符号链接，避免循环。
+    无权限读取的子目录会被静默跳过。
+
+    参数：
+        root: 起始目录。
+        ignore_patterns: 忽略模式列表，语义见 match_patterns。
+        recursive: 是否递归进入子目录。
+        use_ignore_files: 是否遵循 .gitignore/.ignore 文件。
+    """
+    root = os.path.abspath(root)
+    stack = [(root, IgnoreContext.for_directory(root, ignore_patterns, use_ignore_files))]
+    while stack:
+        current, context = stack.pop()
+        try:
+            entries, context = scan_dir(current, context)
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            continue
+        # 排序后逆序压栈，保证输出顺序稳定且与目录结构一致
+        entries.sort(key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, context))
+                elif entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+        if recursive:
+            stack.extend(reversed(subdirs))
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False